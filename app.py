@@ -1,4 +1,9 @@
+from multiprocessing import freeze_support
+
 from src.windows.mains import WindowRoot
 
-# start main window
-window = WindowRoot()
+if __name__ == '__main__':
+    freeze_support()  # tag writing uses worker processes, needed for the exe build.
+
+    # start main window
+    window = WindowRoot()
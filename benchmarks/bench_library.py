@@ -0,0 +1,175 @@
+"""
+Library benchmark. Generates synthetic libraries (see library_generator.py) and times directory sizes, iteration,
+backup, cleaner rules and tag writing on them. Results are written as json, compared against a baseline it fails when
+anything gets slower than the allowed factor.
+
+Usage:
+    python benchmarks/bench_library.py --sizes 1000 10000 100000 --output library.json
+    python benchmarks/bench_library.py --baseline library.json --skip tags
+"""
+from argparse import ArgumentParser
+from contextlib import redirect_stdout
+from io import StringIO
+from json import loads as json_loads, dumps as json_dumps
+from os import path
+from platform import python_version, platform
+from shutil import rmtree
+from sys import exit as sys_exit, path as sys_path
+from tempfile import mkdtemp
+from time import perf_counter
+from typing import Callable
+
+ROOT_DIR = path.dirname(path.dirname(path.abspath(__file__)))
+sys_path.insert(0, ROOT_DIR)
+
+from library_generator import generate_library  # noqa: E402
+from src.components.copier import CopyEngine  # noqa: E402
+from src.components.filesystem_helper import (  # noqa: E402
+    get_dir_size, iterate, write_music_metadata, MusicFileMetadata
+)
+from src.components.processors import ComponentProcessorBackupper, ComponentProcessorCleaner  # noqa: E402
+from src.components.scanner import scan, ScanNode  # noqa: E402
+from src.components.size_cache import get_dir_size_cache  # noqa: E402
+from src.providers.config import config  # noqa: E402
+
+BENCHMARKS = ('scan', 'dir_size', 'iterate', 'backup', 'cleaner', 'tags')
+
+
+def timed(function: Callable, repeat: int = 1) -> float:
+    """
+    Time function, its output is swallowed.
+    @param function: to time.
+    @param repeat: amount of runs, the best one is taken.
+    @return: best time in seconds.
+    """
+    best = None
+    for _ in range(repeat):
+        with redirect_stdout(StringIO()):
+            started = perf_counter()
+            function()
+            elapsed = perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best
+
+
+def walk(directory: str) -> int:
+    """
+    Walk whole tree with iterate().
+    @param directory: to walk.
+    @return: amount of files.
+    """
+    files = []
+    iterate(directory, walk, files.append)
+    return len(files)
+
+
+def albums_of(tree: ScanNode) -> list[ScanNode]:
+    """
+    @param tree: scanned library.
+    @return: album directories (second level of the library).
+    """
+    return [album for artist in tree.directories.values() for album in artist.directories.values()]
+
+
+def bench_size(size: int, work_dir: str, skip: list[str], repeat: int) -> dict[str, float]:
+    """
+    Run all benchmarks on a library of the size.
+    @param size: amount of files in the library.
+    @param work_dir: directory to generate the library and its backup in.
+    @param skip: benchmarks not to run.
+    @param repeat: amount of runs of benchmarks that do not change files.
+    @return: dictionary of measurement name to seconds.
+    """
+    library_dir, backup_dir = path.join(work_dir, 'library'), path.join(work_dir, 'backup')
+    results = {'generate': timed(lambda: generate_library(library_dir, size))}
+    tree = scan(library_dir)
+
+    if 'scan' not in skip:
+        results['scan'] = timed(lambda: scan(library_dir), repeat)
+
+    if 'dir_size' not in skip:
+        def cold_size() -> None:
+            get_dir_size_cache().invalidate(library_dir)
+            get_dir_size(library_dir)
+
+        results['get_dir_size_cold'] = timed(cold_size)
+        results['get_dir_size_warm'] = timed(lambda: get_dir_size(library_dir), repeat)
+        results['get_dir_size_tree'] = timed(lambda: get_dir_size(library_dir, tree=tree), repeat)
+
+    if 'iterate' not in skip:
+        results['iterate'] = timed(lambda: walk(library_dir), repeat)
+
+    if 'backup' not in skip:
+        backupper = ComponentProcessorBackupper(CopyEngine(), library_dir, backup_dir)
+        results['backup_full'] = timed(backupper.process_library)
+        results['backup_unchanged'] = timed(backupper.process_library, repeat)
+
+    if 'cleaner' not in skip:
+        cleaner = ComponentProcessorCleaner()
+        folders = [name for album in albums_of(tree) for name in album.directories]
+        results['cleaner_rules'] = timed(
+            lambda: [cleaner.auto_delete(folder) or cleaner.auto_skip(folder) for folder in folders], repeat
+        )
+        results['cleaner_plan'] = timed(lambda: cleaner.plan(library_dir, tree=tree), repeat)
+
+    if 'tags' not in skip:
+        def write_all() -> None:
+            for album in albums_of(tree):
+                write_music_metadata(MusicFileMetadata(album.path, 'Artist', album.name, '2000', 'Rock'))
+
+        results['tags_write'] = timed(write_all)
+        results['tags_unchanged'] = timed(write_all)
+
+    return results
+
+
+def main() -> int:
+    parser = ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000], help='files in the library')
+    parser.add_argument('--skip', nargs='*', default=[], choices=BENCHMARKS, help='benchmarks not to run')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--work-dir', help='directory to generate libraries in, temporary one if not given')
+    parser.add_argument('--output', help='json file to write results to')
+    parser.add_argument('--baseline', help='json file with results to compare with')
+    parser.add_argument('--max-factor', type=float, default=1.5, help='allowed slowdown compared with baseline')
+    arguments = parser.parse_args()
+
+    baseline = {}
+    if arguments.baseline:
+        with open(arguments.baseline) as json_file:
+            baseline = json_loads(json_file.read())['results']
+
+    # results must not depend on directory sizes cached by earlier runs, nor include refreshes of the library index.
+    get_dir_size_cache().file_path = None
+    config.set('library_index_refresh', False, write_to_file=False)
+
+    results, failed = {}, False
+    for size in arguments.sizes:
+        work_dir = mkdtemp(prefix='library_%d_' % size, dir=arguments.work_dir)
+        try:
+            results[str(size)] = bench_size(size, work_dir, arguments.skip, arguments.repeat)
+        finally:
+            rmtree(work_dir, ignore_errors=True)
+
+        for name, seconds in results[str(size)].items():
+            status = 'ok'
+            previous = baseline.get(str(size), {}).get(name)
+            if previous is not None and name != 'generate' and seconds > previous * arguments.max_factor:
+                status, failed = 'slower than baseline %.1f ms' % (previous * 1000), True
+
+            print('%-8d %-20s %10.1f ms %12.0f files/s  %s' % (
+                size, name, seconds * 1000, size / max(seconds, 1e-9), status
+            ))
+
+    if arguments.output:
+        with open(arguments.output, 'w') as outfile:
+            outfile.write(json_dumps({
+                'benchmark': 'library', 'python': python_version(), 'platform': platform(), 'results': results
+            }, indent=4))
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys_exit(main())
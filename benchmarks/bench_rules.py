@@ -0,0 +1,121 @@
+"""
+Cleaner rules benchmark. Times the compiled RuleSet against the plain prefix loops the cleaner used before, with
+growing amounts of rules, and checks both give the same answers. Compiled set should stay flat as rules are added.
+
+Usage:
+    python benchmarks/bench_rules.py --rules 10 100 1000 --names 20000
+    python benchmarks/bench_rules.py --output rules.json
+"""
+from argparse import ArgumentParser
+from json import dumps as json_dumps
+from os import path
+from platform import python_version, platform
+from random import Random
+from sys import exit as sys_exit, path as sys_path
+from time import perf_counter
+from typing import Callable
+
+ROOT_DIR = path.dirname(path.dirname(path.abspath(__file__)))
+sys_path.insert(0, ROOT_DIR)
+
+from src.components.rules import RuleSet  # noqa: E402
+
+WORDS = ('Covers', 'Scans', 'Artwork', 'Disc', 'CD', 'Booklet', 'Extras', 'Bonus', 'Live', 'Demo', 'Album', 'Inlay')
+
+
+def generate_names(amount: int, seed: int) -> list[str]:
+    """
+    @param amount: of folder names.
+    @param seed: of the random generator.
+    @return: folder names like those found in albums.
+    """
+    random = Random(seed)
+    return ['%s %d' % (random.choice(WORDS), random.randint(0, 999)) for _ in range(amount)]
+
+
+def generate_prefixes(amount: int, seed: int) -> list[str]:
+    """
+    @param amount: of rules.
+    @param seed: of the random generator.
+    @return: prefixes, the original rules first.
+    """
+    random = Random(seed)
+    prefixes = ["Covers", "Cover", "Artwork", "Scans"]
+    while len(prefixes) < amount:
+        prefixes.append('%s %d' % (random.choice(WORDS), random.randint(0, 9999)))
+
+    return prefixes[:amount]
+
+
+def loop_matcher(prefixes: list[str]) -> Callable[[str], bool]:
+    """
+    @param prefixes: rules.
+    @return: matcher the way cleaner matched before rules were compiled.
+    """
+    def matches(folder: str) -> bool:
+        for text in prefixes:
+            if folder.lower().startswith(text.lower()):
+                return True
+
+        return False
+
+    return matches
+
+
+def timed(function: Callable, names: list[str], repeat: int) -> tuple[float, list[bool]]:
+    """
+    @param function: matcher to time.
+    @param names: folder names to match.
+    @param repeat: amount of runs, the best one is taken.
+    @return: best time in seconds and answers of the matcher.
+    """
+    best, answers = None, []
+    for _ in range(repeat):
+        started = perf_counter()
+        answers = [function(name) for name in names]
+        elapsed = perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best, answers
+
+
+def main() -> int:
+    parser = ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--rules', type=int, nargs='+', default=[4, 10, 100, 1000], help='amounts of rules')
+    parser.add_argument('--names', type=int, default=20000, help='amount of folder names matched')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help='json file to write results to')
+    arguments = parser.parse_args()
+
+    names = generate_names(arguments.names, 1)
+    results, failed = {}, False
+    for amount in arguments.rules:
+        prefixes = generate_prefixes(amount, 2)
+        started = perf_counter()
+        rule_set = RuleSet(prefixes)
+        compile_seconds = perf_counter() - started
+
+        loop_seconds, expected = timed(loop_matcher(prefixes), names, arguments.repeat)
+        compiled_seconds, answers = timed(rule_set.matches, names, arguments.repeat)
+        status = 'ok'
+        if answers != expected:
+            status, failed = 'answers differ', True
+
+        results[str(amount)] = {'loop': loop_seconds, 'compiled': compiled_seconds, 'compile': compile_seconds}
+        print('%-6d rules  loop %9.1f ms  compiled %7.1f ms  (%5.1fx)  compile %6.1f ms  %s' % (
+            amount, loop_seconds * 1000, compiled_seconds * 1000, loop_seconds / max(compiled_seconds, 1e-9),
+            compile_seconds * 1000, status
+        ))
+
+    if arguments.output:
+        with open(arguments.output, 'w') as outfile:
+            outfile.write(json_dumps({
+                'benchmark': 'rules', 'names': arguments.names, 'python': python_version(), 'platform': platform(),
+                'results': results
+            }, indent=4))
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys_exit(main())
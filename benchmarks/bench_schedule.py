@@ -0,0 +1,108 @@
+"""
+Copy scheduling benchmark. Generates a synthetic library (see library_generator.py) and copies it with every read order
+of IoScheduler, cached pages of the sources are dropped before each run so files are read from the disk. Reports time
+and seek distance of each order against the listing order. Gain shows on spinning and USB drives, SSDs and tmpfs
+barely care about the order.
+
+Usage:
+    python benchmarks/bench_schedule.py --files 5000
+    python benchmarks/bench_schedule.py --work-dir /media/usb/bench --output schedule.json
+"""
+import os
+from argparse import ArgumentParser
+from json import dumps as json_dumps
+from os import path, scandir
+from platform import python_version, platform
+from shutil import rmtree
+from sys import exit as sys_exit, path as sys_path
+from tempfile import mkdtemp
+
+ROOT_DIR = path.dirname(path.dirname(path.abspath(__file__)))
+sys_path.insert(0, ROOT_DIR)
+
+from library_generator import generate_library  # noqa: E402
+from src.components.copier import CopyEngine, CopyJob  # noqa: E402
+from src.components.io_scheduler import IoScheduler, SCHEDULE_ORDERS  # noqa: E402
+
+
+def listed_files(directory: str) -> list[str]:
+    """
+    @param directory: to list.
+    @return: paths of all files, in the order the directories list them.
+    """
+    files = []
+    with scandir(directory) as it:
+        for entry in it:
+            if entry.is_dir(follow_symlinks=False):
+                files.extend(listed_files(entry.path))
+            else:
+                files.append(entry.path)
+
+    return files
+
+
+def drop_cache(files: list[str]) -> None:
+    """
+    @param files: whose cached pages are dropped, where system allows.
+    @return: None.
+    """
+    if not hasattr(os, 'posix_fadvise'):
+        return
+
+    for file_path in files:
+        file_descriptor = os.open(file_path, os.O_RDONLY)
+        try:
+            os.posix_fadvise(file_descriptor, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(file_descriptor)
+
+
+def main() -> int:
+    parser = ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--files', type=int, default=5000, help='files in the library')
+    parser.add_argument('--workers', type=int, help='amount of files copied at the same time')
+    parser.add_argument('--work-dir', help='directory to generate the library in, temporary one if not given')
+    parser.add_argument('--output', help='json file to write results to')
+    arguments = parser.parse_args()
+
+    work_dir = arguments.work_dir or mkdtemp(prefix='bench_schedule_')
+    library_dir = path.join(work_dir, 'library')
+    try:
+        generate_library(library_dir, arguments.files)
+        os.sync()
+        files = listed_files(library_dir)
+
+        results = {}
+        for order in SCHEDULE_ORDERS:
+            copy_dir = path.join(work_dir, 'copy_' + order)
+            jobs = [CopyJob(source, source.replace(library_dir, copy_dir)) for source in files]
+            drop_cache(files)
+
+            engine = CopyEngine(arguments.workers, verify=False, fsync=False, scheduler=IoScheduler(order))
+            report = engine.copy(jobs)
+            rmtree(copy_dir)
+
+            results[order] = {
+                'order': report.order, 'seconds': report.seconds, 'files': report.files,
+                'seek_naive': report.seek_naive, 'seek_scheduled': report.seek_scheduled,
+            }
+            print('%-7s read in %-6s order  %8.2f s  %7.1f files/s  seek distance %5.1f%% of listing order' % (
+                order, report.order, report.seconds, report.files_per_second,
+                100 * report.seek_scheduled / report.seek_naive if report.seek_naive else 100
+            ))
+    finally:
+        if not arguments.work_dir:
+            rmtree(work_dir)
+
+    if arguments.output:
+        with open(arguments.output, 'w') as outfile:
+            outfile.write(json_dumps({
+                'benchmark': 'schedule', 'files': arguments.files, 'python': python_version(), 'platform': platform(),
+                'results': results
+            }, indent=4))
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys_exit(main())
@@ -0,0 +1,98 @@
+"""
+Startup benchmark of the command line. Measures import time of every command (interpreter start excluded) and checks
+that commands do not load the window (tkinter) or modules they do not need. Compared against a baseline, it fails when
+import time grows over the allowed factor.
+
+Usage:
+    python benchmarks/bench_startup.py --output startup.json
+    python benchmarks/bench_startup.py --baseline startup.json
+"""
+from argparse import ArgumentParser
+from json import loads as json_loads, dumps as json_dumps
+from os import path
+from subprocess import run
+from sys import executable, exit as sys_exit
+
+ROOT_DIR = path.dirname(path.dirname(path.abspath(__file__)))
+
+# what every command imports once it runs, and modules it must not import.
+COMMANDS = {
+    'cli': ('', ('tkinter', 'mutagen', 'sqlite3')),
+    'backup': (
+        'from src.components.copier import CopyEngine\n'
+        'from src.components.processors import ComponentProcessorBackupper',
+        ('tkinter', 'mutagen', 'sqlite3')
+    ),
+    'clean': ('from src.components.processors import ComponentProcessorCleaner', ('tkinter', 'mutagen')),
+    'tag': ('from src.components.filesystem_helper import write_music_metadata', ('tkinter',)),
+    'download': ('from src.components.downloader import DownloadQueue', ('tkinter', 'mutagen')),
+    'index': ('from src.components.library_index import LibraryIndex', ('tkinter', 'mutagen')),
+}
+
+MEASURE_SCRIPT = """
+from time import perf_counter
+started = perf_counter()
+import cli
+{imports}
+elapsed = perf_counter() - started
+
+import sys, json
+print(json.dumps([elapsed, sorted(name for name in {forbidden!r} if name in sys.modules)]))
+"""
+
+
+def measure(imports: str, forbidden: tuple, repeat: int) -> tuple[float, list[str]]:
+    """
+    Measure import time in fresh interpreters.
+    @param imports: import statements of the command.
+    @param forbidden: modules that must not be imported.
+    @param repeat: amount of runs, the best one is taken.
+    @return: best import time in seconds and forbidden modules that were imported.
+    """
+    best, loaded = None, []
+    for _ in range(repeat):
+        result = run(
+            [executable, '-c', MEASURE_SCRIPT.format(imports=imports, forbidden=forbidden)],
+            cwd=ROOT_DIR, capture_output=True, text=True, check=True
+        )
+        elapsed, loaded = json_loads(result.stdout.strip().splitlines()[-1])
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best, loaded
+
+
+def main() -> int:
+    parser = ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help='json file to write results to')
+    parser.add_argument('--baseline', help='json file with results to compare with')
+    parser.add_argument('--max-factor', type=float, default=1.5, help='allowed slowdown compared with baseline')
+    arguments = parser.parse_args()
+
+    baseline = {}
+    if arguments.baseline:
+        with open(arguments.baseline) as json_file:
+            baseline = json_loads(json_file.read())['results']
+
+    results, failed = {}, False
+    for command, (imports, forbidden) in COMMANDS.items():
+        seconds, loaded = measure(imports, forbidden, arguments.repeat)
+        results[command] = {'seconds': seconds, 'forbidden_imported': loaded}
+
+        status = 'ok'
+        if loaded:
+            status, failed = 'imports %s' % ', '.join(loaded), True
+        elif command in baseline and seconds > baseline[command]['seconds'] * arguments.max_factor:
+            status, failed = 'slower than baseline %.1f ms' % (baseline[command]['seconds'] * 1000), True
+
+        print('%-10s %8.1f ms  %s' % (command, seconds * 1000, status))
+
+    if arguments.output:
+        with open(arguments.output, 'w') as outfile:
+            outfile.write(json_dumps({'benchmark': 'startup', 'results': results}, indent=4))
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys_exit(main())
@@ -0,0 +1,159 @@
+"""
+Generator of synthetic music libraries for benchmarks. Library looks like a real one: artist folders with album
+folders, albums have m4a tracks (small, but valid files mutagen can read and tag), covers and some have scans or are
+split into CD folders.
+
+Usage:
+    python benchmarks/library_generator.py /tmp/library --files 10000
+"""
+from argparse import ArgumentParser
+from dataclasses import dataclass
+from os import makedirs, path
+from random import Random
+from struct import pack
+
+TRACKS_PER_ALBUM = 12
+ALBUMS_PER_ARTIST = 5
+GENRES = ('Rock', 'Jazz', 'Metal', 'Electronic', 'Folk', 'Classical')
+
+
+@dataclass
+class GeneratedLibrary:
+    """
+    Data class with what was generated.
+    """
+    directory: str
+    files: int = 0
+    music_files: int = 0
+    albums: int = 0
+    artists: int = 0
+    size: int = 0
+
+
+def atom(name: bytes, payload: bytes = b'') -> bytes:
+    """
+    @param name: four letter name of the MP4 atom.
+    @param payload: content of the atom.
+    @return: atom with its size header.
+    """
+    return pack('>I4s', 8 + len(payload), name) + payload
+
+
+def full_atom(name: bytes, payload: bytes, version: int = 0, flags: int = 0) -> bytes:
+    """
+    @param name: four letter name of the MP4 atom.
+    @param payload: content of the atom.
+    @param version: version of the atom.
+    @param flags: flags of the atom.
+    @return: atom with its size, version and flags header.
+    """
+    return atom(name, pack('>I', (version << 24) | flags) + payload)
+
+
+def m4a_bytes(duration: int = 1000, padding: int = 256) -> bytes:
+    """
+    Build minimal m4a file: one sound track without samples and mdat with padding instead of audio.
+    @param duration: duration of the track in milliseconds.
+    @param padding: size of the fake audio data, makes files bigger for copy benchmarks.
+    @return: content of the file.
+    """
+    matrix = pack('>9I', 0x10000, 0, 0, 0, 0x10000, 0, 0, 0, 0x40000000)
+    mvhd = full_atom(
+        b'mvhd', pack('>IIII', 0, 0, 1000, duration) + pack('>IH', 0x10000, 0x100) + b'\0' * 10 + matrix
+        + b'\0' * 24 + pack('>I', 2)
+    )
+    tkhd = full_atom(
+        b'tkhd', pack('>IIIII', 0, 0, 1, 0, duration) + b'\0' * 8 + pack('>HHHH', 0, 0, 0x100, 0) + matrix
+        + pack('>II', 0, 0), flags=7
+    )
+    mdhd = full_atom(b'mdhd', pack('>IIII', 0, 0, 44100, duration * 44) + pack('>HH', 0x55c4, 0))
+    hdlr = full_atom(b'hdlr', pack('>I4s', 0, b'soun') + b'\0' * 12 + b'SoundHandler\0')
+    stbl = atom(
+        b'stbl', full_atom(b'stsd', pack('>I', 0)) + full_atom(b'stts', pack('>I', 0))
+        + full_atom(b'stsc', pack('>I', 0)) + full_atom(b'stsz', pack('>II', 0, 0)) + full_atom(b'stco', pack('>I', 0))
+    )
+    minf = atom(b'minf', full_atom(b'smhd', pack('>HH', 0, 0)) + stbl)
+    trak = atom(b'trak', tkhd + atom(b'mdia', mdhd + hdlr + minf))
+
+    return atom(b'ftyp', b'M4A ' + pack('>I', 0) + b'M4A mp42isom') + atom(b'moov', mvhd + trak) \
+        + atom(b'mdat', b'\0' * padding)
+
+
+def write_file(library: GeneratedLibrary, file_path: str, content: bytes) -> None:
+    """
+    @param library: to count the file in.
+    @param file_path: file to write.
+    @param content: of the file.
+    @return: None.
+    """
+    with open(file_path, 'wb') as outfile:
+        outfile.write(content)
+
+    library.files += 1
+    library.size += len(content)
+
+
+def generate_library(directory: str, files: int, seed: int = 0, padding: int = 256) -> GeneratedLibrary:
+    """
+    Generate library with about the given amount of files (whole albums are always written). Same seed gives the same
+    library.
+    @param directory: to generate library in, created if missing.
+    @param files: amount of files to generate.
+    @param seed: of the random generator.
+    @param padding: size of the fake audio data of every track.
+    @return: what was generated.
+    """
+    random = Random(seed)
+    library = GeneratedLibrary(directory)
+    track = m4a_bytes(padding=padding)
+    cover = bytes(random.getrandbits(8) for _ in range(2048))
+
+    while library.files < files:
+        artist_dir = path.join(directory, 'Artist %05d' % library.artists)
+        library.artists += 1
+
+        for _ in range(ALBUMS_PER_ARTIST):
+            if library.files >= files:
+                break
+
+            album_dir = path.join(artist_dir, 'Album %05d (%d)' % (library.albums, random.randint(1960, 2024)))
+            library.albums += 1
+
+            # every third album is split into discs, every fourth has scans of the booklet.
+            discs = ['CD1', 'CD2'] if library.albums % 3 == 0 else ['']
+            for disc in discs:
+                disc_dir = path.join(album_dir, disc)
+                makedirs(disc_dir, exist_ok=True)
+                for number in range(1, TRACKS_PER_ALBUM // len(discs) + 1):
+                    write_file(library, path.join(disc_dir, '%02d. Track %d.m4a' % (number, number)), track)
+                    library.music_files += 1
+
+            makedirs(path.join(album_dir, 'Covers'), exist_ok=True)
+            write_file(library, path.join(album_dir, 'Covers', 'front.jpg'), cover)
+            write_file(library, path.join(album_dir, 'folder.jpg'), cover)
+
+            if library.albums % 4 == 0:
+                makedirs(path.join(album_dir, 'Scans'), exist_ok=True)
+                for page in range(1, 5):
+                    write_file(library, path.join(album_dir, 'Scans', 'page %d.jpg' % page), cover)
+
+    return library
+
+
+def main() -> None:
+    parser = ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('directory')
+    parser.add_argument('--files', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--padding', type=int, default=256, help='bytes of fake audio data in every track')
+    arguments = parser.parse_args()
+
+    library = generate_library(arguments.directory, arguments.files, arguments.seed, arguments.padding)
+    print('Generated %d files (%d tracks, %d albums, %d artists, %.1f MB) in %s' % (
+        library.files, library.music_files, library.albums, library.artists, library.size / 1_000_000,
+        library.directory
+    ))
+
+
+if __name__ == '__main__':
+    main()
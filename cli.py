@@ -0,0 +1,383 @@
+from __future__ import annotations
+from argparse import ArgumentParser, Namespace
+from sys import exit as sys_exit
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from src.components.copier import CopyEngine
+
+
+# Every command imports what it needs only once it runs, so the command line starts fast and never loads tkinter
+# (meant for cron and systemd jobs, the window is started by app.py).
+
+
+def print_status(snapshot) -> None:
+    """
+    Print progress snapshot on a single status line, rewritten in place.
+    @param snapshot: ProgressSnapshot of the processor.
+    @return: None.
+    """
+    print('\r\033[K' + str(snapshot), end='\n' if snapshot.finished else '', flush=True)
+
+
+def print_profile(session) -> None:
+    """
+    Print where the profile of a processor run was written.
+    @param session: written ProfileSession.
+    @return: None.
+    """
+    print('Profile of %s written to %s' % (session.name, session.directory))
+
+
+def create_copy_engine(arguments: Namespace) -> CopyEngine:
+    """
+    @param arguments: parsed command line arguments of backup or watch.
+    @return: copy engine with workers, read order and bandwidth limit of the arguments, config values for the rest.
+    """
+    from src.components.copier import CopyEngine
+    from src.components.io_scheduler import IoScheduler
+
+    bandwidth_limit = None if arguments.limit is None else int(arguments.limit * 1_000_000)
+    return CopyEngine(arguments.workers, bandwidth_limit=bandwidth_limit, scheduler=IoScheduler(arguments.order))
+
+
+def command_backup(arguments: Namespace) -> int:
+    """
+    Back up every album of the library.
+    @param arguments: parsed command line arguments.
+    @return: exit code.
+    """
+    from src.components.instrumentation import ProgressTracker
+    from src.components.processors import ComponentProcessorBackupper
+
+    backupper = ComponentProcessorBackupper(
+        create_copy_engine(arguments), arguments.source, arguments.target, arguments.snapshots or None,
+        arguments.store or None
+    )
+    albums = backupper.process_library(tracker=ProgressTracker('backup', print_status))
+    print('Backed up %d albums' % albums)
+
+    return 0
+
+
+def command_watch(arguments: Namespace) -> int:
+    """
+    Back up the library, then keep backing up albums as they change, until interrupted.
+    @param arguments: parsed command line arguments.
+    @return: exit code.
+    """
+    from src.components.processors import ComponentProcessorBackupper
+    from src.components.watcher import create_watcher
+
+    backupper = ComponentProcessorBackupper(create_copy_engine(arguments), arguments.source, arguments.target)
+    watcher = None
+    if arguments.poll is not None:
+        watcher = create_watcher(backupper.root_dir, arguments.poll, True, backupper.path_filter)
+
+    print('Watching %s, press Ctrl+C to stop' % backupper.root_dir)
+    try:
+        backupper.watch(watcher=watcher, debounce=arguments.debounce)
+    except KeyboardInterrupt:
+        print('Stopped watching')
+
+    return 0
+
+
+def command_restore(arguments: Namespace) -> int:
+    """
+    Rebuild folder layout of a snapshot of the content-addressed store.
+    @param arguments: parsed command line arguments.
+    @return: exit code.
+    """
+    from src.components.instrumentation import ProgressTracker
+    from src.components.object_store import ObjectStore
+
+    store = ObjectStore(arguments.store)
+    snapshots = store.list_snapshots()
+    if not snapshots:
+        print('No snapshots in %s' % arguments.store)
+        return 1
+
+    snapshot = arguments.snapshot or snapshots[-1]
+    report = store.restore(snapshot, arguments.destination, ProgressTracker('restore', print_status))
+    print('Restored %d files (%.1f MB) of snapshot %s, %d failed' % (
+        report.files, report.bytes_written / 1_000_000, snapshot, len(report.failed)
+    ))
+
+    return 1 if report.failed else 0
+
+
+def command_scrub(arguments: Namespace) -> int:
+    """
+    Check backed up files against their checksums, within the time and byte budget.
+    @param arguments: parsed command line arguments.
+    @return: exit code, 1 if any file failed.
+    """
+    from src.components.instrumentation import ProgressTracker
+    from src.components.scrubber import BackupScrubber
+
+    scrubber = BackupScrubber(arguments.target, arguments.seconds, arguments.bytes)
+    report = scrubber.process(tracker=ProgressTracker('scrub', print_status))
+    print(report)
+    for file_path, reason in sorted(report.failures.items()):
+        print('%s: %s' % (file_path, reason))
+
+    return 1 if report.failures else 0
+
+
+def command_clean(arguments: Namespace) -> int:
+    """
+    Clean up folders of the directory: plan the whole tree, review unknown folders once and delete planned folders.
+    Plan can be written to a file instead and applied later, after it was reviewed in an editor.
+    @param arguments: parsed command line arguments.
+    @return: exit code.
+    """
+    from src.components.clean_plan import CleanPlan
+    from src.components.instrumentation import ProgressTracker
+    from src.components.processors import ComponentProcessorCleaner
+
+    cleaner = ComponentProcessorCleaner()
+    if arguments.apply:
+        plan = CleanPlan.load(arguments.apply)
+    elif arguments.directory:
+        plan = cleaner.plan(arguments.directory, tracker=ProgressTracker('clean', print_status))
+        print(plan)
+        if arguments.plan:
+            plan.save(arguments.plan)
+            print('Plan written to %s, apply it with: clean --apply %s' % (arguments.plan, arguments.plan))
+            return 0
+        if not arguments.no_review:
+            cleaner.review(plan)
+    else:
+        print('Directory to clean or --apply with a plan file is needed')
+        return 2
+
+    unreviewed = len(plan.to_review)
+    report = cleaner.apply(plan, tracker=ProgressTracker('clean', print_status))
+    print(report)
+    for relative, reason in sorted({**report.skipped, **report.failed}.items()):
+        print('%s: %s' % (relative, reason))
+    if unreviewed:
+        print('%d unknown folders were not reviewed and are kept' % unreviewed)
+
+    return 1 if report.failed else 0
+
+
+def command_trash(arguments: Namespace) -> int:
+    """
+    List, restore or purge items of the trash of a directory.
+    @param arguments: parsed command line arguments.
+    @return: exit code.
+    """
+    from datetime import datetime
+    from src.components.trash import Trash
+
+    trash = Trash(arguments.directory)
+    if arguments.restore:
+        print('Restored %s' % trash.restore(arguments.restore))
+        return 0
+
+    if arguments.purge or arguments.empty:
+        futures = trash.purge(trash.entries() if arguments.empty else None)
+        failed = [future.exception() for future in futures if future.exception() is not None]
+        for error in failed:
+            print(error)
+        print('Purged %d items, %d failed' % (len(futures), len(failed)))
+        return 1 if failed else 0
+
+    entries = trash.entries()
+    for entry in entries:
+        print('%s  %8.1f MB  %s  (%s)' % (
+            datetime.fromtimestamp(entry.deleted_at).strftime('%Y-%m-%d %H:%M'), entry.size / 1_000_000, entry.origin,
+            entry.name
+        ))
+    print('%d items, %.1f MB in %s' % (len(entries), sum(entry.size for entry in entries) / 1_000_000, trash.directory))
+
+    return 0
+
+
+def command_tag(arguments: Namespace) -> int:
+    """
+    Write tags to a file or to every music file of a directory.
+    @param arguments: parsed command line arguments.
+    @return: exit code.
+    """
+    from os import path
+    from src.components.filesystem_helper import write_music_metadata, MusicFileMetadata
+    from src.components.instrumentation import ProgressTracker
+    from src.components.library_index import refresh_library_index
+
+    report = write_music_metadata(
+        MusicFileMetadata(arguments.path, arguments.artist, arguments.album, arguments.year, arguments.genre),
+        ProgressTracker('tags', print_status)
+    )
+    for index_report in refresh_library_index(sorted({path.dirname(file_path) for file_path in report.written})):
+        print(index_report)
+
+    return 1 if report.failed else 0
+
+
+def command_index(arguments: Namespace) -> int:
+    """
+    Refresh library index of the directory and answer queries from it.
+    @param arguments: parsed command line arguments.
+    @return: exit code.
+    """
+    from src.components.library_index import LibraryIndex
+
+    index = LibraryIndex(arguments.file)
+    try:
+        if not arguments.no_refresh:
+            print(index.refresh(arguments.library))
+
+        if arguments.since is not None:
+            for file_path in index.changed_since(arguments.since):
+                print('changed  %s' % file_path)
+            for file_path in index.removed_since(arguments.since):
+                print('removed  %s' % file_path)
+        if arguments.album is not None:
+            for track in index.tracks(arguments.artist, arguments.album):
+                print('%s - %s - %s  (%s)' % (track.artist, track.album, track.title, track.file_path))
+        elif arguments.artist is not None:
+            for album in index.albums_by(arguments.artist):
+                print(album)
+
+        print('Last run of %s: %d' % (arguments.library, index.last_run_id(arguments.library)))
+    finally:
+        index.close()
+
+    return 0
+
+
+def command_download(arguments: Namespace) -> int:
+    """
+    Download links, several at the same time, and print their progress on a status line.
+    @param arguments: parsed command line arguments.
+    @return: exit code.
+    """
+    from os import getcwd, path
+    from time import sleep
+    from src.providers.config import config
+    from src.components.downloader import DownloadQueue, build_download_command, JOB_DOWNLOADED_DIR, JOB_FINISHED
+
+    queue = DownloadQueue(
+        arguments.concurrency or int(config.get('yt_downloader_concurrency')),
+        lambda job: build_download_command(job, arguments.command),
+        path.join(getcwd(), 'tmp', 'jobs'), path.join(getcwd(), JOB_DOWNLOADED_DIR)
+    )
+    for link in arguments.links:
+        queue.add(link)
+
+    while not queue.is_finished:
+        for job in queue.poll():
+            print('\n%s %s %s' % (job.link, job.state, job.output_dir or job.last_output))
+        print('\r' + queue.summary(), end='', flush=True)
+        sleep(0.2)
+
+    print()
+    return 0 if all(job.state == JOB_FINISHED for job in queue.jobs) else 1
+
+
+def create_parser() -> ArgumentParser:
+    """
+    @return: parser of command line arguments.
+    """
+    parser = ArgumentParser(description='Soundwave Music Backuper without window.')
+    parser.add_argument('--profile', action='store_true', help='write cProfile stats, memory peak and phase timings')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    backup = commands.add_parser('backup', help='back up every album of the library')
+    backup.add_argument('source', help='library directory')
+    backup.add_argument('target', help='backup directory')
+    backup.add_argument('--workers', type=int, help='amount of files copied at the same time')
+    backup.add_argument('--limit', type=float, help='copy at most LIMIT MB per second')
+    backup.add_argument('--order', choices=('inode', 'extent', 'none'), help='order of the reads')
+    backup.add_argument('--snapshots', action='store_true', help='back up to a new dated snapshot inside target')
+    backup.add_argument('--store', action='store_true', help='back up to content-addressed store in target')
+    backup.set_defaults(function=command_backup)
+
+    watch = commands.add_parser('watch', help='back up the library, then back up albums as they change')
+    watch.add_argument('source', help='library directory')
+    watch.add_argument('target', help='backup directory')
+    watch.add_argument('--workers', type=int, help='amount of files copied at the same time')
+    watch.add_argument('--limit', type=float, help='copy at most LIMIT MB per second')
+    watch.add_argument('--order', choices=('inode', 'extent', 'none'), help='order of the reads')
+    watch.add_argument('--debounce', type=float, help='seconds an album has to be unchanged before it is backed up')
+    watch.add_argument('--poll', type=float, help='scan the library every POLL seconds instead of using inotify')
+    watch.set_defaults(function=command_watch)
+
+    restore = commands.add_parser('restore', help='restore snapshot of content-addressed store')
+    restore.add_argument('store', help='store directory (target of backup --store)')
+    restore.add_argument('destination', help='directory to restore into')
+    restore.add_argument('--snapshot', help='name of the snapshot, the latest one if not given')
+    restore.set_defaults(function=command_restore)
+
+    scrub = commands.add_parser('scrub', help='check backed up files against their checksums, a part per run')
+    scrub.add_argument('target', help='backup directory')
+    scrub.add_argument('--seconds', type=float, help='time budget of the run, 0 for no limit')
+    scrub.add_argument('--bytes', type=int, help='amount of bytes the run may read, 0 for no limit')
+    scrub.set_defaults(function=command_scrub)
+
+    clean = commands.add_parser('clean', help='clean up folders of the directory (its whole tree)')
+    clean.add_argument('directory', nargs='?')
+    clean.add_argument('--plan', metavar='FILE', help='only write the plan to FILE, nothing is deleted')
+    clean.add_argument('--apply', metavar='FILE', help='delete folders planned in FILE')
+    clean.add_argument('--no-review', action='store_true', help='keep unknown folders without asking')
+    clean.set_defaults(function=command_clean)
+
+    trash = commands.add_parser('trash', help='list, restore or purge files deleted by backup and clean up')
+    trash.add_argument('directory', help='cleaned library or backup directory')
+    trash.add_argument('--restore', metavar='NAME', help='move item back to where it was deleted from')
+    trash.add_argument('--purge', action='store_true', help='remove items expired by trash_max_age_days/bytes')
+    trash.add_argument('--empty', action='store_true', help='remove all items')
+    trash.set_defaults(function=command_trash)
+
+    tag = commands.add_parser('tag', help='write tags to a file or every music file of a directory')
+    tag.add_argument('path')
+    tag.add_argument('--artist', required=True)
+    tag.add_argument('--album', required=True)
+    tag.add_argument('--year', default='')
+    tag.add_argument('--genre', default='')
+    tag.set_defaults(function=command_tag)
+
+    index = commands.add_parser('index', help='refresh library index and query it')
+    index.add_argument('library', help='library directory')
+    index.add_argument('--no-refresh', action='store_true', help='only query the index as it is')
+    index.add_argument('--since', type=int, metavar='RUN', help='list tracks changed or removed after run RUN')
+    index.add_argument('--artist', help='list albums of the artist (tracks, with --album)')
+    index.add_argument('--album', help='list tracks of the album')
+    index.add_argument('--file', help='index database, library_index_file of config if not given')
+    index.set_defaults(function=command_index)
+
+    download = commands.add_parser('download', help='download albums with yt-dlp')
+    download.add_argument('links', nargs='+')
+    download.add_argument('--concurrency', type=int, help='amount of downloads running at the same time')
+    download.add_argument('--command', help='command to run instead of yt-dlp, {link} and {working_dir} are replaced')
+    download.set_defaults(function=command_download)
+
+    return parser
+
+
+def main(argv: list[str] = None) -> int:
+    """
+    Run command given on the command line.
+    @param argv: arguments, taken from the command line if not given.
+    @return: exit code.
+    """
+    from src.components.profiling import profile_observers
+
+    arguments = create_parser().parse_args(argv)
+    if arguments.profile:
+        from os import environ
+        from src.providers.constants import PROFILING_ENV_VARIABLE
+
+        environ[PROFILING_ENV_VARIABLE] = '1'
+
+    # profiles are enabled by the flag, environment variable or config, their location is printed in any case.
+    profile_observers.append(print_profile)
+
+    return arguments.function(arguments)
+
+
+if __name__ == '__main__':
+    sys_exit(main())
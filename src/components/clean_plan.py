@@ -0,0 +1,152 @@
+from __future__ import annotations
+from dataclasses import asdict, dataclass, field
+from json import load as json_load, dumps as json_dumps
+from os import replace
+from typing import Iterable
+
+# decisions of the cleaner about a folder.
+CLEAN_DELETE = 'delete'
+CLEAN_SKIP = 'skip'
+CLEAN_REVIEW = 'review'  # unknown folder, kept unless decided otherwise in the review
+
+# folders holding these files directly are albums (or their discs) and are never deleted.
+AUDIO_FILE_EXTENSIONS = ('.m4a', '.mp4', '.m4b', '.mp3', '.flac', '.ogg', '.opus', '.wav', '.aac', '.ape', '.wma')
+
+
+@dataclass
+class CleanPlanEntry:
+    """
+    Data class for a single folder of the clean plan.
+    """
+    relative: str  # path inside the cleaned directory, with '/' separators
+    decision: str
+    reason: str
+    size: int = 0
+    mtime_ns: int = 0  # of the folder when planned, changed folder is not deleted
+
+
+@dataclass
+class CleanPlan:
+    """
+    Data class with decisions of the cleaner for the whole tree of a directory. Plan is written as indented json, so it
+    can be reviewed (and decisions changed) in any editor before it is applied.
+    """
+    directory: str  # absolute, so plan can be applied from any working directory
+    entries: list[CleanPlanEntry] = field(default_factory=list)
+
+    @property
+    def to_delete(self) -> list[CleanPlanEntry]:
+        """
+        @return: folders to delete, folders inside another deleted folder are left out.
+        """
+        deleted, entries = [], []
+        for entry in sorted(self.entries, key=entry_order):
+            if entry.decision != CLEAN_DELETE:
+                continue
+            if deleted and entry.relative.startswith(deleted[-1] + '/'):
+                continue
+
+            deleted.append(entry.relative)
+            entries.append(entry)
+
+        return entries
+
+    @property
+    def to_review(self) -> list[CleanPlanEntry]:
+        """
+        @return: unknown folders waiting for the review.
+        """
+        return [entry for entry in self.entries if entry.decision == CLEAN_REVIEW]
+
+    def decide(self, relatives: Iterable[str], decision: str) -> None:
+        """
+        @param relatives: paths of the folders.
+        @param decision: new decision of the folders.
+        @return: None.
+        """
+        relatives = set(relatives)
+        for entry in self.entries:
+            if entry.relative in relatives:
+                entry.decision = decision
+
+    def save(self, file_path: str) -> None:
+        """
+        Write plan, written to temporary file first so interrupted write does not corrupt it.
+        @param file_path: path of the plan file.
+        @return: None.
+        """
+        with open(file_path + '.tmp', 'w') as outfile:
+            outfile.write(json_dumps({
+                'directory': self.directory,
+                'entries': [asdict(entry) for entry in self.entries],
+            }, indent=4))
+
+        replace(file_path + '.tmp', file_path)
+
+    @classmethod
+    def load(cls, file_path: str) -> CleanPlan:
+        """
+        @param file_path: path of the plan file.
+        @return: loaded plan.
+        """
+        with open(file_path) as json_file:
+            data = json_load(json_file)
+
+        return cls(data['directory'], [CleanPlanEntry(**entry) for entry in data['entries']])
+
+    def __str__(self) -> str:
+        counts = {decision: 0 for decision in (CLEAN_DELETE, CLEAN_SKIP, CLEAN_REVIEW)}
+        for entry in self.entries:
+            counts[entry.decision] = counts.get(entry.decision, 0) + 1
+
+        return 'Plan of %s: %d folders to delete (%.1f MB), %d skipped, %d to review' % (
+            self.directory, len(self.to_delete), sum(entry.size for entry in self.to_delete) / 1_000_000,
+            counts[CLEAN_SKIP], counts[CLEAN_REVIEW]
+        )
+
+
+@dataclass
+class CleanReport:
+    """
+    Data class with results of an applied clean plan.
+    """
+    deleted: int = 0
+    bytes: int = 0
+    skipped: dict[str, str] = field(default_factory=dict)  # path inside the directory to the reason
+    failed: dict[str, str] = field(default_factory=dict)
+
+    def __str__(self) -> str:
+        return 'Deleted %d folders (%.1f MB), %d skipped, %d failed' % (
+            self.deleted, self.bytes / 1_000_000, len(self.skipped), len(self.failed)
+        )
+
+
+def entry_order(entry: CleanPlanEntry) -> list[str]:
+    """
+    @param entry: of the plan.
+    @return: sort key putting every folder right before its subfolders.
+    """
+    return entry.relative.split('/')
+
+
+def parse_selection(answer: str, amount: int) -> list[int]:
+    """
+    Parse answer of the review, for example '1 3-5, 8' or 'a' for all.
+    @param answer: numbers (counted from 1) and ranges, separated by spaces or commas.
+    @param amount: amount of numbered items.
+    @return: sorted indexes (counted from 0) of selected items, numbers out of range are ignored.
+    """
+    if answer.strip().lower() == 'a':
+        return list(range(amount))
+
+    selected = set()
+    for part in answer.replace(',', ' ').split():
+        first, _, last = part.partition('-')
+        try:
+            numbers = range(int(first), int(last or first) + 1)
+        except ValueError:
+            continue
+
+        selected.update(number - 1 for number in numbers if 1 <= number <= amount)
+
+    return sorted(selected)
@@ -0,0 +1,471 @@
+from __future__ import annotations
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from errno import EXDEV, ENOSYS, EOPNOTSUPP, EINVAL, ENOTTY, EBADF, EPERM, EIO
+from hashlib import blake2b
+from os import path, makedirs
+from shutil import copystat
+from threading import Lock
+from time import perf_counter, process_time
+from typing import Callable
+
+from src.components.io_scheduler import IoScheduler, SCHEDULE_NONE, TokenBucket
+from src.providers.constants import BACKUP_TEMPORARY_SUFFIX
+from src.providers.config import config
+
+try:
+    from fcntl import ioctl
+except ImportError:  # not available on Windows
+    ioctl = None
+
+FICLONE = 0x40049409  # linux ioctl sharing extents of one file with another (btrfs, xfs)
+BUFFER_SIZE = 1024 * 1024
+
+CHECKSUM_DIGEST_SIZE = 16
+
+# errors meaning that strategy is not supported for given files, rather than the copy itself failing.
+UNSUPPORTED_ERRORS = (EXDEV, ENOSYS, EOPNOTSUPP, EINVAL, ENOTTY, EBADF, EPERM)
+
+
+class CopyStrategyUnsupported(Exception):
+    """
+    Raised when copy strategy can not be used for given pair of files.
+    """
+    pass
+
+
+def hash_range(file_descriptor: int, digest: blake2b, offset: int, count: int) -> None:
+    """
+    Hash part of the file without moving its position. Used right after the kernel copied that part, so it is read from
+    cached pages rather than from the disk.
+    @param file_descriptor: descriptor of file opened for reading.
+    @param digest: updated with the data.
+    @param offset: position of the part.
+    @param count: size of the part.
+    @return: None.
+    """
+    while count > 0:
+        data = os.pread(file_descriptor, min(count, BUFFER_SIZE), offset)
+        if not data:
+            break
+        digest.update(data)
+        offset += len(data)
+        count -= len(data)
+
+
+def copy_reflink(
+        source_fd: int, target_fd: int, size: int, throttle: Callable[[int], float] = None, digest: blake2b = None
+) -> None:
+    """
+    Make target share data blocks with source, nothing is copied until one of the files changes.
+    @param source_fd: descriptor of opened source file.
+    @param target_fd: descriptor of opened (empty) target file.
+    @param size: size of the source.
+    @param throttle: not used, reflink does not move any data.
+    @param digest: updated with the source, which is then read once (clone itself reads nothing).
+    @return: None.
+    """
+    if ioctl is None:
+        raise CopyStrategyUnsupported('reflink')
+
+    ioctl(target_fd, FICLONE, source_fd)
+    if digest is not None:
+        hash_range(source_fd, digest, 0, size)
+
+
+def copy_file_range(
+        source_fd: int, target_fd: int, size: int, throttle: Callable[[int], float] = None, digest: blake2b = None
+) -> None:
+    """
+    Copy inside the kernel with copy_file_range, filesystem may offload copy to the device or share extents.
+    @param source_fd: descriptor of opened source file.
+    @param target_fd: descriptor of opened (empty) target file.
+    @param size: size of the source.
+    @param throttle: called with size of every chunk before it is copied, for the bandwidth limit.
+    @param digest: updated with every chunk right after it is copied.
+    @return: None.
+    """
+    if not hasattr(os, 'copy_file_range'):
+        raise CopyStrategyUnsupported('copy_file_range')
+
+    copied = 0
+    while copied < size:
+        count = size - copied if throttle is None and digest is None else min(size - copied, BUFFER_SIZE)
+        if throttle is not None:
+            throttle(count)
+        sent = os.copy_file_range(source_fd, target_fd, count)
+        if sent == 0:
+            break
+        if digest is not None:
+            hash_range(source_fd, digest, copied, sent)
+        copied += sent
+
+    if copied == 0 and size:
+        raise CopyStrategyUnsupported('copy_file_range')  # some filesystems report success without copying.
+
+
+def copy_sendfile(
+        source_fd: int, target_fd: int, size: int, throttle: Callable[[int], float] = None, digest: blake2b = None
+) -> None:
+    """
+    Copy inside the kernel with sendfile, bytes do not pass through python buffers.
+    @param source_fd: descriptor of opened source file.
+    @param target_fd: descriptor of opened (empty) target file.
+    @param size: size of the source.
+    @param throttle: called with size of every chunk before it is copied, for the bandwidth limit.
+    @param digest: updated with every chunk right after it is copied.
+    @return: None.
+    """
+    if not hasattr(os, 'sendfile'):
+        raise CopyStrategyUnsupported('sendfile')
+
+    copied = 0
+    while copied < size:
+        count = size - copied if throttle is None and digest is None else min(size - copied, BUFFER_SIZE)
+        if throttle is not None:
+            throttle(count)
+        sent = os.sendfile(target_fd, source_fd, copied, count)
+        if sent == 0:
+            break
+        if digest is not None:
+            hash_range(source_fd, digest, copied, sent)
+        copied += sent
+
+
+def copy_buffered(
+        source_fd: int, target_fd: int, size: int, throttle: Callable[[int], float] = None, digest: blake2b = None
+) -> None:
+    """
+    Copy through a single large buffer, works everywhere.
+    @param source_fd: descriptor of opened source file.
+    @param target_fd: descriptor of opened (empty) target file.
+    @param size: size of the source.
+    @param throttle: called with size of every chunk before it is copied, for the bandwidth limit.
+    @param digest: updated with the bytes on their way through the buffer.
+    @return: None.
+    """
+    buffer = bytearray(BUFFER_SIZE)
+    view = memoryview(buffer)
+    with open(source_fd, 'rb', buffering=0, closefd=False) as source, \
+            open(target_fd, 'wb', buffering=0, closefd=False) as target:
+        while read := source.readinto(buffer):
+            if throttle is not None:
+                throttle(read)
+            if digest is not None:
+                digest.update(view[:read])
+            written = 0
+            while written < read:
+                written += target.write(view[written:read])
+
+
+def file_checksum(file_descriptor: int, drop_cache: bool = True) -> str:
+    """
+    Hash the whole file. Its cached pages are dropped first (where system allows), so data is read from the disk rather
+    than from memory that still holds what was just written.
+    @param file_descriptor: descriptor of file opened for reading.
+    @param drop_cache: drop cached pages first, off when file is about to be read again.
+    @return: checksum of the file.
+    """
+    if drop_cache and hasattr(os, 'posix_fadvise'):
+        os.posix_fadvise(file_descriptor, 0, 0, os.POSIX_FADV_DONTNEED)
+
+    digest = blake2b(digest_size=CHECKSUM_DIGEST_SIZE)
+    buffer = bytearray(BUFFER_SIZE)
+    view = memoryview(buffer)
+    os.lseek(file_descriptor, 0, os.SEEK_SET)
+    with open(file_descriptor, 'rb', buffering=0, closefd=False) as source:
+        while read := source.readinto(buffer):
+            digest.update(view[:read])
+
+    return digest.hexdigest()
+
+
+# strategies in order of preference, first supported one is used.
+COPY_STRATEGIES = {
+    'reflink': copy_reflink,
+    'copy_file_range': copy_file_range,
+    'sendfile': copy_sendfile,
+    'buffered': copy_buffered,
+}
+
+
+@dataclass
+class CopyJob:
+    """
+    Data class for a single file copy.
+    """
+    source: str
+    target: str
+    group: str = ''  # album directory the file belongs to.
+    checksum: str = ''  # checksum of the copied data, set once copy is verified.
+    size: int = 0  # of the source, with inode it is stat'ed by the scheduler if not known
+    inode: int = 0
+
+
+@dataclass
+class CopyReport:
+    """
+    Data class with results of the copy run.
+    """
+    files: int = 0
+    bytes: int = 0
+    seconds: float = 0
+    failed: dict[str, str] = field(default_factory=dict)  # source path to the reason
+    strategies: dict[str, int] = field(default_factory=dict)  # strategy name to amount of files copied with it
+    cpu_seconds: float = 0
+    order: str = ''  # order the files were read in, see IoScheduler
+    seek_naive: int = 0  # seek distance of the order files were given in
+    seek_scheduled: int = 0  # seek distance of the order files were read in
+    large_files: int = 0  # files copied in the batch of large files
+    throttled_seconds: float = 0  # waited for the bandwidth limit, summed over all threads
+
+    @property
+    def reorder_gain(self) -> float:
+        """
+        @return: part of the seek distance saved by reordering the reads, 0.5 for half of it.
+        """
+        return 1 - self.seek_scheduled / self.seek_naive if self.seek_naive else 0
+
+    @property
+    def cpu_seconds_per_gb(self) -> float:
+        """
+        @return: CPU time (of the whole process) spent per GB copied, used to compare copy strategies.
+        """
+        return self.cpu_seconds / (self.bytes / 1_000_000_000) if self.bytes else 0
+
+    @property
+    def bytes_per_second(self) -> float:
+        """
+        @return: aggregate throughput of the run.
+        """
+        return self.bytes / self.seconds if self.seconds else 0
+
+    @property
+    def files_per_second(self) -> float:
+        """
+        @return: amount of files copied per second.
+        """
+        return self.files / self.seconds if self.seconds else 0
+
+    def __str__(self) -> str:
+        text = 'Copied %d files (%.1f MB) in %.2fs, %.1f MB/s, %.1f files/s, %.2f CPU s/GB %s, %d failed' % (
+            self.files, self.bytes / 1_000_000, self.seconds, self.bytes_per_second / 1_000_000,
+            self.files_per_second, self.cpu_seconds_per_gb, self.strategies, len(self.failed)
+        )
+        if self.seek_naive and self.order != SCHEDULE_NONE:
+            text += ', read in %s order with %.0f%% less seeking' % (self.order, self.reorder_gain * 100)
+        if self.throttled_seconds:
+            text += ', throttled for %.1fs' % self.throttled_seconds
+
+        return text
+
+
+def temporary_path(target: str) -> str:
+    """
+    @param target: path of the copy.
+    @return: hidden temporary path, in the same directory, that copy is written to before it is renamed.
+    """
+    directory, name = path.split(target)
+    return path.join(directory, '.%s%s' % (name, BACKUP_TEMPORARY_SUFFIX))
+
+
+def is_temporary_path(file_path: str) -> bool:
+    """
+    @param file_path: path or name of the file.
+    @return: True if file is an unfinished copy.
+    """
+    name = path.basename(file_path)
+    return name.startswith('.') and name.endswith(BACKUP_TEMPORARY_SUFFIX)
+
+
+def path_checksum(file_path: str, drop_cache: bool = True) -> str:
+    """
+    @param file_path: file to hash.
+    @param drop_cache: drop cached pages first, off when file is about to be read again.
+    @return: checksum of the file.
+    """
+    file_descriptor = os.open(file_path, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+    try:
+        return file_checksum(file_descriptor, drop_cache)
+    finally:
+        os.close(file_descriptor)
+
+
+class CopyEngine:
+    """
+    Copies files on a bounded thread pool. Most of the time of copying many small files goes to opening and closing
+    them, so several copies in flight keep disk (or USB link) busy. Target directories are created once, then files are
+    handed to the pool in the order of the scheduler (see IoScheduler): small files first, large files after them on
+    fewer threads. Optional bandwidth limit (TokenBucket) is shared by all the threads, so a running backup does not
+    take the whole disk.
+
+    Each file is copied with the first strategy that works for it: reflink, copy_file_range, sendfile and finally
+    buffered copy. Strategy that failed for a pair of filesystems is not tried again for that pair.
+
+    Verified copies use the same strategies, the source is hashed while it is copied: buffered copy hashes its buffer,
+    copy_file_range and sendfile copy in chunks and hash each chunk right after the kernel copied it (from cached pages,
+    not from the disk again), reflink reads the source once as the clone itself reads nothing. Written target is
+    flushed, its cached pages are dropped and it is read back from the disk, copy with a different checksum fails. So
+    verification costs a read of every copy (and of the source for reflink), plus the chunking of kernel copies.
+    """
+    workers: int
+    strategies: list[str]
+    fsync: bool
+    verify: bool
+    scheduler: IoScheduler
+    large_workers: int
+    bandwidth: TokenBucket | None
+
+    def __init__(
+            self, workers: int = None, strategy: str = None, fsync: bool = None, verify: bool = None,
+            bandwidth_limit: int = None, scheduler: IoScheduler = None
+    ):
+        """
+        @param workers: amount of threads copying at the same time, taken from config if not given.
+        @param strategy: 'auto' or name of the strategy from COPY_STRATEGIES to force, taken from config if not given.
+        @param fsync: flush every copy to the disk before it gets its final name, taken from config if not given.
+        @param verify: hash and verify every copy, taken from config if not given.
+        @param bandwidth_limit: bytes copied per second, taken from config if not given, 0 for no limit.
+        @param scheduler: orders the reads, created from config if not given.
+        """
+        self.workers = max(1, int(workers or config.get('backup_copy_workers')))
+        self.large_workers = max(1, min(self.workers, int(config.get('backup_large_file_workers'))))
+        self.scheduler = scheduler or IoScheduler()
+        bandwidth_limit = int(config.get('backup_bandwidth_limit') if bandwidth_limit is None else bandwidth_limit)
+        self.bandwidth = TokenBucket(bandwidth_limit) if bandwidth_limit > 0 else None
+        self.fsync = bool(config.get('backup_copy_fsync') if fsync is None else fsync)
+        self.verify = bool(config.get('backup_copy_verify') if verify is None else verify)
+
+        strategy = strategy or config.get('backup_copy_strategy')
+        if strategy != 'auto' and strategy not in COPY_STRATEGIES:
+            raise ValueError('%s is not auto or one of %s' % (strategy, ', '.join(COPY_STRATEGIES)))
+        self.strategies = list(COPY_STRATEGIES) if strategy == 'auto' else [strategy]
+        self.__unsupported = set()
+
+    def copy(self, jobs: list[CopyJob], on_copied: Callable[[CopyJob, int], None] = None) -> CopyReport:
+        """
+        Copy all the files, failure of one file does not stop the others.
+        @param jobs: files to copy.
+        @param on_copied: called (on the copying thread) with every copied file and its size.
+        @return: report with totals, throughput and failed files.
+        """
+        schedule = self.scheduler.schedule(jobs)
+        report = CopyReport(
+            order=schedule.order, seek_naive=schedule.seek_naive, seek_scheduled=schedule.seek_scheduled,
+            large_files=len(schedule.large)
+        )
+        lock = Lock()
+        started = perf_counter()
+        started_cpu = process_time()
+        waited = self.bandwidth.waited if self.bandwidth is not None else 0
+
+        def run(job: CopyJob) -> None:
+            # futures of the pool are not checked, so every error has to end up in the report, otherwise the file
+            # would count as neither copied nor failed.
+            try:
+                copied, strategy, job.checksum = self.copy_file(job.source, job.target)
+                with lock:
+                    report.files += 1
+                    report.bytes += copied
+                    report.strategies[strategy] = report.strategies.get(strategy, 0) + 1
+
+                if on_copied is not None:
+                    on_copied(job, copied)
+            except Exception as e:
+                with lock:
+                    report.failed[job.source] = str(e) if isinstance(e, OSError) else '%s: %s' % (type(e).__name__, e)
+
+        for directory in {path.dirname(job.target) for job in jobs}:
+            makedirs(directory, exist_ok=True)
+
+        # pool takes jobs in the order they were submitted, so reads start in the scheduled order.
+        for batch, workers in ((schedule.small, self.workers), (schedule.large, self.large_workers)):
+            if not batch:
+                continue
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='copy') as executor:
+                for job in batch:
+                    executor.submit(run, job)
+
+        report.seconds = perf_counter() - started
+        report.cpu_seconds = process_time() - started_cpu
+        if self.bandwidth is not None:
+            report.throttled_seconds = self.bandwidth.waited - waited
+        return report
+
+    def copy_file(self, source: str, target: str) -> tuple[int, str, str]:
+        """
+        Copy single file together with its modification time. Data is written to temporary file next to the target,
+        which is renamed to the target only once complete, so interrupted copy never leaves half-written target.
+        @param source: file to copy.
+        @param target: path of the copy, its directory should exist.
+        @return: amount of bytes copied, name of the strategy used and checksum (empty if copy is not verified).
+        """
+        temporary = temporary_path(target)
+        try:
+            source_fd = os.open(source, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+            try:
+                source_stat = os.fstat(source_fd)
+                target_fd = os.open(
+                    temporary, os.O_RDWR | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0), 0o666
+                )
+                try:
+                    devices = (source_stat.st_dev, os.fstat(target_fd).st_dev)
+                    strategy, checksum = self.__copy_data(source_fd, target_fd, source_stat.st_size, devices)
+
+                    if self.fsync or self.verify:
+                        os.fsync(target_fd)
+                    # pages are clean once flushed, so they can be dropped and the copy is read from the disk.
+                    if self.verify and file_checksum(target_fd, drop_cache=True) != checksum:
+                        raise OSError(EIO, 'Copy does not match the source checksum', target)
+                finally:
+                    os.close(target_fd)
+            finally:
+                os.close(source_fd)
+
+            copystat(source, temporary)
+            os.replace(temporary, target)
+        except Exception:
+            if path.lexists(temporary):
+                os.unlink(temporary)
+            raise
+
+        return source_stat.st_size, strategy, checksum
+
+    @property
+    def __throttle(self) -> Callable[[int], float] | None:
+        """
+        @return: function taking copied chunks from the bandwidth limit, None without limit.
+        """
+        return self.bandwidth.consume if self.bandwidth is not None else None
+
+    def __copy_data(self, source_fd: int, target_fd: int, size: int, devices: tuple[int, int]) -> tuple[str, str]:
+        """
+        Copy data using first supported strategy, hashing it when copies are verified.
+        @param source_fd: descriptor of opened source file.
+        @param target_fd: descriptor of opened (empty) target file.
+        @param size: size of the source.
+        @param devices: devices of source and target, support of strategy depends on them.
+        @return: name of the strategy used and checksum of the source (empty if copy is not verified).
+        """
+        for name in self.strategies:
+            if (devices, name) in self.__unsupported and name != self.strategies[-1]:
+                continue
+
+            digest = blake2b(digest_size=CHECKSUM_DIGEST_SIZE) if self.verify else None
+            try:
+                COPY_STRATEGIES[name](source_fd, target_fd, size, self.__throttle, digest)
+                return name, digest.hexdigest() if digest is not None else ''
+            except CopyStrategyUnsupported:
+                pass
+            except OSError as e:
+                if e.errno not in UNSUPPORTED_ERRORS or name == self.strategies[-1]:
+                    raise
+
+            # start over with the next strategy.
+            self.__unsupported.add((devices, name))
+            os.ftruncate(target_fd, 0)
+            os.lseek(source_fd, 0, os.SEEK_SET)
+            os.lseek(target_fd, 0, os.SEEK_SET)
+
+        raise OSError('No copy strategy from %s could copy the file' % self.strategies)
@@ -0,0 +1,388 @@
+from __future__ import annotations
+import os
+from dataclasses import dataclass
+from json import load as json_load
+from os import path, makedirs
+from queue import Queue, Empty
+from re import compile
+from shutil import move, rmtree
+from signal import SIGTERM
+from subprocess import Popen, PIPE, STDOUT, run as subprocess_run, DEVNULL
+from threading import Thread
+from typing import Callable
+from uuid import uuid4
+
+from src.providers.config import config
+
+# matches lines like "[download]  45.3% of ~10.00MiB at  1.23MiB/s ETA 00:05"
+PROGRESS_PATTERN = compile(
+    r'\[download\]\s+(?P<percent>[\d.]+)%\s+of\s+~?\s*(?P<total>\S+)'
+    r'(?:\s+at\s+(?P<speed>.+?))?(?:\s+ETA\s+(?P<eta>\S+))?\s*$'
+)
+
+# events put to the queue of the process.
+EVENT_OUTPUT = 'output'
+EVENT_PROGRESS = 'progress'
+EVENT_COMPLETE = 'complete'
+
+
+@dataclass
+class DownloadProgress:
+    """
+    Data class for progress parsed from yt-dlp output.
+    """
+    percent: float
+    total: str = ''
+    speed: str = ''
+    eta: str = ''
+
+    def __str__(self) -> str:
+        return '%.1f%% of %s at %s, ETA %s' % (self.percent, self.total, self.speed or '-', self.eta or '-')
+
+
+def parse_progress(line: str) -> DownloadProgress | None:
+    """
+    Parse progress from single line of yt-dlp output.
+    @param line: line of output.
+    @return: progress or None if line is not about progress.
+    """
+    found = PROGRESS_PATTERN.search(line)
+    if found is None:
+        return None
+
+    return DownloadProgress(
+        float(found.group('percent')), found.group('total'), (found.group('speed') or '').strip(),
+        found.group('eta') or ''
+    )
+
+
+class DownloadProcess:
+    """
+    Runs download command (yt-dlp or anything that prints the same output) on a worker thread, so the window stays
+    responsive. Output is not handed to callbacks, but put to the events queue as (event, value) tuples, window has
+    to read them from its own thread (Tk is not thread safe).
+    """
+    command: str | list[str]
+    cwd: str | None
+    events: Queue
+    return_code: int | None
+    cancelled: bool
+
+    def __init__(self, command: str | list[str], cwd: str = None, events: Queue = None):
+        """
+        @param command: string is run through the shell, list is run as is.
+        @param cwd: working directory of the command.
+        @param events: queue to put events to, new one is created if not given.
+        """
+        self.command = command
+        self.cwd = cwd
+        self.events = events if events is not None else Queue()
+        self.return_code = None
+        self.cancelled = False
+        self.__process = None
+        self.__thread = None
+
+    @property
+    def is_running(self) -> bool:
+        """
+        @return: True if command was started and did not finish yet.
+        """
+        return self.__thread is not None and self.__thread.is_alive()
+
+    def start(self) -> DownloadProcess:
+        """
+        Start the command on worker thread.
+        @return: self.
+        """
+        self.__thread = Thread(target=self.__run, name='download', daemon=True)
+        self.__thread.start()
+
+        return self
+
+    def wait(self, timeout: float = None) -> int | None:
+        """
+        Wait for the command to finish.
+        @param timeout: seconds to wait, forever if not given.
+        @return: return code of the command, None if it is still running.
+        """
+        if self.__thread is not None:
+            self.__thread.join(timeout)
+
+        return self.return_code
+
+    def cancel(self) -> None:
+        """
+        Stop the command together with processes it started.
+        @return: None.
+        """
+        self.cancelled = True
+        process = self.__process
+        if process is None or process.poll() is not None:
+            return
+
+        if os.name == 'nt':
+            subprocess_run(['taskkill', '/T', '/F', '/PID', str(process.pid)], stdout=DEVNULL, stderr=DEVNULL)
+        else:
+            os.killpg(process.pid, SIGTERM)
+
+    def __run(self) -> None:
+        """
+        Run the command and read its output until it finishes. Universal newlines turn carriage returns yt-dlp uses for
+        progress into separate lines.
+        @return: None.
+        """
+        try:
+            self.__process = Popen(
+                self.command, shell=isinstance(self.command, str), cwd=self.cwd, stdout=PIPE, stderr=STDOUT,
+                stdin=DEVNULL, text=True, bufsize=1, errors='replace', start_new_session=os.name != 'nt'
+            )
+        except OSError as e:
+            self.events.put((EVENT_OUTPUT, str(e)))
+            self.return_code = -1
+            self.events.put((EVENT_COMPLETE, self.return_code))
+            return
+
+        if self.cancelled:  # cancelled while process was starting.
+            self.cancel()
+
+        for line in self.__process.stdout:
+            line = line.rstrip()
+            if not line:
+                continue
+
+            progress = parse_progress(line)
+            self.events.put((EVENT_PROGRESS, progress) if progress else (EVENT_OUTPUT, line))
+
+        self.return_code = self.__process.wait()
+        self.events.put((EVENT_COMPLETE, self.return_code))
+
+
+# states of the download job.
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_FINISHED = 'finished'
+JOB_FAILED = 'failed'
+JOB_CANCELLED = 'cancelled'
+
+# where the default yt-dlp command writes files and their info, inside working directory of the job.
+JOB_DOWNLOADED_DIR = path.join('downloaded_music', 'working')
+JOB_INFO_FILE = path.join('tmp', 'processing.info.json')
+
+
+@dataclass
+class DownloadJob:
+    """
+    Data class for a single download in the queue. Each job has its own working directory, so jobs running at the same
+    time do not overwrite each other's files.
+    """
+    id: str
+    link: str
+    working_dir: str
+    state: str = JOB_QUEUED
+    progress: DownloadProgress | None = None
+    return_code: int | None = None
+    last_output: str = ''
+    process: DownloadProcess | None = None
+    info: dict | None = None  # info json of the finished download, read before working directory is removed
+    output_dir: str = ''  # downloaded files of the finished job, once moved out of the working directory
+
+    def __str__(self) -> str:
+        return '%s %s: %s' % (self.id, self.state, self.progress if self.state == JOB_RUNNING else self.last_output)
+
+
+def build_download_command(job: DownloadJob, command: str | list[str] = None) -> str | list[str]:
+    """
+    Generate a system command for yt downloader from config, or from the given template.
+    @param job: download job to generate command for.
+    @param command: template to use instead of yt-dlp command from config, {link} and {working_dir} are replaced with
+    values of the job.
+    @return: command to run, string is run through the shell.
+    """
+    if command is not None:
+        if isinstance(command, str):
+            return command.format(link=job.link, working_dir=job.working_dir)
+        return [part.format(link=job.link, working_dir=job.working_dir) for part in command]
+
+    chapter_format = _job_template("yt_downloader_chapter_format_start") + config.get("yt_downloader_chapter_format")
+    system_command_main = _job_template("yt_downloader_dpl_command_start").format(
+        link=job.link, working_dir=job.working_dir
+    )
+    system_command_configurable = config.get("yt_downloader_dpl_command").format(
+        chapter_format=chapter_format.replace('{working_dir}', job.working_dir)
+    )
+
+    # progress is printed on new lines, otherwise it is only redrawn in terminal.
+    return system_command_main + ' ' + system_command_configurable + ' --newline'
+
+
+def _job_template(name: str) -> str:
+    """
+    Get template of command part that has to contain working directory of the job. Config files written by older
+    versions do not have it, for those default template is used, so jobs do not write into the same directory.
+    @param name: config key of the template.
+    @return: template.
+    """
+    template = config.get(name)
+    if '{working_dir}' not in template:
+        template = config.get_default(name)
+
+    return template
+
+
+class DownloadQueue:
+    """
+    Queue of downloads, running up to concurrency jobs at the same time. Queue does not have its own thread, poll() has
+    to be called regularly (from the window loop), it reads output of running jobs and starts queued ones.
+
+    Working directory of a job is removed once the job ends: downloaded files of a finished job are moved to their own
+    directory inside output_dir first, failed and cancelled jobs leave nothing behind.
+    """
+    concurrency: int
+    command_factory: Callable[[DownloadJob], str | list[str]]
+    jobs_dir: str
+    output_dir: str
+    jobs: list[DownloadJob]
+
+    def __init__(
+            self, concurrency: int, command_factory: Callable[[DownloadJob], str | list[str]], jobs_dir: str,
+            output_dir: str
+    ):
+        """
+        @param concurrency: maximum amount of jobs running at the same time.
+        @param command_factory: makes command to run for the job.
+        @param jobs_dir: directory in which working directories of jobs are created.
+        @param output_dir: directory downloaded files of finished jobs are moved to, each job into <output_dir>/<id>.
+        """
+        self.concurrency = max(1, concurrency)
+        self.command_factory = command_factory
+        self.jobs_dir = jobs_dir
+        self.output_dir = output_dir
+        self.jobs = []
+
+    @property
+    def is_finished(self) -> bool:
+        """
+        @return: True if there are no queued or running jobs.
+        """
+        return all(job.state not in (JOB_QUEUED, JOB_RUNNING) for job in self.jobs)
+
+    def add(self, link: str) -> DownloadJob:
+        """
+        Add link to the queue.
+        @param link: link to download.
+        @return: created job.
+        """
+        job_id = 'job-%s' % uuid4().hex[:8]
+        job = DownloadJob(job_id, link, path.join(self.jobs_dir, job_id))
+        self.jobs.append(job)
+
+        return job
+
+    def poll(self) -> list[DownloadJob]:
+        """
+        Read output of running jobs and start queued jobs if there is room for them.
+        @return: jobs that finished (in any way) since the last poll.
+        """
+        completed = []
+        for job in self.jobs:
+            if job.state == JOB_RUNNING and self.__read_events(job):
+                completed.append(job)
+
+        running = sum(job.state == JOB_RUNNING for job in self.jobs)
+        for job in self.jobs:
+            if running >= self.concurrency:
+                break
+            if job.state == JOB_QUEUED:
+                self.__start(job)
+                running += 1
+
+        return completed
+
+    def cancel(self, job: DownloadJob = None) -> None:
+        """
+        Cancel one job or all queued and running jobs.
+        @param job: to cancel, all if not given.
+        @return: None.
+        """
+        for current in ([job] if job is not None else self.jobs):
+            if current.state == JOB_QUEUED:
+                current.state = JOB_CANCELLED
+            elif current.state == JOB_RUNNING:
+                current.process.cancel()
+
+    def summary(self) -> str:
+        """
+        @return: amount of jobs in each state.
+        """
+        states = [JOB_RUNNING, JOB_QUEUED, JOB_FINISHED, JOB_FAILED, JOB_CANCELLED]
+        return ', '.join(
+            '%d %s' % (count, state) for state in states if (count := sum(job.state == state for job in self.jobs))
+        )
+
+    def __start(self, job: DownloadJob) -> None:
+        """
+        Create working directory of the job and start its command.
+        @param job: to start.
+        @return: None.
+        """
+        makedirs(job.working_dir, exist_ok=True)
+        job.state = JOB_RUNNING
+        job.process = DownloadProcess(self.command_factory(job)).start()
+
+    def __read_events(self, job: DownloadJob) -> bool:
+        """
+        Read all events of the running job.
+        @param job: to read events of.
+        @return: True if job finished.
+        """
+        while True:
+            try:
+                event, value = job.process.events.get_nowait()
+            except Empty:
+                return False
+
+            if event == EVENT_PROGRESS:
+                job.progress = value
+            elif event == EVENT_OUTPUT:
+                job.last_output = value
+            elif event == EVENT_COMPLETE:
+                job.return_code = value
+                if job.process.cancelled:
+                    job.state = JOB_CANCELLED
+                else:
+                    job.state = JOB_FINISHED if value == 0 else JOB_FAILED
+                self.__finish(job)
+                return True
+
+    def __finish(self, job: DownloadJob) -> None:
+        """
+        Keep info and downloaded files of finished job and remove its working directory. Job whose files can not be
+        moved fails and keeps its working directory, so nothing downloaded is lost. Job that exited without writing its
+        info or its files fails too, there is nothing to confirm metadata for.
+        @param job: job that just ended.
+        @return: None.
+        """
+        if job.state == JOB_FINISHED:
+            try:
+                with open(path.join(job.working_dir, JOB_INFO_FILE)) as json_file:
+                    job.info = json_load(json_file)
+            except (OSError, ValueError):
+                job.info = None
+
+            downloaded = path.join(job.working_dir, JOB_DOWNLOADED_DIR)
+            if path.isdir(downloaded):
+                try:
+                    makedirs(self.output_dir, exist_ok=True)
+                    move(downloaded, path.join(self.output_dir, job.id))
+                except OSError as e:
+                    job.state, job.last_output = JOB_FAILED, 'Downloaded files were not moved: %s' % e
+                    return
+                job.output_dir = path.join(self.output_dir, job.id)
+
+            if not job.output_dir:
+                job.state, job.last_output = JOB_FAILED, 'No files were downloaded'
+            elif not isinstance(job.info, dict):
+                job.state = JOB_FAILED
+                job.last_output = 'Info of the download was not written, files are kept in %s' % job.output_dir
+
+        rmtree(job.working_dir, ignore_errors=True)
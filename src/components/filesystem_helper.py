@@ -1,12 +1,20 @@
 from dataclasses import dataclass
-from os import path, unlink, listdir, scandir
-from shutil import rmtree
-from mutagen.mp4 import MP4
+from os import path, scandir
+from re import sub
+
+from src.components.path_filter import PathFilter
+from src.components.scanner import ScanNode
+from src.components.instrumentation import ProgressTracker
+from src.components.size_cache import get_dir_size_cache, invalidate_dir_size
+from src.components.trash import delete_now
+from src.components.tag_writer import write_tags, TagBatchReport, TAG_TITLE, TAG_ALBUM, TAG_ARTIST, TAG_YEAR, TAG_GENRE
+
+MUSIC_FILE_EXTENSIONS = ('.m4a', '.mp4', '.m4b')
 
 
 def delete(delete_path: str, silent: bool = False) -> None:
     """
-    Delete folder of file from system.
+    Delete folder of file from system right away, see Trash for undoable deletion.
     @param delete_path: folder of file to delete.
     @param silent: whatever print (and therefore sent to console) about this deletion.
     @return: None.
@@ -15,10 +23,7 @@ def delete(delete_path: str, silent: bool = False) -> None:
         print('Deleting %s' % delete_path)
 
     try:
-        if path.isfile(delete_path) or path.islink(delete_path):
-            unlink(delete_path)
-        elif path.isdir(delete_path):
-            rmtree(delete_path)
+        delete_now(delete_path)
     except Exception as e:
         print('Failed to delete %s. Reason: %s' % (delete_path, e))
 
@@ -31,29 +36,27 @@ def iterate(directory, folder_function, file_function) -> None:
     @param file_function: callback to file.
     @return: None.
     """
-    for folder in listdir(directory):
-        sub_directory = path.join(directory, folder)
-        if path.isdir(sub_directory):
-            folder_function(sub_directory)
-        elif path.isfile(sub_directory):
-            file_function(sub_directory)
+    with scandir(directory) as it:
+        for entry in it:
+            if entry.is_dir():
+                folder_function(entry.path)
+            elif entry.is_file():
+                file_function(entry.path)
 
 
-def get_dir_size(directory: str = '.', total: float = 0) -> float:
+def get_dir_size(directory: str = '.', total: float = 0, tree: ScanNode = None) -> float:
     """
     Get the size of the directory.
     @param directory: path to directory to get size.
     @param total: starting total size.
+    @param tree: already scanned tree of the directory, size is taken from directory size cache (with scan filters of
+    the directory) if not given.
     @return: total of directory (and possible other, depending on if total passed).
     """
-    with scandir(directory) as it:
-        for entry in it:
-            if entry.is_file():
-                total += entry.stat().st_size
-            elif entry.is_dir():
-                total += get_dir_size(entry.path)
+    if tree is not None:
+        return total + tree.size
 
-    return total
+    return total + get_dir_size_cache().get_size(directory, PathFilter.for_root(directory))
 
 
 @dataclass
@@ -67,33 +70,50 @@ class MusicFileMetadata:
     album: str
     year: str
     genre: str
+    title: str = ''
 
 
-def write_music_metadata(metadata: MusicFileMetadata) -> None:
+def write_music_metadata(metadata: MusicFileMetadata, tracker: ProgressTracker = None) -> TagBatchReport:
     """
-    Write music metadata to directory or specific file.
+    Write music metadata to directory or specific file. Files that already have the metadata are not rewritten.
     @param metadata: data container.
-    @return: None.
+    @param tracker: progress tracker of the tag writing.
+    @return: report of the tag writing.
     """
     if path.isdir(metadata.file_path):
-        for track in listdir(metadata.file_path):
-            metadata.file_path = metadata.file_path + track
-            __write_music_file_metadata(metadata)
+        with scandir(metadata.file_path) as it:
+            files = sorted(
+                entry.path for entry in it if entry.is_file() and entry.name.lower().endswith(MUSIC_FILE_EXTENSIONS)
+            )
     else:
-        __write_music_file_metadata(metadata)
+        files = [metadata.file_path]
+
+    report = write_tags({file_path: music_file_tags(metadata, file_path) for file_path in files}, tracker=tracker)
+    print(report)
+
+    # tags are written in place, that does not change directory modification time.
+    for directory in {path.dirname(file_path) for file_path in report.written}:
+        invalidate_dir_size(directory)
 
+    return report
 
-def __write_music_file_metadata(metadata: MusicFileMetadata) -> None:
+
+def music_file_tags(metadata: MusicFileMetadata, file_path: str) -> dict[str, list]:
     """
-    Write music metadata to specific file.
+    Make tags for specific file, title is taken from the file name (without the track number prefix).
     @param metadata: data container.
-    @return: None.
+    @param file_path: file to make tags for.
+    @return: dictionary of atom name to its values.
     """
-    file = open(metadata.file_path, 'r+b')
-
-    tags = MP4(file).tags
-    tags['\xa9nam'] = 'name'  # track title
-    tags['\xa9alb'] = metadata.album  # album
-    tags['\xa9ART'] = metadata.artist  # artist
-    tags['\xa9day'] = metadata.year  # year
-    tags.save(file)
+    title = sub(r'^\d+\.\s*', '', path.splitext(path.basename(file_path))[0])
+
+    tags = {
+        TAG_TITLE: [title],
+        TAG_ALBUM: [metadata.album],
+        TAG_ARTIST: [metadata.artist],
+        TAG_YEAR: [metadata.year],
+    }
+    if metadata.genre:
+        tags[TAG_GENRE] = [metadata.genre]
+
+    return tags
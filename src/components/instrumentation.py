@@ -0,0 +1,198 @@
+from __future__ import annotations
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from threading import Lock
+from time import perf_counter
+from typing import Callable, Iterator
+
+# called with every created tracker, profiling uses it to collect phase timings of profiled runs.
+tracker_observers: list[Callable[[ProgressTracker], None]] = []
+
+
+@dataclass
+class ProgressSnapshot:
+    """
+    Data class with progress of a processor at one moment. Rendered as progress bar by the window and as status line by
+    the command line (str of the snapshot).
+    """
+    processor: str
+    phase: str
+    files_done: int
+    files_total: int
+    bytes_done: int
+    bytes_total: int
+    elapsed: float
+    files_per_second: float
+    bytes_per_second: float
+    eta_seconds: float | None
+    current_item: str
+    phase_timings: dict[str, float] = field(default_factory=dict)
+    finished: bool = False
+
+    @property
+    def percent(self) -> float:
+        """
+        @return: progress in percent, by bytes if their total is known, otherwise by files.
+        """
+        if self.bytes_total:
+            return min(100.0, self.bytes_done * 100 / self.bytes_total)
+        if self.files_total:
+            return min(100.0, self.files_done * 100 / self.files_total)
+
+        return 100.0 if self.finished else 0.0
+
+    def __str__(self) -> str:
+        parts = ['%s [%s]' % (self.processor, self.phase), '%d/%d files' % (self.files_done, self.files_total)]
+        if self.bytes_total:
+            parts.append('%.1f/%.1f MB' % (self.bytes_done / 1_000_000, self.bytes_total / 1_000_000))
+            parts.append('%.1f MB/s' % (self.bytes_per_second / 1_000_000))
+        parts.append('%.1f files/s' % self.files_per_second)
+        if self.eta_seconds is not None and not self.finished:
+            parts.append('ETA %d:%02d' % divmod(int(self.eta_seconds), 60))
+        if self.current_item:
+            parts.append(self.current_item)
+
+        return ', '.join(parts)
+
+
+class ProgressTracker:
+    """
+    Common instrumentation of processors. Processor reports phases, totals and every finished item, tracker calculates
+    rates and ETA and hands snapshots to the listener, at most once per interval (phase changes and finish are always
+    reported). Safe to use from several threads.
+    """
+    processor: str
+    listener: Callable[[ProgressSnapshot], None] | None
+    interval: float
+    phase_timings: dict[str, float]
+
+    def __init__(self, processor: str, listener: Callable[[ProgressSnapshot], None] = None, interval: float = 0.2):
+        """
+        @param processor: name of the processor, shown in snapshots.
+        @param listener: called with every snapshot.
+        @param interval: minimum seconds between snapshots.
+        """
+        self.processor = processor
+        self.listener = listener
+        self.interval = interval
+        self.phase_timings = {}
+
+        self.__lock = Lock()
+        self.__phase = ''
+        self.__item = ''
+        self.__files_done = self.__files_total = self.__bytes_done = self.__bytes_total = 0
+        self.__started = perf_counter()
+        self.__work_started = None
+        self.__last_emit = 0.0
+        self.__finished = False
+
+        for observer in list(tracker_observers):
+            observer(self)
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """
+        Mark a phase of the processor, its duration is added to phase timings.
+        @param name: of the phase.
+        @return: context manager.
+        """
+        with self.__lock:
+            previous, self.__phase = self.__phase, name
+        self.__emit(force=True)
+
+        started = perf_counter()
+        try:
+            yield
+        finally:
+            with self.__lock:
+                self.phase_timings[name] = self.phase_timings.get(name, 0.0) + perf_counter() - started
+                self.__phase = previous
+
+    def add_totals(self, files: int = 0, size: int = 0) -> None:
+        """
+        Add to total amount of work, can be called several times as work is discovered.
+        @param files: amount of files (or other items).
+        @param size: amount of bytes.
+        @return: None.
+        """
+        with self.__lock:
+            self.__files_total += files
+            self.__bytes_total += size
+        self.__emit()
+
+    def advance(self, files: int = 1, size: int = 0, item: str = None) -> None:
+        """
+        Report finished work.
+        @param files: amount of files (or other items) finished.
+        @param size: amount of bytes finished.
+        @param item: item that is being processed now.
+        @return: None.
+        """
+        with self.__lock:
+            if self.__work_started is None:
+                self.__work_started = perf_counter()
+            self.__files_done += files
+            self.__bytes_done += size
+            if item is not None:
+                self.__item = item
+        self.__emit()
+
+    def set_item(self, item: str) -> None:
+        """
+        @param item: item that is being processed now.
+        @return: None.
+        """
+        with self.__lock:
+            self.__item = item
+        self.__emit()
+
+    def finish(self) -> ProgressSnapshot:
+        """
+        Mark processor as finished and report the final snapshot.
+        @return: final snapshot.
+        """
+        with self.__lock:
+            self.__finished = True
+            self.__item = ''
+        return self.__emit(force=True)
+
+    def snapshot(self) -> ProgressSnapshot:
+        """
+        @return: current progress.
+        """
+        with self.__lock:
+            now = perf_counter()
+            work_elapsed = now - self.__work_started if self.__work_started is not None else 0.0
+            files_per_second = self.__files_done / work_elapsed if work_elapsed else 0.0
+            bytes_per_second = self.__bytes_done / work_elapsed if work_elapsed else 0.0
+
+            eta = None
+            if self.__bytes_total and bytes_per_second:
+                eta = max(0.0, (self.__bytes_total - self.__bytes_done) / bytes_per_second)
+            elif self.__files_total and files_per_second:
+                eta = max(0.0, (self.__files_total - self.__files_done) / files_per_second)
+
+            return ProgressSnapshot(
+                self.processor, self.__phase or ('done' if self.__finished else ''), self.__files_done,
+                self.__files_total, self.__bytes_done, self.__bytes_total, now - self.__started, files_per_second,
+                bytes_per_second, eta, self.__item, dict(self.phase_timings), self.__finished
+            )
+
+    def __emit(self, force: bool = False) -> ProgressSnapshot | None:
+        """
+        Hand snapshot to the listener, unless the last one was handed less than interval ago.
+        @param force: ignore the interval.
+        @return: snapshot handed to the listener, or None.
+        """
+        now = perf_counter()
+        if self.listener is None and not force:
+            return None
+        if not force and now - self.__last_emit < self.interval:
+            return None
+
+        self.__last_emit = now
+        snapshot = self.snapshot()
+        if self.listener is not None:
+            self.listener(snapshot)
+
+        return snapshot
@@ -0,0 +1,194 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from src.components.copier import CopyJob
+
+import os
+from dataclasses import dataclass, field
+from struct import pack, unpack_from
+from threading import Lock
+from time import monotonic, sleep
+
+from src.providers.config import config
+
+try:
+    from fcntl import ioctl
+except ImportError:  # not available on Windows
+    ioctl = None
+
+# orders of the reads.
+SCHEDULE_NONE = 'none'  # order in which jobs were given, which is the order of the directory listing
+SCHEDULE_INODE = 'inode'  # filesystems allocate data of files created one after another close together
+SCHEDULE_EXTENT = 'extent'  # physical position of the first extent of the file, linux only
+SCHEDULE_ORDERS = (SCHEDULE_NONE, SCHEDULE_INODE, SCHEDULE_EXTENT)
+
+FS_IOC_FIEMAP = 0xC020660B  # linux ioctl mapping logical blocks of a file to physical ones
+FIEMAP_HEADER = '=QQIIII'  # start, length, flags, mapped extents, extent count, reserved
+FIEMAP_EXTENT_SIZE = 56  # logical, physical, length, 2 reserved, flags, 3 reserved
+FIEMAP_EXTENT_UNKNOWN = 0x2  # data is not written out yet, it is read from memory
+
+
+@dataclass
+class IoSchedule:
+    """
+    Data class with copy jobs in the order they are read in.
+    """
+    order: str  # order actually used, extent falls back to inode on filesystems that can not map files
+    small: list[CopyJob] = field(default_factory=list)
+    large: list[CopyJob] = field(default_factory=list)  # copied after the small ones, with fewer workers
+    seek_naive: int = 0  # sum of the jumps between read positions in the order jobs were given
+    seek_scheduled: int = 0  # the same in the scheduled order
+
+
+class IoScheduler:
+    """
+    Orders reads of a copy run. Jobs come in the order of the directory listing, which on a spinning (or USB) drive
+    means seeking back and forth over the disk. Sorted by inode, or by the physical position of the data where linux can
+    tell it (FIEMAP), the drive mostly reads forward.
+
+    Files of at least large_file_bytes are split into a batch of their own that is copied after the small files, with
+    fewer workers, so several long streams do not fight over the disk head while small files still overlap their opens.
+
+    Gain of the reordering is estimated as the seek distance, the sum of jumps between positions of consecutive reads
+    (in inodes or bytes), which is compared with the distance of the original order.
+    """
+    order: str
+    large_file_bytes: int
+
+    def __init__(self, order: str = None, large_file_bytes: int = None):
+        """
+        @param order: one of SCHEDULE_ORDERS, taken from config if not given.
+        @param large_file_bytes: files of this size and bigger are batched separately, taken from config if not given,
+        0 to keep all the files in one batch.
+        """
+        self.order = order or config.get('backup_schedule_order')
+        if self.order not in SCHEDULE_ORDERS:
+            raise ValueError('%s is not one of %s' % (self.order, ', '.join(SCHEDULE_ORDERS)))
+        self.large_file_bytes = int(
+            config.get('backup_large_file_bytes') if large_file_bytes is None else large_file_bytes
+        )
+
+    def schedule(self, jobs: list[CopyJob]) -> IoSchedule:
+        """
+        Jobs without inode are stat'ed first, their size and inode are filled in.
+        @param jobs: files to copy, in the order they were listed.
+        @return: jobs split into batches and ordered.
+        """
+        for job in jobs:
+            if not job.inode:
+                try:
+                    file_stat = os.stat(job.source)
+                    job.size, job.inode = file_stat.st_size, file_stat.st_ino
+                except OSError:
+                    pass  # copy of the file fails and is reported.
+
+        order, positions = self.__positions(jobs)
+        schedule = IoSchedule(order, seek_naive=seek_distance(positions))
+
+        small, large = [], []
+        for index, job in enumerate(jobs):
+            batch = large if self.large_file_bytes and job.size >= self.large_file_bytes else small
+            batch.append((positions[index] is not None, positions[index] or 0, index, job))
+
+        if order != SCHEDULE_NONE:
+            small.sort()
+            large.sort()
+
+        schedule.small = [item[-1] for item in small]
+        schedule.large = [item[-1] for item in large]
+        schedule.seek_scheduled = seek_distance([item[1] if item[0] else None for item in small + large])
+        return schedule
+
+    def __positions(self, jobs: list[CopyJob]) -> tuple[str, list[int | None]]:
+        """
+        @param jobs: files to copy.
+        @return: order used and read position of every job, None for files without data to read from the disk.
+        """
+        if self.order == SCHEDULE_EXTENT:
+            try:
+                return SCHEDULE_EXTENT, [physical_offset(job.source) for job in jobs]
+            except OSError:
+                pass  # not supported by the filesystem, or file is gone.
+
+        return (
+            self.order if self.order == SCHEDULE_NONE else SCHEDULE_INODE,
+            [job.inode if job.size else None for job in jobs]
+        )
+
+
+class TokenBucket:
+    """
+    Bandwidth limit shared by all copying threads. Bucket fills with rate bytes per second up to burst, every chunk
+    takes its size from it and thread waits while the bucket is in debt, so chunks bigger than the burst work too.
+    """
+    rate: float
+    burst: float
+    waited: float  # seconds all the threads spent waiting in total
+
+    def __init__(self, rate: float, burst: float = None):
+        """
+        @param rate: bytes per second.
+        @param burst: bytes that can be taken at once after a pause, one second of rate if not given.
+        """
+        self.rate = float(rate)
+        self.burst = float(burst or rate)
+        self.waited = 0
+        self.__tokens = self.burst
+        self.__updated = monotonic()
+        self.__lock = Lock()
+
+    def consume(self, amount: int) -> float:
+        """
+        Take bytes from the bucket, waiting until they are available.
+        @param amount: bytes about to be copied.
+        @return: seconds waited.
+        """
+        with self.__lock:
+            now = monotonic()
+            self.__tokens = min(self.burst, self.__tokens + (now - self.__updated) * self.rate) - amount
+            self.__updated = now
+            wait = -self.__tokens / self.rate if self.__tokens < 0 else 0
+            self.waited += wait
+
+        if wait:
+            sleep(wait)
+
+        return wait
+
+
+def physical_offset(file_path: str) -> int | None:
+    """
+    @param file_path: file to map.
+    @return: physical position in bytes of the first extent of the file, None if file has no data on the disk.
+    """
+    if ioctl is None:
+        raise OSError('FIEMAP is not available')
+
+    buffer = bytearray(pack(FIEMAP_HEADER, 0, 0xFFFFFFFFFFFFFFFF, 0, 0, 1, 0) + bytes(FIEMAP_EXTENT_SIZE))
+    file_descriptor = os.open(file_path, os.O_RDONLY)
+    try:
+        ioctl(file_descriptor, FS_IOC_FIEMAP, buffer, True)
+    finally:
+        os.close(file_descriptor)
+
+    if not unpack_from('=I', buffer, 20)[0] or unpack_from('=I', buffer, 72)[0] & FIEMAP_EXTENT_UNKNOWN:
+        return None
+
+    return unpack_from('=Q', buffer, 40)[0]
+
+
+def seek_distance(positions: list[int | None]) -> int:
+    """
+    @param positions: read positions in the order they are read, None for files without data.
+    @return: sum of the jumps between consecutive positions.
+    """
+    distance, previous = 0, None
+    for position in positions:
+        if position is None:
+            continue
+        if previous is not None:
+            distance += abs(position - previous)
+        previous = position
+
+    return distance
@@ -0,0 +1,223 @@
+from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from itertools import count
+from queue import Queue, Empty
+from threading import Event
+from traceback import format_exc
+from typing import Callable
+
+from src.providers.config import config
+
+# kinds of job events.
+EVENT_PROGRESS = 'progress'
+EVENT_COMPLETE = 'complete'
+EVENT_ERROR = 'error'
+
+# states of the job.
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_FINISHED = 'finished'
+JOB_FAILED = 'failed'
+JOB_CANCELLED = 'cancelled'
+
+
+class JobCancelled(Exception):
+    """
+    Raised inside of the job function once job was cancelled.
+    """
+    pass
+
+
+class JobContext:
+    """
+    Given to the job function as first argument, used to report progress and check for cancellation.
+    """
+    job: Job
+
+    def __init__(self, job: Job, events: Queue):
+        """
+        @param job: job the context belongs to.
+        @param events: queue of the runner to put events to.
+        """
+        self.job = job
+        self.__events = events
+
+    @property
+    def cancelled(self) -> bool:
+        """
+        @return: True if job was asked to stop.
+        """
+        return self.job.cancel_event.is_set()
+
+    def check_cancelled(self) -> None:
+        """
+        Stops the job (by raising JobCancelled) if it was cancelled, should be called between steps of long jobs.
+        @return: None.
+        """
+        if self.cancelled:
+            raise JobCancelled(self.job.name)
+
+    def progress(self, value: any) -> None:
+        """
+        Report progress of the job, it is handed to on_progress callback on the window thread.
+        @param value: anything describing the progress.
+        @return: None.
+        """
+        self.__events.put((self.job, EVENT_PROGRESS, value))
+
+
+@dataclass
+class Job:
+    """
+    Data class for a job submitted to the runner.
+    """
+    id: int
+    name: str
+    on_progress: Callable[[Job, any], None] | None = None
+    on_complete: Callable[[Job, any], None] | None = None
+    on_error: Callable[[Job, str], None] | None = None
+    state: str = JOB_QUEUED
+    last_progress: any = None
+    traceback: str = ''  # of the error, if job failed
+    cancel_event: Event = field(default_factory=Event, repr=False)
+
+    def cancel(self) -> None:
+        """
+        Ask job to stop, job stops at its next check_cancelled() call (or does not start at all if still queued).
+        @return: None.
+        """
+        self.cancel_event.set()
+
+    def __str__(self) -> str:
+        progress = self.last_progress if self.state == JOB_RUNNING and self.last_progress is not None else self.state
+        return '%s: %s' % (self.name, progress)
+
+
+class JobRunner:
+    """
+    Runs long jobs (backups, cleanups, tag writes) on a worker pool, so Tk mainloop is never blocked. Workers do not
+    touch the window, they put events to a thread-safe queue which is read by poll() on the window thread, that is
+    where all callbacks are called.
+    """
+    jobs: list[Job]
+
+    def __init__(self, workers: int = None):
+        """
+        @param workers: amount of jobs running at the same time, taken from config if not given.
+        """
+        self.jobs = []
+        self.__events = Queue()
+        self.__ids = count(1)
+        self.__executor = ThreadPoolExecutor(
+            max_workers=max(1, int(workers or config.get('job_workers'))), thread_name_prefix='job'
+        )
+
+    @property
+    def active_jobs(self) -> list[Job]:
+        """
+        @return: jobs that are queued or running.
+        """
+        return [job for job in self.jobs if job.state in (JOB_QUEUED, JOB_RUNNING)]
+
+    def submit(
+            self, name: str, function: Callable, *args, on_progress: Callable[[Job, any], None] = None,
+            on_complete: Callable[[Job, any], None] = None, on_error: Callable[[Job, str], None] = None
+    ) -> Job:
+        """
+        Submit a job. Function is called on a worker thread with JobContext as first argument and given arguments after
+        it, its return value is handed to on_complete.
+        @param name: name of the job, shown to the user.
+        @param function: to run.
+        @param args: arguments of the function.
+        @param on_progress: called with progress reported by the job.
+        @param on_complete: called with return value of the function.
+        @param on_error: called with the error if function raised one.
+        @return: submitted job.
+        """
+        job = Job(next(self.__ids), name, on_progress, on_complete, on_error)
+        self.jobs.append(job)
+        self.__executor.submit(self.__run, job, function, args)
+
+        return job
+
+    def poll(self) -> None:
+        """
+        Handle all events put to the queue since the last poll, should be called from the window thread.
+        @return: None.
+        """
+        while True:
+            try:
+                job, kind, value = self.__events.get_nowait()
+            except Empty:
+                break
+
+            if kind == EVENT_PROGRESS:
+                job.last_progress = value
+                callback = job.on_progress
+            elif kind == EVENT_COMPLETE:
+                callback = job.on_complete
+            else:
+                callback = job.on_error
+
+            if callback is not None:
+                callback(job, value)
+
+        # finished jobs are not needed anymore once their events are handled.
+        self.jobs = [job for job in self.jobs if job.state in (JOB_QUEUED, JOB_RUNNING) or not self.__events.empty()]
+
+    def start_polling(self, widget: any, interval: int = 100) -> None:
+        """
+        Poll events on the Tk loop of the widget.
+        @param widget: any Tk widget, usually root window.
+        @param interval: milliseconds between polls.
+        @return: None.
+        """
+        def poll() -> None:
+            self.poll()
+            widget.after(interval, poll)
+
+        widget.after(interval, poll)
+
+    def cancel_all(self) -> None:
+        """
+        Cancel all queued and running jobs.
+        @return: None.
+        """
+        for job in self.active_jobs:
+            job.cancel()
+
+    def shutdown(self, wait: bool = True) -> None:
+        """
+        Cancel all jobs and stop the worker pool.
+        @param wait: wait for running jobs to stop.
+        @return: None.
+        """
+        self.cancel_all()
+        self.__executor.shutdown(wait=wait, cancel_futures=True)
+
+    def __run(self, job: Job, function: Callable, args: tuple) -> None:
+        """
+        Run the job on worker thread and put its result to the events queue.
+        @param job: to run.
+        @param function: of the job.
+        @param args: arguments of the function.
+        @return: None.
+        """
+        if job.cancel_event.is_set():
+            job.state = JOB_CANCELLED
+            return
+
+        job.state = JOB_RUNNING
+        try:
+            result = function(JobContext(job, self.__events), *args)
+        except JobCancelled:
+            job.state = JOB_CANCELLED
+            self.__events.put((job, EVENT_ERROR, 'cancelled'))
+        except Exception as e:
+            job.traceback = format_exc()
+            job.state = JOB_FAILED
+            self.__events.put((job, EVENT_ERROR, str(e)))
+        else:
+            job.state = JOB_FINISHED
+            self.__events.put((job, EVENT_COMPLETE, result))
@@ -0,0 +1,164 @@
+from __future__ import annotations
+from dataclasses import asdict
+from json import loads as json_loads, dumps as json_dumps
+from os import fsync, path, scandir, unlink
+from threading import Lock
+from time import monotonic
+
+from src.providers.constants import BACKUP_JOURNAL_FILE_NAME
+from src.components.manifest import ManifestEntry, to_system_path
+from src.components.copier import is_temporary_path
+
+# kinds of journal records.
+RECORD_PLAN = 'plan'
+RECORD_COPIED = 'copied'
+RECORD_DELETED = 'deleted'
+
+# every record is handed to the system right away, but synced to the disk only this often. Records lost in between
+# (power loss, unplugged drive) only cause files to be copied again.
+SYNC_INTERVAL = 1.0
+
+
+class BackupJournal:
+    """
+    Write-ahead journal of a single backup directory, kept next to its manifest while backup of the directory runs.
+    Plan of the backup is recorded first, then every finished copy (only after the copy got its final name) and
+    deletion. Manifest is saved and journal removed once everything is done, so journal found on the next run means
+    that run was interrupted: completed operations are replayed onto the manifest and only the rest is done again.
+    """
+    directory: str
+    file_path: str
+
+    def __init__(self, directory: str):
+        """
+        @param directory: backup directory that journal belongs to.
+        """
+        self.directory = directory
+        self.file_path = path.join(directory, BACKUP_JOURNAL_FILE_NAME)
+        self.__file = None
+        self.__lock = Lock()
+        self.__last_sync = 0.0
+
+    @property
+    def exists(self) -> bool:
+        """
+        @return: True if journal of an interrupted backup is present.
+        """
+        return path.isfile(self.file_path)
+
+    def replay(self, entries: dict[str, ManifestEntry]) -> int:
+        """
+        Apply completed operations of the interrupted backup to manifest entries. Copy is trusted only if the file is
+        still there with the recorded size, records cut by the interruption are ignored.
+        @param entries: manifest entries, changed in place.
+        @return: amount of replayed operations.
+        """
+        replayed = 0
+        try:
+            with open(self.file_path) as journal_file:
+                lines = journal_file.readlines()
+        except OSError:
+            return replayed
+
+        for line in lines:
+            try:
+                record = json_loads(line)
+            except ValueError:
+                continue  # last record may be half-written.
+
+            if record.get('kind') == RECORD_COPIED:
+                entry = ManifestEntry(**record['entry'])
+                target = to_system_path(self.directory, record['path'])
+                if path.isfile(target) and path.getsize(target) == entry.size:
+                    entries[record['path']] = entry
+                    replayed += 1
+            elif record.get('kind') == RECORD_DELETED:
+                entries.pop(record['path'], None)
+                replayed += 1
+
+        return replayed
+
+    def remove_temporary_files(self) -> int:
+        """
+        Delete unfinished copies left by the interrupted backup.
+        @return: amount of deleted files.
+        """
+        removed = 0
+        directories = [self.directory]
+        while directories:
+            with scandir(directories.pop()) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        directories.append(entry.path)
+                    elif is_temporary_path(entry.name):
+                        unlink(entry.path)
+                        removed += 1
+
+        return removed
+
+    def begin(self, to_copy: list[str], to_delete: list[str]) -> None:
+        """
+        Start journal of a new backup of the directory with its plan.
+        @param to_copy: relative paths to copy.
+        @param to_delete: relative paths to delete.
+        @return: None.
+        """
+        self.__file = open(self.file_path, 'w')
+        self.__write({'kind': RECORD_PLAN, 'copy': to_copy, 'delete': to_delete}, sync=True)
+
+    def record_copied(self, relative: str, entry: ManifestEntry) -> None:
+        """
+        @param relative: path of the file that is fully copied and renamed.
+        @param entry: source values of the file.
+        @return: None.
+        """
+        self.__write({'kind': RECORD_COPIED, 'path': relative, 'entry': asdict(entry)})
+
+    def record_deleted(self, relative: str) -> None:
+        """
+        @param relative: path of the deleted file.
+        @return: None.
+        """
+        self.__write({'kind': RECORD_DELETED, 'path': relative})
+
+    def close(self) -> None:
+        """
+        Flush and close the journal, it stays on the disk.
+        @return: None.
+        """
+        with self.__lock:
+            if self.__file is not None:
+                self.__sync()
+                self.__file.close()
+                self.__file = None
+
+    def remove(self) -> None:
+        """
+        Close and delete journal, called once manifest with all the operations is saved.
+        @return: None.
+        """
+        self.close()
+        if path.isfile(self.file_path):
+            unlink(self.file_path)
+
+    def __write(self, record: dict, sync: bool = False) -> None:
+        """
+        Append record, can be called from copying threads.
+        @param record: to append.
+        @param sync: flush it to the disk right away.
+        @return: None.
+        """
+        with self.__lock:
+            self.__file.write(json_dumps(record) + '\n')
+            self.__file.flush()
+            if sync or monotonic() - self.__last_sync >= SYNC_INTERVAL:
+                self.__sync()
+
+    def __sync(self) -> None:
+        """
+        Flush journal to the disk.
+        @return: None.
+        """
+        self.__file.flush()
+        fsync(self.__file.fileno())
+        self.__last_sync = monotonic()
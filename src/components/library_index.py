@@ -0,0 +1,274 @@
+from __future__ import annotations
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from os import path, sep
+from time import time
+
+from src.providers.config import config
+from src.components.filesystem_helper import MusicFileMetadata, MUSIC_FILE_EXTENSIONS
+from src.components.path_filter import PathFilter
+from src.components.scanner import scan, ScanNode
+from src.components.tag_writer import read_file_tags, TAG_TITLE, TAG_ALBUM, TAG_ARTIST, TAG_YEAR, TAG_GENRE
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    root TEXT NOT NULL,
+    started_at REAL NOT NULL,
+    finished_at REAL
+);
+CREATE TABLE IF NOT EXISTS tracks (
+    path TEXT PRIMARY KEY,
+    directory TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    title TEXT NOT NULL DEFAULT '',
+    artist TEXT NOT NULL DEFAULT '',
+    album TEXT NOT NULL DEFAULT '',
+    year TEXT NOT NULL DEFAULT '',
+    genre TEXT NOT NULL DEFAULT '',
+    changed_run INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS removed_tracks (
+    path TEXT PRIMARY KEY,
+    removed_run INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tracks_artist ON tracks (artist COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS tracks_album ON tracks (album COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS tracks_directory ON tracks (directory);
+CREATE INDEX IF NOT EXISTS tracks_changed_run ON tracks (changed_run);
+"""
+
+
+@dataclass
+class IndexRefreshReport:
+    """
+    Data class with results of the index refresh.
+    """
+    run_id: int
+    added: list[str] = field(default_factory=list)
+    updated: list[str] = field(default_factory=list)
+    removed: list[str] = field(default_factory=list)
+    unchanged: int = 0
+    failed: dict[str, str] = field(default_factory=dict)  # file path to the reason
+
+    def __str__(self) -> str:
+        return 'Index run %d: %d added, %d updated, %d removed, %d unchanged, %d failed' % (
+            self.run_id, len(self.added), len(self.updated), len(self.removed), self.unchanged, len(self.failed)
+        )
+
+
+class LibraryIndex:
+    """
+    SQLite index of tracks in the music library and their tags. Refreshed incrementally: tags are read only from files
+    whose size or modification time changed since they were indexed. Every refresh is a run, so it is possible to ask
+    what changed since any previous run.
+    """
+    file_path: str
+    connection: sqlite3.Connection
+
+    def __init__(self, file_path: str = None):
+        """
+        @param file_path: database file, taken from config (relative to config directory) if not given. ':memory:' keeps
+        index in memory.
+        """
+        self.file_path = file_path or config.get_path('library_index_file')
+        self.connection = sqlite3.connect(self.file_path)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.executescript(SCHEMA)
+
+    def close(self) -> None:
+        """
+        Close connection to the database.
+        @return: None.
+        """
+        self.connection.close()
+
+    def refresh(self, root: str, tree: ScanNode = None, workers: int = None) -> IndexRefreshReport:
+        """
+        Bring index of the directory up to date.
+        @param root: library directory to index.
+        @param tree: already scanned tree of the directory, directory is scanned (with its scan filters) if not given.
+        @param workers: amount of threads reading tags, taken from config if not given.
+        @return: report of the refresh.
+        """
+        root = path.normpath(path.abspath(root))
+        tree = tree or scan(root, path_filter=PathFilter.for_root(root))
+
+        run_id = self.connection.execute(
+            'INSERT INTO runs (root, started_at) VALUES (?, ?)', (root, time())
+        ).lastrowid
+        report = IndexRefreshReport(run_id)
+
+        known = {
+            row['path']: (row['size'], row['mtime_ns'])
+            for row in self.connection.execute(
+                "SELECT path, size, mtime_ns FROM tracks WHERE path = ? OR path LIKE ? ESCAPE '\\'",
+                (root, self.__like_prefix(root))
+            )
+        }
+
+        changed = {}
+        for relative, file in tree.walk_files():
+            if not file.name.lower().endswith(MUSIC_FILE_EXTENSIONS):
+                continue
+
+            file_path = path.join(root, relative.replace('/', sep))
+            state = known.pop(file_path, None)
+            if state == (file.size, file.mtime_ns):
+                report.unchanged += 1
+            else:
+                changed[file_path] = (file, state is None)
+
+        with ThreadPoolExecutor(max_workers=max(1, int(workers or config.get('scan_workers')))) as executor:
+            futures = {file_path: executor.submit(read_file_tags, file_path) for file_path in changed}
+
+        with self.connection:
+            for file_path, future in futures.items():
+                file, is_new = changed[file_path]
+                try:
+                    tags = future.result()
+                except Exception as e:
+                    report.failed[file_path] = str(e)  # not stored, so it is read again on the next refresh.
+                    continue
+
+                self.connection.execute(
+                    'INSERT OR REPLACE INTO tracks VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    (
+                        file_path, path.dirname(file_path), file.size, file.mtime_ns,
+                        self.__tag(tags, TAG_TITLE), self.__tag(tags, TAG_ARTIST), self.__tag(tags, TAG_ALBUM),
+                        self.__tag(tags, TAG_YEAR), self.__tag(tags, TAG_GENRE), run_id
+                    )
+                )
+                self.connection.execute('DELETE FROM removed_tracks WHERE path = ?', (file_path,))
+                (report.added if is_new else report.updated).append(file_path)
+
+            for file_path in known:  # whatever is left was not found on disk anymore.
+                self.connection.execute('DELETE FROM tracks WHERE path = ?', (file_path,))
+                self.connection.execute('INSERT OR REPLACE INTO removed_tracks VALUES (?, ?)', (file_path, run_id))
+                report.removed.append(file_path)
+
+            self.connection.execute('UPDATE runs SET finished_at = ? WHERE id = ?', (time(), run_id))
+
+        return report
+
+    def last_run_id(self, root: str = None) -> int:
+        """
+        @param root: library directory, any directory if not given.
+        @return: id of the last finished run, 0 if there was none.
+        """
+        query = 'SELECT MAX(id) FROM runs WHERE finished_at IS NOT NULL'
+        arguments = ()
+        if root is not None:
+            query += ' AND root = ?'
+            arguments = (path.normpath(path.abspath(root)),)
+
+        return self.connection.execute(query, arguments).fetchone()[0] or 0
+
+    def changed_since(self, run_id: int) -> list[str]:
+        """
+        @param run_id: run to compare with.
+        @return: paths of tracks that were added or changed after given run.
+        """
+        rows = self.connection.execute('SELECT path FROM tracks WHERE changed_run > ? ORDER BY path', (run_id,))
+        return [row['path'] for row in rows]
+
+    def removed_since(self, run_id: int) -> list[str]:
+        """
+        @param run_id: run to compare with.
+        @return: paths of tracks that were removed after given run.
+        """
+        rows = self.connection.execute(
+            'SELECT path FROM removed_tracks WHERE removed_run > ? ORDER BY path', (run_id,)
+        )
+        return [row['path'] for row in rows]
+
+    def changed_directories_since(self, run_id: int) -> list[str]:
+        """
+        @param run_id: run to compare with.
+        @return: directories (albums) with tracks added, changed or removed after given run.
+        """
+        directories = {row['directory'] for row in self.connection.execute(
+            'SELECT DISTINCT directory FROM tracks WHERE changed_run > ?', (run_id,)
+        )}
+        directories.update(path.dirname(file_path) for file_path in self.removed_since(run_id))
+
+        return sorted(directories)
+
+    def albums_by(self, artist: str) -> list[str]:
+        """
+        @param artist: name of the artist, case-insensitive.
+        @return: names of all albums of the artist.
+        """
+        rows = self.connection.execute(
+            'SELECT DISTINCT album FROM tracks WHERE artist = ? COLLATE NOCASE ORDER BY album COLLATE NOCASE',
+            (artist,)
+        )
+        return [row['album'] for row in rows]
+
+    def tracks(self, artist: str = None, album: str = None) -> list[MusicFileMetadata]:
+        """
+        Find tracks by artist and/or album, case-insensitive.
+        @param artist: name of the artist, any if not given.
+        @param album: name of the album, any if not given.
+        @return: metadata of found tracks.
+        """
+        query = 'SELECT * FROM tracks WHERE 1'
+        arguments = []
+        if artist is not None:
+            query += ' AND artist = ? COLLATE NOCASE'
+            arguments.append(artist)
+        if album is not None:
+            query += ' AND album = ? COLLATE NOCASE'
+            arguments.append(album)
+
+        return [
+            MusicFileMetadata(row['path'], row['artist'], row['album'], row['year'], row['genre'], row['title'])
+            for row in self.connection.execute(query + ' ORDER BY path', arguments)
+        ]
+
+    def __tag(self, tags: dict[str, list], name: str) -> str:
+        """
+        @param tags: tags read from the file.
+        @param name: atom name.
+        @return: first value of the tag as string, empty if file does not have it.
+        """
+        values = tags.get(name)
+        return str(values[0]) if values else ''
+
+    def __like_prefix(self, directory: str) -> str:
+        """
+        @param directory: directory to match paths inside of.
+        @return: escaped LIKE pattern matching everything inside directory.
+        """
+        escaped = directory.rstrip(sep).replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        return escaped + ('\\\\' if sep == '\\' else sep) + '%'
+
+
+def refresh_library_index(directories: list[ScanNode | str]) -> list[IndexRefreshReport]:
+    """
+    Bring the index of the app up to date after directories were backed up or tagged, if library_index_refresh is on.
+    Every directory is a run of its own. Index that can not be opened or written does not fail the caller, it is
+    refreshed the next time.
+    @param directories: scanned trees (only files changed since the last refresh are read) or paths to scan.
+    @return: reports of the refreshed directories.
+    """
+    if not directories or not config.get('library_index_refresh'):
+        return []
+
+    reports = []
+    try:
+        index = LibraryIndex()
+        try:
+            for directory in directories:
+                if isinstance(directory, ScanNode):
+                    reports.append(index.refresh(directory.path, directory))
+                else:
+                    reports.append(index.refresh(directory))
+        finally:
+            index.close()
+    except (sqlite3.Error, OSError) as e:
+        print('Library index was not refreshed: %s' % e)
+
+    return reports
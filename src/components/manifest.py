@@ -0,0 +1,158 @@
+from __future__ import annotations
+from dataclasses import dataclass, field, asdict
+from json import load as json_load, dumps as json_dumps
+from os import path, replace, sep
+
+from src.providers.constants import BACKUP_MANIFEST_FILE_NAME, BACKUP_JOURNAL_FILE_NAME, SCRUB_STATE_FILE_NAME
+from src.components.path_filter import PathFilter
+from src.components.scanner import scan, ScanNode
+from src.components.copier import is_temporary_path
+
+# FAT32 and exFAT targets store modification time with up to 2 seconds of precision.
+MTIME_TOLERANCE_NS = 2_000_000_000
+
+# files the backup keeps inside backup directories, they are never backed up or compared.
+BOOKKEEPING_FILE_NAMES = (BACKUP_MANIFEST_FILE_NAME, BACKUP_JOURNAL_FILE_NAME, SCRUB_STATE_FILE_NAME)
+
+
+@dataclass
+class ManifestEntry:
+    """
+    Data class for a single file recorded in the backup manifest. Values are taken from the source file.
+    """
+    size: int
+    mtime_ns: int
+    inode: int = 0
+    checksum: str = ''  # checksum of the copy, empty if it was not verified
+
+    def matches(self, other: ManifestEntry, tolerance_ns: int = 0) -> bool:
+        """
+        Check if both entries describe the same file state.
+        @param other: entry to compare with.
+        @param tolerance_ns: allowed difference of modification time in nanoseconds.
+        @return: True if size and modification time are equal (within tolerance), checksum is not compared.
+        """
+        return self.size == other.size and abs(self.mtime_ns - other.mtime_ns) <= tolerance_ns
+
+
+def collect_entries(directory: str, tree: ScanNode = None, path_filter: PathFilter = None) -> dict[str, ManifestEntry]:
+    """
+    Recursively collect manifest entries for every file inside the directory, except backup bookkeeping files and
+    unfinished copies.
+    @param directory: root directory to collect files from.
+    @param tree: already scanned tree of the directory, directory is scanned if not given.
+    @param path_filter: include/exclude patterns of the scan.
+    @return: dictionary of relative path (with '/' separators) to entry.
+    """
+    return {
+        relative: ManifestEntry(file.size, file.mtime_ns, file.inode)
+        for relative, file in (tree or scan(directory, path_filter=path_filter)).walk_files()
+        if relative not in BOOKKEEPING_FILE_NAMES and not is_temporary_path(relative)
+    }
+
+
+def to_system_path(directory: str, relative: str) -> str:
+    """
+    Join manifest relative path to directory using system separators.
+    @param directory: base directory.
+    @param relative: relative path with '/' separators.
+    @return: full system path.
+    """
+    return path.join(directory, relative.replace('/', sep))
+
+
+class BackupManifest:
+    """
+    Persistent list of files (with their size and modification time) that were copied to a backup directory. Stored
+    as json file inside that directory, used to copy only new or changed files on the next backup.
+    """
+    directory: str
+    file_path: str
+    entries: dict[str, ManifestEntry]
+
+    def __init__(self, directory: str):
+        """
+        @param directory: backup directory that manifest belongs to.
+        """
+        self.directory = directory
+        self.file_path = path.join(directory, BACKUP_MANIFEST_FILE_NAME)
+        self.entries = {}
+
+    def load(self) -> bool:
+        """
+        Reads manifest from its json file.
+        @return: True if manifest was read, False if there is no (readable) manifest.
+        """
+        try:
+            with open(self.file_path) as json_file:
+                data = json_load(json_file)
+        except (OSError, ValueError):
+            return False
+
+        self.entries = {relative: ManifestEntry(**values) for relative, values in data.get('files', {}).items()}
+        return True
+
+    def bootstrap(self) -> None:
+        """
+        Builds manifest from files that already are in backup directory, used when backup was made before manifests
+        existed. Copies keep modification time of the source, so those can be compared on the first run.
+        @return: None.
+        """
+        self.entries = collect_entries(self.directory) if path.isdir(self.directory) else {}
+        for entry in self.entries.values():
+            entry.inode = 0  # inode of the copy means nothing for the source.
+
+    def save(self) -> None:
+        """
+        Writes manifest to its json file. Written to temporary file first, so interrupted write does not corrupt it.
+        @return: None.
+        """
+        temporary_path = self.file_path + '.tmp'
+        with open(temporary_path, 'w') as outfile:
+            outfile.write(json_dumps({'files': {relative: asdict(entry) for relative, entry in self.entries.items()}}))
+
+        replace(temporary_path, self.file_path)
+
+    def diff(self, source: dict[str, ManifestEntry], tolerance_ns: int = 0) -> tuple[list[str], list[str]]:
+        """
+        Compares manifest with current state of the source.
+        @param source: entries of the source directory.
+        @param tolerance_ns: allowed difference of modification time in nanoseconds.
+        @return: tuple of relative paths to copy (new or changed) and relative paths to delete (removed from source).
+        """
+        to_copy = [
+            relative for relative, entry in source.items()
+            if relative not in self.entries or not entry.matches(self.entries[relative], tolerance_ns)
+        ]
+        to_delete = [relative for relative in self.entries if relative not in source]
+
+        return to_copy, to_delete
+
+
+@dataclass
+class BackupPlan:
+    """
+    Data class with everything that has to be done to back up one directory.
+    """
+    directory: str
+    copy_dir: str
+    source: dict[str, ManifestEntry]
+    manifest: BackupManifest
+    to_copy: list[str]
+    to_delete: list[str]
+    to_link: list[str] = field(default_factory=list)  # unchanged files hardlinked from the previous snapshot
+    link_dir: str = ''  # same directory in the previous snapshot
+
+    @property
+    def is_empty(self) -> bool:
+        """
+        @return: True if there is nothing to copy, link, delete or update in manifest.
+        """
+        return not self.to_copy and not self.to_link and not self.to_delete and self.source == self.manifest.entries
+
+    @property
+    def copy_size(self) -> int:
+        """
+        @return: amount of bytes to copy.
+        """
+        return sum(self.source[relative].size for relative in self.to_copy)
@@ -0,0 +1,246 @@
+from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from json import load as json_load, dumps as json_dumps
+from os import listdir, makedirs, path, replace, unlink, utime
+from threading import Lock
+
+from src.components.copier import CopyEngine, CopyJob, path_checksum
+from src.components.instrumentation import ProgressTracker
+from src.components.jobs import JobContext
+from src.components.manifest import to_system_path
+from src.components.scanner import ScanNode
+from src.components.snapshots import SNAPSHOT_NAME_FORMAT
+
+OBJECTS_DIR_NAME = 'objects'
+SNAPSHOTS_DIR_NAME = 'snapshots'
+
+
+@dataclass
+class StoreEntry:
+    """
+    Data class for a single file of a store snapshot.
+    """
+    checksum: str  # name of the object holding the content
+    size: int
+    mtime_ns: int
+
+
+@dataclass
+class StoreReport:
+    """
+    Data class with results of backup to (or restore from) the store.
+    """
+    snapshot: str = ''
+    files: int = 0
+    hashed: int = 0  # files read to get their checksum, the rest did not change since the previous snapshot
+    objects_written: int = 0
+    bytes_written: int = 0
+    bytes_deduplicated: int = 0  # bytes of files whose content already was in the store
+    failed: dict[str, str] = field(default_factory=dict)
+
+    def __str__(self) -> str:
+        return 'Snapshot %s: %d files, %d hashed, %d new objects (%.1f MB), %.1f MB deduplicated, %d failed' % (
+            self.snapshot, self.files, self.hashed, self.objects_written, self.bytes_written / 1_000_000,
+            self.bytes_deduplicated / 1_000_000, len(self.failed)
+        )
+
+
+class ObjectStore:
+    """
+    Content-addressed backup store. Content of every file is stored once, as object named by its checksum, so
+    duplicates (compilations, re-rips, same album under two names) take space and copy time only once. Every backup
+    writes a snapshot index with relative path, checksum, size and modification time of every library file, restore
+    rebuilds the folder layout from it.
+
+        <directory>/objects/<first two characters of checksum>/<checksum>
+        <directory>/snapshots/<YYYY-mm-dd_HHMMSS>.json
+
+    Files with the same size and modification time as in the previous snapshot keep their checksum without being read.
+    Objects are written to temporary names and renamed, and index is written last, so interrupted backup leaves only
+    complete objects that the next run finds and skips.
+    """
+    directory: str
+    copy_engine: CopyEngine
+
+    def __init__(self, directory: str, copy_engine: CopyEngine = None):
+        """
+        @param directory: directory of the store.
+        @param copy_engine: engine to copy objects with, new one is created if not given.
+        """
+        self.directory = path.normpath(directory)
+        self.copy_engine = copy_engine or CopyEngine()
+
+    def object_path(self, checksum: str) -> str:
+        """
+        @param checksum: of the content.
+        @return: path of the object.
+        """
+        return path.join(self.directory, OBJECTS_DIR_NAME, checksum[:2], checksum)
+
+    def list_snapshots(self) -> list[str]:
+        """
+        @return: names of the snapshots, oldest first.
+        """
+        snapshots_dir = path.join(self.directory, SNAPSHOTS_DIR_NAME)
+        if not path.isdir(snapshots_dir):
+            return []
+
+        return sorted(name[:-len('.json')] for name in listdir(snapshots_dir) if name.endswith('.json'))
+
+    def load_snapshot(self, name: str) -> dict[str, StoreEntry]:
+        """
+        @param name: of the snapshot.
+        @return: dictionary of relative path (with '/' separators) to its entry.
+        """
+        with open(path.join(self.directory, SNAPSHOTS_DIR_NAME, name + '.json')) as json_file:
+            data = json_load(json_file)
+
+        return {relative: StoreEntry(*values) for relative, values in data['files'].items()}
+
+    def backup(
+            self, root_dir: str, tree: ScanNode, context: JobContext = None, tracker: ProgressTracker = None
+    ) -> StoreReport:
+        """
+        Store every file of the library and write new snapshot index.
+        @param root_dir: library directory.
+        @param tree: scanned library.
+        @param context: context of the job, if run as one.
+        @param tracker: progress tracker.
+        @return: report of the backup.
+        """
+        tracker = tracker or ProgressTracker('store')
+        snapshots = self.list_snapshots()
+        previous = self.load_snapshot(snapshots[-1]) if snapshots else {}
+        report = StoreReport(datetime.now().strftime(SNAPSHOT_NAME_FORMAT))
+
+        files = dict(tree.walk_files())
+        entries, to_hash = {}, []
+        for relative, file in files.items():
+            known = previous.get(relative)
+            if known is not None and known.size == file.size and known.mtime_ns == file.mtime_ns:
+                entries[relative] = known
+            else:
+                to_hash.append(relative)
+
+        lock = Lock()
+        tracker.add_totals(len(to_hash), sum(files[relative].size for relative in to_hash))
+        with tracker.phase('hash'):
+            def hash_file(relative: str) -> str | None:
+                # unreadable (or deleted) file is left out of the snapshot, rest of the library is still stored.
+                try:
+                    checksum = path_checksum(to_system_path(root_dir, relative), drop_cache=False)
+                except OSError as e:
+                    with lock:
+                        report.failed[relative] = str(e)
+                    checksum = None
+                tracker.advance(1, files[relative].size, relative)
+                return checksum
+
+            with ThreadPoolExecutor(max_workers=self.copy_engine.workers) as executor:
+                checksums = dict(zip(to_hash, executor.map(hash_file, to_hash)))
+            for relative, checksum in checksums.items():
+                if checksum is not None:
+                    entries[relative] = StoreEntry(checksum, files[relative].size, files[relative].mtime_ns)
+            report.hashed = len(checksums) - len(report.failed)
+
+        if context is not None:
+            context.check_cancelled()
+
+        # one copy per missing content, duplicates inside the library included.
+        jobs = {}
+        for relative, entry in entries.items():
+            target = self.object_path(entry.checksum)
+            if target in jobs or path.isfile(target):
+                report.bytes_deduplicated += entry.size
+            else:
+                jobs[target] = relative
+
+        changed = {}
+
+        def on_copied(job: CopyJob, size: int) -> None:
+            # file changed since it was hashed, object would not match its name. Unverified copies have no checksum,
+            # their objects are hashed again.
+            if (job.checksum or path_checksum(job.target)) != path.basename(job.target):
+                unlink(job.target)
+                with lock:
+                    changed[job.source] = 'changed while backed up'
+
+        with tracker.phase('store'):
+            copy_report = self.copy_engine.copy([
+                CopyJob(to_system_path(root_dir, relative), target, path.dirname(target))
+                for target, relative in jobs.items()
+            ], on_copied)
+
+        # files whose content is not stored (their duplicates included) are left out of the snapshot, so they are
+        # stored again next time.
+        copy_report.failed.update(changed)
+        missing = {
+            path.basename(target) for target, relative in jobs.items()
+            if to_system_path(root_dir, relative) in copy_report.failed
+        }
+        for relative in [relative for relative, entry in entries.items() if entry.checksum in missing]:
+            report.failed[relative] = copy_report.failed.get(to_system_path(root_dir, relative), 'content not stored')
+            entries.pop(relative)
+
+        report.files = len(entries)
+        report.objects_written = copy_report.files - len(changed)
+        report.bytes_written = copy_report.bytes
+        self.__write_snapshot(report.snapshot, root_dir, entries)
+        tracker.finish()
+
+        return report
+
+    def restore(self, name: str, destination: str, tracker: ProgressTracker = None) -> StoreReport:
+        """
+        Rebuild folder layout of the snapshot.
+        @param name: of the snapshot.
+        @param destination: directory to restore into.
+        @param tracker: progress tracker.
+        @return: report of the restore.
+        """
+        tracker = tracker or ProgressTracker('restore')
+        entries = self.load_snapshot(name)
+        tracker.add_totals(len(entries), sum(entry.size for entry in entries.values()))
+
+        def on_copied(job: CopyJob, size: int) -> None:
+            tracker.advance(1, size, job.target)
+
+        with tracker.phase('restore'):
+            targets = {to_system_path(destination, relative): entry for relative, entry in entries.items()}
+            copy_report = self.copy_engine.copy([
+                CopyJob(self.object_path(entry.checksum), target, path.dirname(target))
+                for target, entry in targets.items()
+            ], on_copied)
+
+        # objects are shared by files with different modification times.
+        for target, entry in targets.items():
+            if path.isfile(target):
+                utime(target, ns=(entry.mtime_ns, entry.mtime_ns))
+
+        tracker.finish()
+        return StoreReport(name, copy_report.files, bytes_written=copy_report.bytes, failed=copy_report.failed)
+
+    def __write_snapshot(self, name: str, root_dir: str, entries: dict[str, StoreEntry]) -> None:
+        """
+        Write snapshot index, written to temporary file first so interrupted write does not corrupt it.
+        @param name: of the snapshot.
+        @param root_dir: library directory the snapshot was taken of.
+        @param entries: files of the snapshot.
+        @return: None.
+        """
+        snapshots_dir = path.join(self.directory, SNAPSHOTS_DIR_NAME)
+        makedirs(snapshots_dir, exist_ok=True)
+
+        file_path = path.join(snapshots_dir, name + '.json')
+        with open(file_path + '.tmp', 'w') as outfile:
+            outfile.write(json_dumps({
+                'root_dir': root_dir,
+                'files': {
+                    relative: [entry.checksum, entry.size, entry.mtime_ns]
+                    for relative, entry in sorted(entries.items())
+                },
+            }))
+
+        replace(file_path + '.tmp', file_path)
@@ -0,0 +1,177 @@
+from __future__ import annotations
+from functools import lru_cache
+from os import path, sep
+from re import compile as re_compile, escape, Pattern
+
+from src.providers.constants import SCAN_IGNORE_FILE_NAME
+from src.providers.config import config
+
+
+class PathFilter:
+    """
+    Compiled gitignore-style include/exclude patterns of a directory tree, used by the scanner (and so by backup,
+    cleaning and watching) and by directory sizes. Patterns come from scan_exclude in config and from .backupignore in
+    the root directory, one per line:
+
+        .DS_Store            name anywhere in the tree
+        *.log                glob of the name ('*' and '?' stop at '/', '[abc]' classes)
+        working/             directories only (trailing '/')
+        /Incoming            relative to the root (leading or middle '/')
+        **/tmp/**            '**' matches any amount of directories
+        !keep.log            include again what earlier patterns excluded
+        # comment
+
+    The last matching pattern decides, as in git. Excluded directories are pruned by the scanner without being read,
+    so nothing inside them can be included again. All patterns are compiled into one regex for files and one for
+    directories, so checking a path costs the same however many patterns there are.
+    """
+    root: str
+    patterns: tuple[str, ...]
+
+    def __init__(self, root_dir: str, patterns: list[str] | tuple[str, ...]):
+        """
+        @param root_dir: directory that relative paths and anchored patterns start from.
+        @param patterns: lines of patterns, empty lines and comments are ignored.
+        """
+        self.root = path.normpath(root_dir)
+        self.patterns = tuple(line.strip() for line in patterns if line.strip() and not line.strip().startswith('#'))
+        self.__files, self.__directories = _compile(self.patterns)
+
+    @classmethod
+    def for_root(cls, root_dir: str) -> PathFilter:
+        """
+        @param root_dir: root of the tree.
+        @return: filter with patterns from config and the ignore file of the root.
+        """
+        patterns = list(config.get('scan_exclude') or [])
+        try:
+            with open(path.join(root_dir, SCAN_IGNORE_FILE_NAME), encoding='utf-8') as ignore_file:
+                patterns.extend(ignore_file.read().splitlines())
+        except OSError:
+            pass
+
+        return cls(root_dir, patterns)
+
+    @property
+    def key(self) -> str:
+        """
+        @return: text identifying the root and patterns, for caches of filtered results.
+        """
+        return '%s\n%s' % (self.root, '\n'.join(self.patterns)) if self.patterns else ''
+
+    def excluded(self, relative: str, is_dir: bool = False) -> bool:
+        """
+        Check single path, its parent directories are expected to be included (as they are when walking the tree).
+        @param relative: path relative to the root, with '/' separators.
+        @param is_dir: path is a directory.
+        @return: True if path is excluded.
+        """
+        pattern = self.__directories if is_dir else self.__files
+        if pattern is None:
+            return False
+
+        match = pattern.fullmatch(relative)
+        return match is not None and match.lastgroup[0] == 'e'
+
+    def excludes(self, relative: str, is_dir: bool = False) -> bool:
+        """
+        Check path together with all its parent directories, for paths that do not come from walking the tree.
+        @param relative: path relative to the root, with '/' separators.
+        @param is_dir: path is a directory.
+        @return: True if path or any of its parents is excluded.
+        """
+        if self.__directories is None:
+            return False
+
+        parts = relative.split('/')
+        for index in range(1, len(parts)):
+            if self.excluded('/'.join(parts[:index]), True):
+                return True
+
+        return self.excluded(relative, is_dir)
+
+    def relative(self, full_path: str) -> str | None:
+        """
+        @param full_path: path inside the root.
+        @return: path relative to the root with '/' separators, empty for the root, None for paths outside of it.
+        """
+        relative = path.relpath(path.normpath(full_path), self.root)
+        if relative == '.':
+            return ''
+        if relative == '..' or relative.startswith('..' + sep):
+            return None
+
+        return relative.replace(sep, '/')
+
+    def __bool__(self) -> bool:
+        return bool(self.patterns)
+
+
+@lru_cache(maxsize=32)
+def _compile(patterns: tuple[str, ...]) -> tuple[Pattern | None, Pattern | None]:
+    """
+    @param patterns: cleaned pattern lines.
+    @return: combined regexes for files and for directories, None if there are no patterns. Patterns are joined last
+    first, so the first alternative that matches is the last pattern in the list, its group name tells whether it
+    excludes ('e') or includes ('i').
+    """
+    files, directories = [], []
+    for index in reversed(range(len(patterns))):
+        line, kind = patterns[index], 'e'
+        if line.startswith('!'):
+            line, kind = line[1:], 'i'
+        if line.startswith('\\'):
+            line = line[1:]  # escaped leading '!' or '#'
+
+        directory_only = line.endswith('/')
+        line = line.rstrip('/')
+        if not line:
+            continue
+
+        anchored = '/' in line
+        source = '(?P<%s%d>%s%s)' % (kind, index, '' if anchored else '(?:.*/)?', translate_pattern(line.lstrip('/')))
+        directories.append(source)
+        if not directory_only:
+            files.append(source)
+
+    return (
+        re_compile('|'.join(files)) if files else None,
+        re_compile('|'.join(directories)) if directories else None,
+    )
+
+
+def translate_pattern(pattern: str) -> str:
+    """
+    @param pattern: gitignore-style glob.
+    @return: regex source matching relative paths with '/' separators.
+    """
+    parts, index, length = [], 0, len(pattern)
+    while index < length:
+        character = pattern[index]
+        if pattern.startswith('**/', index):
+            parts.append('(?:.*/)?')
+            index += 3
+        elif pattern.startswith('**', index):
+            parts.append('.*')
+            index += 2
+        elif character == '*':
+            parts.append('[^/]*')
+            index += 1
+        elif character == '?':
+            parts.append('[^/]')
+            index += 1
+        elif character == '[' and pattern.find(']', index + 2) != -1:
+            end = pattern.find(']', index + 2)
+            members = pattern[index + 1:end]
+            if members.startswith('!'):
+                members = '^' + members[1:]
+            parts.append('[%s]' % members.replace('\\', '\\\\'))
+            index = end + 1
+        elif character == '\\' and index + 1 < length:
+            parts.append(escape(pattern[index + 1]))
+            index += 2
+        else:
+            parts.append(escape(character))
+            index += 1
+
+    return ''.join(parts)
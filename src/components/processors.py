@@ -2,90 +2,627 @@ from __future__ import annotations
 from typing import TYPE_CHECKING
 
 if TYPE_CHECKING:
+    from tkinter import Entry, Label
     from src.windows.mains import WindowRoot
 
-from shutil import copytree
-from os import getcwd, listdir, path
-from json import load as json_load
-from re import findall, match, sub
-from tkinter import Entry, Label
+from os import getcwd, link as os_link, listdir, makedirs, path, rmdir, scandir, stat, unlink
+from re import findall, match, sub, split
 
 from src.providers.constants import CONFIG_KEY_DOWNLOADER_LINK
-from src.windows.popups import WindowMusicConfirm
 from src.providers.config import config
-from src.components.filesystem_helper import delete as fh_delete, get_dir_size as fh_get_dir_size, write_music_metadata, MusicFileMetadata
+from src.providers.language import translate as __
+from src.components.filesystem_helper import write_music_metadata, MusicFileMetadata
+from src.components.tag_writer import TagBatchReport
+from src.components.clean_plan import (
+    CleanPlan, CleanPlanEntry, CleanReport, entry_order, parse_selection, AUDIO_FILE_EXTENSIONS, CLEAN_DELETE,
+    CLEAN_REVIEW, CLEAN_SKIP
+)
+from src.components.copier import CopyEngine, CopyJob
+from src.components.io_scheduler import SCHEDULE_NONE
+from src.components.manifest import BackupManifest, BackupPlan, collect_entries, to_system_path, MTIME_TOLERANCE_NS
+from src.components.journal import BackupJournal
+from src.components.trash import Trash
+from src.components.snapshots import latest_snapshot, start_snapshot, finish_snapshot
+from src.components.object_store import ObjectStore
+from src.components.watcher import (
+    InotifyWatcher, PollingWatcher, DirtyAlbums, WatchUnavailable, album_of, create_watcher, is_ignored
+)
+from src.components.path_filter import PathFilter
+from src.components.rules import RuleSet
+from src.components.scanner import scan, ScanNode
+from src.components.size_cache import invalidate_dir_size
 from src.components.validator import validate_input, NotEmptyRule, PathExistsRule
+from src.components.jobs import JobContext
+from src.components.instrumentation import ProgressTracker
+from src.components.profiling import profiled
+from src.components.downloader import (
+    DownloadQueue, DownloadJob, build_download_command, JOB_DOWNLOADED_DIR, JOB_RUNNING, JOB_FINISHED, JOB_FAILED
+)
 
 
 class ComponentProcessorCleaner:
-    # TODO: implement properly.
-    def process(self, directory):
-        for folder in listdir(directory):
-            sub_directory = path.join(directory, folder)
-            if path.isdir(sub_directory):
-                if self.auto_delete(folder):
-                    answer = 'y'
-                    print("Auto >> DELETING >>>>  %s  <<<<   " % folder)
-                elif self.auto_skip(folder):
-                    answer = 'n'
-                    print("Auto >> SKIPPING >>>>  %s  <<<<   " % folder)
-                else:
-                    answer = input("Has folder >>>>  %s  <<<<, DELETE? Enter for skip, 'y' for yes: " % folder)
-
-                if answer.lower() == 'y':
-                    fh_delete(sub_directory)
-
-    def auto_delete(self, folder):
-        auto_delete = ["Covers", "Cover", "Artwork", "Scans"]
-        for text in auto_delete:
-            if folder.lower().startswith(text.lower()):
-                return True
-
-        return False
-
-    def auto_skip(self, folder):
-        autoskip = ["Disc 1", "Disc 2", "Disc 3", "CD1", "CD2", "CD3", "CD 1", "CD 2", "CD 3"]
-        for text in autoskip:
-            if folder.lower().startswith(text.lower()):
-                return True
-
-        return False
+    """
+    Component class for cleaning up album directories. Cleaning has two phases: plan() goes over the whole tree and
+    decides about every folder (scans, covers and empty folders are deleted, discs and folders with music are kept,
+    the rest is left for the review), apply() then deletes planned folders in bulk. Plan can be saved in between, so
+    big libraries are reviewed once instead of answering a question per folder.
+    """
+    delete_rules: RuleSet
+    skip_rules: RuleSet
+
+    def __init__(self, delete_rules: list[str | dict] = None, skip_rules: list[str | dict] = None):
+        """
+        @param delete_rules: rules of folders deleted without asking, taken from config if not given.
+        @param skip_rules: rules of folders kept without asking, taken from config if not given.
+        """
+        self.delete_rules = RuleSet(config.get('clean_delete_rules') if delete_rules is None else delete_rules)
+        self.skip_rules = RuleSet(config.get('clean_skip_rules') if skip_rules is None else skip_rules)
+
+    @profiled('clean')
+    def process(self, directory: str, tree: ScanNode = None, tracker: ProgressTracker = None) -> CleanReport:
+        """
+        Plans cleaning of the directory, asks once about all unknown folders and applies the plan.
+        @param directory: directory to clean.
+        @param tree: already scanned tree of the directory, directory is scanned if not given.
+        @param tracker: progress tracker, folders are reported as its files.
+        @return: report of the deletion.
+        """
+        plan = self.plan(directory, tree=tree, tracker=tracker)
+        print(plan)
+        self.review(plan)
+
+        return self.apply(plan, tracker=tracker)
+
+    def plan(
+            self, directory: str, context: JobContext = None, tree: ScanNode = None, tracker: ProgressTracker = None
+    ) -> CleanPlan:
+        """
+        Decide about every folder of the tree, nothing is deleted. Deleted folders are not looked into, kept and unknown
+        ones are (so scans inside an album are found too).
+        @param directory: directory to clean.
+        @param context: context of the job, if run as one.
+        @param tree: already scanned tree of the directory, directory is scanned (with its scan filters) if not given.
+        @param tracker: progress tracker, folders are reported as its files.
+        @return: plan of the cleaning.
+        """
+        tracker = tracker or ProgressTracker('clean', context.progress if context is not None else None)
+        if tree is None:
+            with tracker.phase('scan'):
+                tree = scan(directory, path_filter=PathFilter.for_root(directory))
+
+        plan = CleanPlan(path.abspath(directory))
+        tracker.add_totals(tree.directory_count, 0)
+        with tracker.phase('plan'):
+            nodes = [('', tree)]
+            while nodes:
+                prefix, node = nodes.pop()
+                if context is not None:
+                    context.check_cancelled()
+
+                for name, folder in sorted(node.directories.items()):
+                    relative = prefix + name
+                    tracker.advance(1, 0, relative)
+                    decision = self.decide(name, folder)
+                    if decision is not None:
+                        plan.entries.append(CleanPlanEntry(relative, *decision, folder.size, folder.mtime_ns))
+                    if decision is None or decision[0] != CLEAN_DELETE:
+                        nodes.append((relative + '/', folder))
+
+        plan.entries.sort(key=entry_order)
+        tracker.finish()
+
+        return plan
+
+    def decide(self, folder: str, node: ScanNode) -> tuple[str, str] | None:
+        """
+        @param folder: name of the folder.
+        @param node: scanned folder.
+        @return: decision and its reason, None for folders holding only other folders (decided by their contents).
+        Delete rules never delete music: folders with music anywhere inside are decided as if no delete rule matched,
+        unknown ones are left for the review.
+        """
+        if any(name.lower().endswith(AUDIO_FILE_EXTENSIONS) for name in node.files):
+            return CLEAN_SKIP, 'music'
+        delete_rule = self.auto_delete(folder, node)
+        if delete_rule and not self.__holds_music(node):
+            return CLEAN_DELETE, 'auto delete'
+        if self.auto_skip(folder, node):
+            return CLEAN_SKIP, 'auto skip'
+        if delete_rule and node.files:
+            return CLEAN_REVIEW, 'delete rule, holds music'
+        if not node.files and not node.directories:
+            return CLEAN_DELETE, 'empty'
+        if not node.files:
+            return None
+
+        return CLEAN_REVIEW, 'unknown'
+
+    def review(self, plan: CleanPlan) -> None:
+        """
+        Ask once about all unknown folders of the plan, selected ones are deleted, the rest is kept.
+        @param plan: plan to review, changed in place.
+        @return: None.
+        """
+        entries = plan.to_review
+        if not entries:
+            return
+
+        for number, entry in enumerate(entries, 1):
+            print('%4d. %s (%.1f MB)' % (number, entry.relative, entry.size / 1_000_000))
+
+        answer = input("Numbers of folders to DELETE ('1 3-5', 'a' for all), Enter to keep all: ")
+        selected = [entries[index].relative for index in parse_selection(answer, len(entries))]
+        plan.decide(selected, CLEAN_DELETE)
+        plan.decide([entry.relative for entry in entries if entry.relative not in selected], CLEAN_SKIP)
+
+    def apply(self, plan: CleanPlan, context: JobContext = None, tracker: ProgressTracker = None) -> CleanReport:
+        """
+        Delete planned folders by moving them to the trash of the directory (instant, and undoable until trash is
+        purged in the background). Folders that are gone or changed since they were planned are skipped, unknown
+        folders that were not reviewed are kept.
+        @param plan: plan to apply.
+        @param context: context of the job, if run as one.
+        @param tracker: progress tracker, folders are reported as its files.
+        @return: report of the deletion.
+        """
+        tracker = tracker or ProgressTracker('clean', context.progress if context is not None else None)
+        trash = Trash(plan.directory)
+        entries = plan.to_delete
+        tracker.add_totals(len(entries), sum(entry.size for entry in entries))
+        report = CleanReport()
+
+        with tracker.phase('delete'):
+            for entry in entries:
+                if context is not None:
+                    context.check_cancelled()
+
+                folder = to_system_path(plan.directory, entry.relative)
+                try:
+                    if stat(folder).st_mtime_ns != entry.mtime_ns:
+                        report.skipped[entry.relative] = 'changed since planned'
+                        continue
+                    trash.delete(folder, entry.size)
+                except FileNotFoundError:
+                    report.skipped[entry.relative] = 'already deleted'
+                    continue
+                except OSError as e:
+                    report.failed[entry.relative] = str(e)
+                    continue
+
+                report.deleted += 1
+                report.bytes += entry.size
+                tracker.advance(1, entry.size, entry.relative)
+
+        trash.purge()
+        tracker.finish()
+        return report
+
+    def auto_delete(self, folder: str, node: ScanNode = None) -> bool:
+        """
+        @param folder: name of the folder.
+        @param node: scanned folder, needed by rules with size or extension conditions.
+        @return: True if folder is deleted without asking.
+        """
+        return self.delete_rules.matches(folder, node)
+
+    def auto_skip(self, folder: str, node: ScanNode = None) -> bool:
+        """
+        @param folder: name of the folder.
+        @param node: scanned folder, needed by rules with size or extension conditions.
+        @return: True if folder is kept without asking.
+        """
+        return self.skip_rules.matches(folder, node)
+
+    @staticmethod
+    def __holds_music(node: ScanNode) -> bool:
+        """
+        @param node: scanned folder.
+        @return: True if there is a music file anywhere in the folder or its subfolders.
+        """
+        return any(relative.lower().endswith(AUDIO_FILE_EXTENSIONS) for relative, _ in node.walk_files())
 
 
 class ComponentProcessorBackupper:
+    """
+    Component class for backing up album directories. Only new or changed files are copied and only files removed from
+    the source are deleted, state of the previous backup is kept in manifest inside backup directory. While directory
+    is backed up its operations are journaled, so interrupted backup resumes where it stopped.
+
+    With snapshots, every library backup goes to a new dated directory inside copy_to_dir instead of a single mirror.
+    Files unchanged since the previous snapshot are hardlinked to it (like rsync --link-dest), only changed files are
+    copied, so every snapshot is a complete point-in-time copy that takes space only for what changed.
+
+    With store, copy_to_dir is a content-addressed store (see ObjectStore) keeping every distinct content once.
+
+    Library index is refreshed with the backed up directories afterwards, from the already scanned trees.
+    """
     # TODO: implement properly.
 
     root_dir = getcwd()
     copy_to_dir = 'E:\\Music'
+    copy_engine: CopyEngine
+    snapshots: bool
+    store: bool
+    link_dest: str | None = None  # previous snapshot that unchanged files are hardlinked from
+    trash: Trash  # files removed from the source are moved to the trash of copy_to_dir
+    path_filter: PathFilter  # files excluded from the library are not backed up (and removed from the backup)
+
+    def __init__(
+            self, copy_engine: CopyEngine = None, root_dir: str = None, copy_to_dir: str = None, snapshots: bool = None,
+            store: bool = None
+    ):
+        """
+        @param copy_engine: engine to copy files with, shared between albums, new one is created if not given.
+        @param root_dir: library directory, albums are backed up to the same relative location in copy_to_dir.
+        @param copy_to_dir: backup directory.
+        @param snapshots: back up library to dated snapshots inside copy_to_dir, taken from config if not given.
+        @param store: back up library to content-addressed store in copy_to_dir, taken from config if not given.
+        """
+        self.copy_engine = copy_engine or CopyEngine()
+        if root_dir is not None:
+            self.root_dir = path.normpath(root_dir)
+        if copy_to_dir is not None:
+            self.copy_to_dir = path.normpath(copy_to_dir)
+        self.snapshots = bool(config.get('backup_snapshots') if snapshots is None else snapshots)
+        self.store = bool(config.get('backup_store') if store is None else store)
+        self.trash = Trash(self.copy_to_dir)
+        self.path_filter = PathFilter.for_root(self.root_dir)
+
+    @profiled('backup')
+    def process_library(self, context: JobContext = None, tracker: ProgressTracker = None) -> int:
+        """
+        Backs up every album directory of root_dir, library is scanned once for all of them and everything is planned
+        before copying starts, so totals (and ETA) are known. Meant to be run as a job, reports progress and stops
+        between albums once cancelled.
+        @param context: context of the job, if run as one.
+        @param tracker: progress tracker, created (reporting to the job) if not given.
+        @return: amount of albums processed.
+        """
+        tracker = tracker or ProgressTracker('backup', context.progress if context is not None else None)
+
+        if self.store:
+            with tracker.phase('scan'):
+                tree = scan(self.root_dir, path_filter=self.path_filter)
+
+            print(ObjectStore(self.copy_to_dir, self.copy_engine).backup(self.root_dir, tree, context, tracker))
+            self.__refresh_index([tree])
+            return len(tree.directories)
+
+        copy_to_dir = self.copy_to_dir
+        if self.snapshots:
+            self.link_dest = latest_snapshot(copy_to_dir)
+            self.copy_to_dir = start_snapshot(copy_to_dir)
+
+        try:
+            with tracker.phase('scan'):
+                tree = scan(self.root_dir, path_filter=self.path_filter)
+
+            albums = self.__backup_albums(list(tree.directories.values()), context, tracker)
+            self.__refresh_index([tree])
+
+            if self.snapshots:
+                print('Snapshot %s finished' % finish_snapshot(self.copy_to_dir))
+        finally:
+            self.copy_to_dir, self.link_dest = copy_to_dir, None
+
+        return albums
+
+    @profiled('backup')
+    def process_albums(self, albums: list[str], context: JobContext = None, tracker: ProgressTracker = None) -> int:
+        """
+        Backs up only the given albums, only they are scanned. Snapshots and store need the whole library, so for them
+        the whole library is backed up.
+        @param albums: album directories inside root_dir.
+        @param context: context of the job, if run as one.
+        @param tracker: progress tracker, created (reporting to the job) if not given.
+        @return: amount of albums processed.
+        """
+        if self.snapshots or self.store:
+            return self.process_library(context, tracker)
+
+        tracker = tracker or ProgressTracker('backup', context.progress if context is not None else None)
+        with tracker.phase('scan'):
+            trees = [scan(album, path_filter=self.path_filter) for album in albums if path.isdir(album)]
+
+        albums = self.__backup_albums(trees, context, tracker)
+        self.__refresh_index(trees)
+
+        return albums
+
+    def watch(
+            self, context: JobContext = None, watcher: InotifyWatcher | PollingWatcher = None, debounce: float = None
+    ) -> None:
+        """
+        Backs up the whole library once, then watches it and backs up albums as they change. Changes are debounced per
+        album, so an album being downloaded or tagged is backed up once it is quiet. Runs until cancelled (or
+        interrupted from the command line). Inotify watcher that runs out of watches for new directories is replaced by
+        polling watcher, every album is checked then, as changes may have been lost.
+        @param context: context of the job, if run as one.
+        @param watcher: watcher of the library, inotify (or polling where not available) watcher if not given.
+        @param debounce: seconds an album has to be unchanged before it is backed up, taken from config if not given.
+        @return: None.
+        """
+        poll_interval = float(config.get('watch_poll_interval'))
+        watcher = watcher or create_watcher(self.root_dir, poll_interval, path_filter=self.path_filter)
+        debounce = float(config.get('watch_debounce_seconds') if debounce is None else debounce)
+        dirty = DirtyAlbums(debounce, max(debounce, float(config.get('watch_max_delay_seconds'))))
+
+        try:
+            self.process_library(context)
+            while context is None or not context.cancelled:
+                try:
+                    changes = watcher.changes(timeout=1.0)
+                except WatchUnavailable as e:
+                    print('Watching with inotify stopped (%s), polling every %ds' % (e, poll_interval))
+                    watcher.close()
+                    watcher = PollingWatcher(self.root_dir, poll_interval, self.path_filter)
+                    changes = {self.root_dir}
+
+                for changed_path in changes:
+                    album = album_of(self.root_dir, changed_path)
+                    if album is not None:
+                        dirty.add(album)
+                        continue
+
+                    # events were lost, every album has to be checked.
+                    with scandir(self.root_dir) as it:
+                        for entry in it:
+                            if entry.is_dir() and not is_ignored(entry.path, self.path_filter, True):
+                                dirty.add(entry.path)
+
+                due = dirty.pop_due()
+                if due:
+                    print('Backing up changed albums: %s' % ', '.join(sorted(path.basename(album) for album in due)))
+                    self.process_albums(sorted(due), context)
+        finally:
+            watcher.close()
+
+    def __backup_albums(self, albums: list[ScanNode], context: JobContext, tracker: ProgressTracker) -> int:
+        """
+        Plans all the albums first, so totals (and ETA) are known, then backs them up one by one, ordered by the lowest
+        inode of their changed files unless the scheduler keeps the listing order.
+        @param albums: scanned album directories.
+        @param context: context of the job, if run as one.
+        @param tracker: progress tracker.
+        @return: amount of albums processed.
+        """
+        with tracker.phase('plan'):
+            plans = [self.plan(album.path, album) for album in albums]
+            for plan in plans:
+                tracker.add_totals(len(plan.to_copy) + len(plan.to_link), plan.copy_size)
+
+        if self.copy_engine.scheduler.order != SCHEDULE_NONE:
+            plans.sort(key=lambda plan: min((plan.source[relative].inode for relative in plan.to_copy), default=0))
+
+        with tracker.phase('copy'):
+            for plan in plans:
+                if context is not None:
+                    context.check_cancelled()
 
-    def process(self, directory):
+                tracker.set_item(path.basename(plan.directory))
+                self.apply(plan, tracker)
+
+        self.trash.purge()
+        tracker.finish()
+        return len(plans)
+
+    @staticmethod
+    def __refresh_index(trees: list[ScanNode]) -> None:
+        """
+        Refresh library index with backed up directories, only their files changed since the last refresh are read.
+        @param trees: scanned directories.
+        @return: None.
+        """
+        from src.components.library_index import refresh_library_index  # sqlite is only loaded once it is needed.
+
+        refresh_library_index(trees)
+
+    @profiled('backup')
+    def process(self, directory: str, tree: ScanNode = None, tracker: ProgressTracker = None) -> None:
+        """
+        Backs up directory into the same relative location inside copy_to_dir.
+        @param directory: directory inside root_dir to back up.
+        @param tree: already scanned tree of the directory, directory is scanned if not given.
+        @param tracker: progress tracker to report copied files to.
+        @return: None.
+        """
+        self.apply(self.plan(directory, tree), tracker)
+        self.trash.purge()
+
+    def plan(self, directory: str, tree: ScanNode = None) -> BackupPlan:
+        """
+        Compares directory with manifest of its backup. Changed files that did not change since the previous snapshot
+        (if there is one) are linked instead of copied.
+        @param directory: directory inside root_dir to back up.
+        @param tree: already scanned tree of the directory, directory is scanned if not given.
+        @return: plan of the backup.
+        """
         copy_dir = directory.replace(self.root_dir, self.copy_to_dir)
-        if path.exists(copy_dir):
-            if fh_get_dir_size(directory) == fh_get_dir_size(copy_dir):
-                return
-            fh_delete(copy_dir, True)
+        source = collect_entries(directory, tree, self.path_filter)
+
+        manifest = BackupManifest(copy_dir)
+        tolerance = 0
+        if not manifest.load():
+            # no manifest yet, compare with what is already copied, allowing for imprecise time of FAT drives.
+            manifest.bootstrap()
+            tolerance = MTIME_TOLERANCE_NS
+
+        journal = BackupJournal(copy_dir)
+        if journal.exists:
+            self.__resume(manifest, journal)
+
+        to_copy, to_delete = manifest.diff(source, tolerance)
+
+        # unchanged files keep checksums of their copies.
+        unchanged = set(source).difference(to_copy)
+        for relative in unchanged.intersection(manifest.entries):
+            source[relative].checksum = manifest.entries[relative].checksum
+
+        to_link, link_dir = [], ''
+        if self.link_dest is not None:
+            link_dir = directory.replace(self.root_dir, self.link_dest)
+            previous = BackupManifest(link_dir)
+            if previous.load():
+                to_link = [
+                    relative for relative in to_copy
+                    if relative in previous.entries and source[relative].matches(previous.entries[relative])
+                ]
+                for relative in to_link:
+                    source[relative].checksum = previous.entries[relative].checksum
+                linked = set(to_link)
+                to_copy = [relative for relative in to_copy if relative not in linked]
+
+        return BackupPlan(directory, copy_dir, source, manifest, to_copy, to_delete, to_link, link_dir)
+
+    def apply(self, plan: BackupPlan, tracker: ProgressTracker = None) -> None:
+        """
+        Moves removed files from backup to the trash, copies new and changed files and saves the manifest.
+        @param plan: of the backup.
+        @param tracker: progress tracker to report copied files to.
+        @return: None.
+        """
+        if plan.is_empty:
+            return
+
+        directory, copy_dir, source, manifest = plan.directory, plan.copy_dir, plan.source, plan.manifest
+        if not path.isdir(copy_dir):
+            makedirs(copy_dir)
+
+        journal = BackupJournal(copy_dir)
+        journal.begin(plan.to_copy + plan.to_link, plan.to_delete)
+
+        for relative in plan.to_delete:
+            self.trash.delete(to_system_path(copy_dir, relative))
+            manifest.entries.pop(relative)
+            journal.record_deleted(relative)
+            self.__delete_empty_parents(path.dirname(to_system_path(copy_dir, relative)), copy_dir)
+
+        jobs = {to_system_path(copy_dir, relative): relative for relative in plan.to_copy}
+        for relative in plan.to_link:
+            target = to_system_path(copy_dir, relative)
+            if self.__link(to_system_path(plan.link_dir, relative), target):
+                journal.record_copied(relative, source[relative])
+                if tracker is not None:
+                    tracker.advance(1, 0, relative)
+            else:
+                jobs[target] = relative  # filesystem without hardlinks, file is copied instead.
+
+        def on_copied(job: CopyJob, size: int) -> None:
+            source[jobs[job.target]].checksum = job.checksum
+            journal.record_copied(jobs[job.target], source[jobs[job.target]])
+            if tracker is not None:
+                tracker.advance(1, size, path.basename(job.source))
+
+        report = self.copy_engine.copy([
+            CopyJob(
+                to_system_path(directory, relative), target, copy_dir, size=source[relative].size,
+                inode=source[relative].inode
+            ) for target, relative in jobs.items()
+        ], on_copied)
+        if jobs:
+            print('%s: %s' % (directory, report))
+            invalidate_dir_size(copy_dir)  # changed files may have been overwritten in place.
+
+        # manifest always holds source values, even for files that were matched to existing copies. Failed copies keep
+        # their previous state, so they are retried next time.
+        for relative in jobs.values():
+            if to_system_path(directory, relative) in report.failed:
+                source.pop(relative)
+                if relative in manifest.entries:
+                    source[relative] = manifest.entries[relative]
+
+        manifest.entries = source
+        manifest.save()
+        journal.remove()
+
+    def __link(self, link_source: str, target: str) -> bool:
+        """
+        Hardlink file of the previous snapshot into the new one.
+        @param link_source: file in the previous snapshot.
+        @param target: path in the new snapshot.
+        @return: True if linked, False if file has to be copied instead.
+        """
+        makedirs(path.dirname(target), exist_ok=True)
+        try:
+            if path.lexists(target):
+                unlink(target)
+            os_link(link_source, target)
+        except OSError:
+            return False
+
+        return True
 
-        copytree(directory, copy_dir)
+    def __resume(self, manifest: BackupManifest, journal: BackupJournal) -> None:
+        """
+        Takes over what the interrupted backup of the directory already did: completed operations from its journal
+        are saved to manifest, unfinished copies are deleted.
+        @param manifest: manifest of the directory, changed in place.
+        @param journal: journal of the interrupted backup.
+        @return: None.
+        """
+        replayed = journal.replay(manifest.entries)
+        removed = journal.remove_temporary_files()
+        print('%s: resuming interrupted backup, %d operations done, %d unfinished copies removed' % (
+            manifest.directory, replayed, removed
+        ))
+
+        manifest.save()
+        journal.remove()
+
+    def __delete_empty_parents(self, directory: str, copy_dir: str) -> None:
+        """
+        Deletes directory and its parents (up to copy_dir) while they are empty.
+        @param directory: directory to start from.
+        @param copy_dir: directory to stop at, it is never deleted.
+        @return: None.
+        """
+        while path.normpath(directory) != path.normpath(copy_dir) and path.isdir(directory) and not listdir(directory):
+            rmdir(directory)
+            directory = path.dirname(directory)
 
 
 class ComponentProcessorDownloader:
     """
-    Component class for processing download from YouTube video (album)
+    Component class for processing downloads from YouTube videos (albums). Links are added to the download queue, which
+    runs several downloads at the same time, each in its own working directory. Metadata of finished downloads is
+    confirmed one album at a time.
     """
     input_download_link: Entry
     input_download_link_error_label: Label
+    progress_label: Label | None
     window: WindowRoot
+    command: str | list[str] | None
+    queue: DownloadQueue
+    pending_confirmations: list[DownloadJob]
+    tracker: ProgressTracker
 
-    def __init__(self, input_download_link: Entry, input_download_link_error_label: Label, window: WindowRoot):
+    poll_interval: int = 200  # milliseconds between reading output of the downloads.
+
+    def __init__(
+            self, input_download_link: Entry, input_download_link_error_label: Label, window: WindowRoot,
+            progress_label: Label = None, command: str | list[str] = None
+    ):
         """
         Sets required properties for class.
-        @param input_download_link: required to get link from input.
+        @param input_download_link: required to get links from input.
         @param input_download_link_error_label: in case link is broken, error will be shown.
         @param window: requires to call sub-window metadata confirmation.
+        @param progress_label: shows progress of the downloads, if given.
+        @param command: command template to run instead of yt-dlp built from config (for example fake script for
+        testing), {link} and {working_dir} are replaced with values of the job.
         """
         self.input_download_link = input_download_link
         self.input_download_link_error_label = input_download_link_error_label
         self.window = window
+        self.progress_label = progress_label
+        self.command = command
+        self.queue = DownloadQueue(
+            int(config.get('yt_downloader_concurrency')), self.build_command, path.join(getcwd(), 'tmp', 'jobs'),
+            path.join(getcwd(), JOB_DOWNLOADED_DIR)
+        )
+        self.pending_confirmations = []
+        self.tracker = ProgressTracker('download')
+        self.__polling = False
 
     def validate(self) -> bool:
         """
@@ -96,42 +633,117 @@ class ComponentProcessorDownloader:
             NotEmptyRule()
         ])
 
+    @profiled('download')
     def process(self) -> None:
         """
-        Starts whole process for video album download. Remembers the link, calls yt downloader command and calls the
-        rest of the function to validate and confirm metadata.
+        Starts whole process for video album downloads. Remembers the links and adds them to the download queue, the
+        rest (validate and confirm metadata) is done once each download finishes. Links are separated by spaces,
+        commas or new lines.
+        @return: None.
+        """
+        links = [link for link in split(r'[\s,]+', self.input_download_link.get()) if link]
+        config.set(CONFIG_KEY_DOWNLOADER_LINK, ' '.join(links))  # remember the links for later use.
+
+        for link in links:
+            self.queue.add(link)
+        self.tracker.add_totals(len(links))
+
+        if not self.__polling:
+            self.__polling = True
+            self.window.window.after(0, self.__poll)
+
+    def build_command(self, job: DownloadJob) -> str | list[str]:
+        """
+        Generate a system command for yt downloader.
+        @param job: download job to generate command for.
+        @return: command to run, string is run through the shell.
+        """
+        return build_download_command(job, self.command)
+
+    def cancel(self) -> None:
+        """
+        Cancel all queued and running downloads.
         @return: None.
         """
-        link = self.input_download_link.get()
-        config.set(CONFIG_KEY_DOWNLOADER_LINK, link)  # remember the link for later use.
+        self.queue.cancel()
+
+    def __poll(self) -> None:
+        """
+        Polls the download queue on Tk thread, shows progress and asks for metadata confirmation of finished
+        downloads. Schedules itself again while there are downloads or confirmations left.
+        @return: None.
+        """
+        for job in self.queue.poll():
+            self.tracker.advance(1, item=job.link)
+            if job.state == JOB_FINISHED:
+                self.pending_confirmations.append(job)
+            elif job.state == JOB_FAILED:
+                print(__('downloader.failed') % job.return_code, job.link, job.last_output)
+
+        self.__confirm_next()
+        self.__show_progress()
+
+        if self.queue.is_finished and not self.pending_confirmations:
+            self.__polling = False
+            return
+
+        self.window.window.after(self.poll_interval, self.__poll)
 
-        # generate a system command
-        chapter_format = config.get("yt_downloader_chapter_format_start") + config.get("yt_downloader_chapter_format")
-        system_command_main = config.get("yt_downloader_dpl_command_start").format(link=link)
-        system_command_configurable = config.get("yt_downloader_dpl_command").format(chapter_format=chapter_format)
+    def __confirm_next(self) -> None:
+        """
+        Opens metadata confirmation of the next finished download, unless one is already open.
+        @return: None.
+        """
+        from src.windows.popups import WindowMusicConfirm  # window is only needed (and imported) for confirmation.
 
-        # system(system_command_main + ' ' + system_command_configurable)
+        if not self.pending_confirmations or WindowMusicConfirm.__name__ in self.window.windows:
+            return
 
+        job = self.pending_confirmations.pop(0)
         self.window.call_window(
-            WindowMusicConfirm, (self.__gather_metadata(), write_music_metadata), self.window.on_window_close
+            WindowMusicConfirm, (self.__gather_metadata(job), self.__write_metadata), self.window.on_window_close
         )
 
-    def __gather_metadata(self) -> MusicFileMetadata:
+    def __write_metadata(self, metadata: MusicFileMetadata) -> None:
         """
-        Gathers metadata from downloaded json file.
-        @return: dataclass of metdata.
+        Called once metadata is confirmed, writes it to files in the background.
+        @param metadata: confirmed metadata.
+        @return: None.
         """
-        folder = getcwd()
+        from src.components.library_index import refresh_library_index  # sqlite is only loaded once it is needed.
+
+        def write(context: JobContext) -> TagBatchReport:
+            report = write_music_metadata(metadata, ProgressTracker('tags', context.progress))
+            refresh_library_index(sorted({path.dirname(file_path) for file_path in report.written}))
+            return report
 
-        json_file = open(folder + '/tmp/processing.info.json')
-        json_data = json_load(json_file)
+        self.window.submit_job(__('jobs.tags') % metadata.album, write)
+
+    def __show_progress(self) -> None:
+        """
+        Shows summary of the queue and progress of running downloads in progress label, if there is one.
+        @return: None.
+        """
+        if self.progress_label is None:
+            return
+
+        running = [str(job) for job in self.queue.jobs if job.state == JOB_RUNNING]
+        self.progress_label.config(text='\n'.join([str(self.tracker.snapshot()), self.queue.summary()] + running))
+
+    def __gather_metadata(self, job: DownloadJob) -> MusicFileMetadata:
+        """
+        Gathers metadata from downloaded json file, read by the queue once the job finished.
+        @param job: finished download job.
+        @return: dataclass of metdata.
+        """
+        title = (job.info or {}).get("title", "")
 
         return MusicFileMetadata(
-            folder + '/download_music/working',
+            job.output_dir,
 
-            self.__find_artist_in_title(json_data["title"]),
-            self.__find_album_name_in_title(json_data["title"]),
-            self.__find_year_in_title(json_data["title"]),
+            self.__find_artist_in_title(title),
+            self.__find_album_name_in_title(title),
+            self.__find_year_in_title(title),
             ''  # genre extraction not implemented currently
         )
 
@@ -162,9 +774,10 @@ class ComponentProcessorDownloader:
         @param title: string to search in.
         @return: artist name or nothing.
         """
-        artist = title.partition('-')[0]
-        if not artist:
-            match("(.*?):", title).group()
+        artist, separator, _ = title.partition('-')
+        if not separator:
+            found = match('(.*?):', title)
+            artist = found.group(1) if found else ''
 
         return artist.strip()
 
@@ -176,6 +789,6 @@ class ComponentProcessorDownloader:
         """
         album = title.partition('-')[2]
         if not album:
-            match("(.*?):", title).group()
+            album = title.partition(':')[2]
 
         return sub(r'[^a-zA-Z\s]', '', album).strip()
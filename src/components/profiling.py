@@ -0,0 +1,201 @@
+from __future__ import annotations
+from cProfile import Profile
+from datetime import datetime
+from functools import wraps
+from io import StringIO
+from json import dumps as json_dumps
+from os import environ, makedirs, path
+from pstats import Stats
+from sys import version_info
+from threading import Lock, setprofile as threading_setprofile
+from time import perf_counter
+from typing import Callable
+import tracemalloc
+
+from src.providers.constants import PROFILING_ENV_VARIABLE
+from src.providers.config import config
+from src.components.instrumentation import ProgressTracker, tracker_observers
+
+# only one run is profiled at a time, profilers of the interpreter cannot be nested.
+_session_lock = Lock()
+
+# called with every written session, the command line prints where the profile is, background jobs stay silent.
+profile_observers: list[Callable[[ProfileSession], None]] = []
+
+# since 3.12 cProfile is built on sys.monitoring, where only one profiler can be active, so a profiler per thread
+# fails with "Another profiling tool is already active". Only the calling thread is profiled there.
+PROFILE_THREADS = version_info < (3, 12)
+
+
+def profiling_enabled() -> bool:
+    """
+    Profiling is enabled by the environment variable (any value except empty, 0, false, no) or by config.
+    @return: True if processor runs should be profiled.
+    """
+    value = environ.get(PROFILING_ENV_VARIABLE)
+    if value is not None:
+        return value.strip().lower() not in ('', '0', 'false', 'no')
+
+    return bool(config.get('profiling'))
+
+
+class ProfileSession:
+    """
+    Profile of a single processor run: cProfile stats of the calling thread and (up to python 3.11, see PROFILE_THREADS)
+    of every thread started during the run (copy and scan workers), peak memory traced by tracemalloc and wall-clock
+    time of every phase reported to progress trackers. Everything is written to its own timestamped directory once the
+    run ends.
+    """
+    name: str
+    directory: str | None
+
+    def __init__(self, name: str, base_dir: str = None):
+        """
+        @param name: name of the processor, part of the directory name.
+        @param base_dir: directory to create profile directories in, taken from config if not given.
+        """
+        self.name = name
+        self.directory = None
+        self.__base_dir = base_dir or config.get('profiling_dir')
+        self.__profiler = Profile()
+        self.__thread_profilers = []
+        self.__trackers = []
+        self.__lock = Lock()
+        self.__started = 0.0
+        self.__started_tracing = False
+
+    def __enter__(self) -> ProfileSession:
+        tracker_observers.append(self.__trackers.append)
+        if PROFILE_THREADS:
+            threading_setprofile(self.__profile_thread)
+
+        self.__started_tracing = not tracemalloc.is_tracing()
+        if self.__started_tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+
+        self.__started = perf_counter()
+        self.__profiler.enable()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.__profiler.disable()
+        wall_seconds = perf_counter() - self.__started
+
+        if PROFILE_THREADS:
+            threading_setprofile(None)
+        tracker_observers.remove(self.__trackers.append)
+
+        current_memory, peak_memory = tracemalloc.get_traced_memory()
+        allocations = tracemalloc.take_snapshot().statistics('lineno')[:20]
+        if self.__started_tracing:
+            tracemalloc.stop()
+
+        self.directory = self.__make_directory()
+        self.__write_stats()
+        self.__write_summary({
+            'processor': self.name,
+            'wall_seconds': wall_seconds,
+            'failed': exc_info[0] is not None,
+            'threads_profiled': PROFILE_THREADS,
+            'memory_peak_bytes': peak_memory,
+            'memory_end_bytes': current_memory,
+            'top_allocations': [
+                {'line': str(statistic.traceback), 'bytes': statistic.size, 'count': statistic.count}
+                for statistic in allocations
+            ],
+            'phases': [
+                {'processor': tracker.processor, 'phase_timings': tracker.phase_timings} for tracker in self.__trackers
+            ],
+        })
+        for observer in list(profile_observers):
+            observer(self)
+
+    def track(self, tracker: ProgressTracker) -> None:
+        """
+        Add phase timings of tracker created before the session (for example given to the processor by its caller).
+        @param tracker: to add.
+        @return: None.
+        """
+        if tracker not in self.__trackers:
+            self.__trackers.append(tracker)
+
+    def __profile_thread(self, *args) -> None:
+        """
+        Installed as profile function of new threads, replaces itself with a profiler of the thread on first call.
+        @param args: frame, event and argument of the profile call.
+        @return: None.
+        """
+        profiler = Profile()
+        with self.__lock:
+            self.__thread_profilers.append(profiler)
+        profiler.enable()
+
+    def __make_directory(self) -> str:
+        """
+        @return: new directory for the profile.
+        """
+        name = '%s-%s' % (datetime.now().strftime('%Y%m%d-%H%M%S'), self.name)
+        directory, suffix = path.join(self.__base_dir, name), 1
+        while path.exists(directory):
+            suffix += 1
+            directory = path.join(self.__base_dir, '%s-%d' % (name, suffix))
+
+        makedirs(directory)
+        return directory
+
+    def __write_stats(self) -> None:
+        """
+        Write merged cProfile stats, as binary file for pstats/snakeviz and as text sorted by cumulative time.
+        @return: None.
+        """
+        stats = Stats(self.__profiler)
+        with self.__lock:
+            for profiler in self.__thread_profilers:
+                profiler.snapshot_stats()
+                if profiler.stats:
+                    stats.add(profiler)
+
+        stats.dump_stats(path.join(self.directory, 'profile.pstats'))
+
+        text = StringIO()
+        Stats(path.join(self.directory, 'profile.pstats'), stream=text).sort_stats('cumulative').print_stats(50)
+        with open(path.join(self.directory, 'profile.txt'), 'w') as outfile:
+            outfile.write(text.getvalue())
+
+    def __write_summary(self, summary: dict) -> None:
+        """
+        @param summary: wall-clock time, memory and phase timings of the run.
+        @return: None.
+        """
+        with open(path.join(self.directory, 'summary.json'), 'w') as outfile:
+            outfile.write(json_dumps(summary, indent=4))
+
+
+def profiled(name: str) -> Callable:
+    """
+    Decorator for process() methods of processors, runs them inside ProfileSession when profiling is enabled. Runs
+    started while another one is profiled (nested or on other job threads) are not profiled.
+    @param name: name of the processor.
+    @return: decorator.
+    """
+    def decorator(function: Callable) -> Callable:
+        @wraps(function)
+        def wrapper(*args, **kwargs) -> any:
+            if not profiling_enabled() or not _session_lock.acquire(blocking=False):
+                return function(*args, **kwargs)
+
+            try:
+                with ProfileSession(name) as session:
+                    for value in (*args, *kwargs.values()):
+                        if isinstance(value, ProgressTracker):
+                            session.track(value)
+
+                    return function(*args, **kwargs)
+            finally:
+                _session_lock.release()
+
+        return wrapper
+
+    return decorator
+
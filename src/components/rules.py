@@ -0,0 +1,207 @@
+from __future__ import annotations
+from fnmatch import translate
+from re import compile as re_compile, error as re_error, escape, IGNORECASE, Pattern
+
+from src.components.scanner import ScanNode
+
+# key marking the end of a prefix in the trie, never a single character of a name.
+TRIE_END = ''
+
+# units allowed in size conditions, '10MB' or '500 KB'.
+SIZE_UNITS = {'': 1, 'B': 1, 'KB': 1_000, 'MB': 1_000_000, 'GB': 1_000_000_000}
+
+
+class InvalidRule(Exception):
+    """
+    Raised for rules that can not be compiled, message names the rule.
+    """
+    pass
+
+
+class RuleSet:
+    """
+    Compiled set of folder rules, as used by the cleaner. Every rule is one of:
+
+        "Scans"                                  prefix of the name (the shorthand, same as {"prefix": "Scans"})
+        {"glob": "*scan*"}                       whole name matches the glob
+        {"regex": "cd ?\\d+$"}                   name matches the regex from its start
+        {"extensions": [".jpg", ".png"]}         folder has files and every one of them (subfolders included) has one
+        {"min_size": "1MB", "max_size": "50MB"}  total size of the folder
+
+    Keys of a single rule can be combined and all of them have to match, names are matched case-insensitively. Name
+    only rules are compiled into a prefix trie and a single combined regex, so matching a name costs its length rather
+    than the amount of rules. Regexes with groups are compiled on their own, combined they would number their groups
+    differently and backreferences would match the wrong group. Rules with folder conditions are checked one by one,
+    and only for folders none of the name rules matched.
+    """
+
+    def __init__(self, rules: list[str | dict]):
+        """
+        @param rules: rules of the set.
+        """
+        self.__trie = {}
+        self.__conditional = []
+        self.__separate = []  # regexes with groups
+        patterns = []
+
+        for rule in rules:
+            rule = {'prefix': rule} if isinstance(rule, str) else dict(rule)
+            unknown = set(rule) - {'prefix', 'glob', 'regex', 'extensions', 'min_size', 'max_size'}
+            if unknown:
+                raise InvalidRule('%s: unknown keys %s' % (rule, ', '.join(sorted(unknown))))
+            if not rule:
+                raise InvalidRule('empty rule would match every folder')
+
+            names = [key for key in ('prefix', 'glob', 'regex') if key in rule]
+            if len(rule) == 1 and rule.get('prefix') is not None:
+                self.__add_prefix(rule['prefix'])
+            elif len(rule) == 1 and names:
+                pattern = self.__to_pattern(rule, names[0])
+                compiled = re_compile(pattern, IGNORECASE)
+                if compiled.groups:
+                    self.__separate.append(compiled)
+                else:
+                    patterns.append(pattern)
+            else:
+                self.__conditional.append(self.__compile_conditional(rule, names))
+
+        try:
+            self.__pattern = re_compile('|'.join(patterns), IGNORECASE) if patterns else None
+        except re_error as e:
+            raise InvalidRule('regex rules can not be combined: %s' % e)
+        self.__size = len(rules)
+
+    def matches(self, name: str, node: ScanNode = None) -> bool:
+        """
+        @param name: name of the folder.
+        @param node: scanned folder, rules with folder conditions are not checked without it.
+        @return: True if any rule of the set matches.
+        """
+        if self.__trie and self.__match_prefix(name.lower()):
+            return True
+        if self.__pattern is not None and self.__pattern.match(name):
+            return True
+        if any(pattern.match(name) for pattern in self.__separate):
+            return True
+        if node is None:
+            return False
+
+        return any(
+            (pattern is None or pattern.match(name)) and self.__match_conditions(node, *conditions)
+            for pattern, conditions in self.__conditional
+        )
+
+    def __len__(self) -> int:
+        return self.__size
+
+    def __add_prefix(self, prefix: str) -> None:
+        """
+        @param prefix: prefix to add to the trie.
+        @return: None.
+        """
+        if not prefix:
+            raise InvalidRule('empty prefix would match every folder')
+
+        node = self.__trie
+        for character in prefix.lower():
+            node = node.setdefault(character, {})
+        node[TRIE_END] = True
+
+    def __match_prefix(self, name: str) -> bool:
+        """
+        @param name: lower-cased name.
+        @return: True if any prefix of the trie starts the name.
+        """
+        node = self.__trie
+        for character in name:
+            node = node.get(character)
+            if node is None:
+                return False
+            if TRIE_END in node:
+                return True
+
+        return False
+
+    def __compile_conditional(self, rule: dict, names: list[str]) -> tuple[Pattern | None, tuple]:
+        """
+        @param rule: rule with folder conditions (or several name keys).
+        @param names: name keys of the rule.
+        @return: compiled name pattern (None if the rule has no name keys) and folder conditions.
+        """
+        pattern = None
+        if names:
+            pattern = re_compile(''.join('(?=%s)' % self.__to_pattern(rule, key) for key in names), IGNORECASE)
+
+        extensions = rule.get('extensions')
+        if isinstance(extensions, str):
+            extensions = [extensions]
+        if extensions is not None:
+            extensions = tuple('.' + extension.lower().lstrip('.') for extension in extensions)
+
+        return pattern, (extensions, parse_size(rule.get('min_size')), parse_size(rule.get('max_size')))
+
+    @staticmethod
+    def __to_pattern(rule: dict, key: str) -> str:
+        """
+        @param rule: rule with the name key.
+        @param key: prefix, glob or regex.
+        @return: regex source of the name key, matched from the start of the name.
+        """
+        value = rule[key]
+        if not isinstance(value, str) or not value:
+            raise InvalidRule('%s: %s has to be a non-empty string' % (rule, key))
+
+        if key == 'prefix':
+            return '(?:%s)' % escape(value)
+        if key == 'glob':
+            return '(?:%s)' % translate(value)
+
+        try:
+            re_compile(value)
+        except re_error as e:
+            raise InvalidRule('%s: %s' % (rule, e))
+
+        return '(?:%s)' % value
+
+    @staticmethod
+    def __match_conditions(
+            node: ScanNode, extensions: tuple | None, min_size: int | None, max_size: int | None
+    ) -> bool:
+        """
+        @param node: scanned folder.
+        @param extensions: allowed extensions of its files, folder without files does not match.
+        @param min_size: minimal size of the folder.
+        @param max_size: maximal size of the folder.
+        @return: True if folder meets all the conditions.
+        """
+        if min_size is not None and node.size < min_size:
+            return False
+        if max_size is not None and node.size > max_size:
+            return False
+        if extensions is None:
+            return True
+
+        has_files = False
+        for relative, _ in node.walk_files():
+            if not relative.lower().endswith(extensions):
+                return False
+            has_files = True
+
+        return has_files
+
+
+def parse_size(value: int | str | None) -> int | None:
+    """
+    @param value: size in bytes or text with unit, for example '10MB'.
+    @return: size in bytes, None if not given.
+    """
+    if value is None or isinstance(value, int):
+        return value
+
+    text = str(value).strip().upper()
+    number = text.rstrip('KMGB ')
+    try:
+        return int(float(number) * SIZE_UNITS[text[len(number):].strip()])
+    except (KeyError, ValueError):
+        raise InvalidRule('%s is not a size' % value)
+
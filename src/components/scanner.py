@@ -0,0 +1,131 @@
+from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from dataclasses import dataclass, field
+from os import path, scandir, stat
+from typing import Iterator
+
+from src.providers.constants import TRASH_DIR_NAME
+from src.providers.config import config
+from src.components.path_filter import PathFilter
+
+
+@dataclass
+class ScanFile:
+    """
+    Data class for a file found by the scanner.
+    """
+    name: str
+    size: int
+    mtime_ns: int
+    inode: int = 0
+
+
+@dataclass
+class ScanNode:
+    """
+    Data class for a directory found by the scanner. Totals include all subdirectories and are filled once the whole
+    tree is scanned.
+    """
+    path: str
+    name: str
+    mtime_ns: int = 0
+    files: dict[str, ScanFile] = field(default_factory=dict)
+    directories: dict[str, ScanNode] = field(default_factory=dict)
+
+    size: int = 0
+    file_count: int = 0
+    directory_count: int = 0
+
+    def walk_files(self, prefix: str = '') -> Iterator[tuple[str, ScanFile]]:
+        """
+        Iterate over all files in the tree.
+        @param prefix: prepended to relative path of every file.
+        @return: iterator of relative path (with '/' separators) and the file.
+        """
+        for name, file in self.files.items():
+            yield prefix + name, file
+
+        for name, directory in self.directories.items():
+            yield from directory.walk_files(prefix + name + '/')
+
+    def find(self, relative: str) -> ScanNode | None:
+        """
+        Find subdirectory in the tree.
+        @param relative: relative path with '/' separators, empty for the node itself.
+        @return: node of the directory or None if not part of the tree.
+        """
+        node = self
+        for name in filter(None, relative.split('/')):
+            node = node.directories.get(name)
+            if node is None:
+                return None
+
+        return node
+
+    def aggregate(self) -> None:
+        """
+        Calculate totals of this node and all subdirectories.
+        @return: None.
+        """
+        self.size = sum(file.size for file in self.files.values())
+        self.file_count = len(self.files)
+        self.directory_count = len(self.directories)
+
+        for directory in self.directories.values():
+            directory.aggregate()
+            self.size += directory.size
+            self.file_count += directory.file_count
+            self.directory_count += directory.directory_count
+
+
+def scan_directory(node: ScanNode, path_filter: PathFilter = None, prefix: str = '') -> list[ScanNode]:
+    """
+    Scan single directory (not recursive) and fill node with its files and subdirectories. Type of the entry comes from
+    the directory listing itself, so only files and directories need to be stat'ed. Trash directories and entries
+    excluded by the filter are left out before they are stat'ed.
+    @param node: node of the directory to fill.
+    @param path_filter: include/exclude patterns of the tree.
+    @param prefix: path of the directory relative to the root of the filter, with '/' at the end unless empty.
+    @return: nodes of subdirectories that still need to be scanned.
+    """
+    with scandir(node.path) as it:
+        for entry in it:
+            if entry.is_dir(follow_symlinks=False):
+                if entry.name == TRASH_DIR_NAME or path_filter and path_filter.excluded(prefix + entry.name, True):
+                    continue
+                node.directories[entry.name] = ScanNode(entry.path, entry.name, entry.stat().st_mtime_ns)
+            elif entry.is_file():
+                if path_filter and path_filter.excluded(prefix + entry.name):
+                    continue
+                entry_stat = entry.stat()
+                node.files[entry.name] = ScanFile(
+                    entry.name, entry_stat.st_size, entry_stat.st_mtime_ns, entry_stat.st_ino
+                )
+
+    return list(node.directories.values())
+
+
+def scan(directory: str, workers: int = None, path_filter: PathFilter = None) -> ScanNode:
+    """
+    Scan the whole directory tree in one pass, subdirectories are scanned at the same time on a thread pool.
+    @param directory: root of the tree.
+    @param workers: amount of threads scanning at the same time, taken from config if not given.
+    @param path_filter: include/exclude patterns, excluded subtrees are pruned, nothing is excluded if not given.
+    @return: node of the root directory with totals calculated.
+    """
+    root = ScanNode(directory, path.basename(path.normpath(directory)), stat(directory).st_mtime_ns)
+    prefix = path_filter.relative(directory) if path_filter else ''
+    prefix = prefix + '/' if prefix else ''
+
+    with ThreadPoolExecutor(max_workers=max(1, int(workers or config.get('scan_workers')))) as executor:
+        pending = {executor.submit(scan_directory, root, path_filter, prefix): prefix}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                prefix = pending.pop(future)
+                for node in future.result():
+                    node_prefix = prefix + node.name + '/'
+                    pending[executor.submit(scan_directory, node, path_filter, node_prefix)] = node_prefix
+
+    root.aggregate()
+    return root
@@ -0,0 +1,242 @@
+from __future__ import annotations
+from dataclasses import dataclass, field
+from datetime import datetime
+from json import load as json_load, dumps as json_dumps
+from os import path, replace, scandir
+import os
+from time import perf_counter
+from typing import Iterator
+
+from src.providers.constants import BACKUP_MANIFEST_FILE_NAME, SCRUB_STATE_FILE_NAME, TRASH_DIR_NAME
+from src.providers.config import config
+from src.components.copier import file_checksum
+from src.components.instrumentation import ProgressTracker
+from src.components.jobs import JobContext
+from src.components.manifest import BackupManifest, to_system_path
+from src.components.profiling import profiled
+
+# reasons of scrub failures.
+SCRUB_MISMATCH = 'checksum mismatch'
+SCRUB_MISSING = 'missing'
+
+
+@dataclass
+class ScrubReport:
+    """
+    Data class with results of a single scrub run.
+    """
+    checked: int = 0
+    bytes: int = 0
+    skipped: int = 0  # files without stored checksum, copied before copies were verified
+    linked: int = 0  # hardlinks (unchanged files of snapshots) of files already checked in this cycle
+    seconds: float = 0
+    failures: dict[str, str] = field(default_factory=dict)  # path inside the target to the reason
+    finished_cycle: bool = False  # whole target was scrubbed, next run starts from the beginning
+
+    def __str__(self) -> str:
+        return 'Scrubbed %d files (%.1f MB) in %.1fs, %d hardlinks skipped, %d without checksum, %d failed%s' % (
+            self.checked, self.bytes / 1_000_000, self.seconds, self.linked, self.skipped, len(self.failures),
+            ', cycle finished' if self.finished_cycle else ''
+        )
+
+
+class BackupScrubber:
+    """
+    Re-hashes backed up files and compares them with checksums stored in manifests of the target, to find bit rot
+    before it is needed for a restore. Every run stops once its time or byte budget is spent and the position is kept
+    in a state file inside the target, so scrubbing a big target is spread over many short runs. Files are visited in
+    a stable order (album directories and their files sorted by path), failures found during a cycle are kept in the
+    state until the cycle finishes.
+
+    Target is walked lazily, directories before the saved position are not read, so a run spends its budget on hashing
+    rather than on listing the whole target. Files hardlinked from a snapshot to the next one share their data, every
+    hardlinked (device, inode) is hashed once per cycle, only those are remembered in the state.
+    """
+    target_dir: str
+    budget_seconds: float
+    budget_bytes: int
+    state_path: str
+
+    def __init__(self, target_dir: str, budget_seconds: float = None, budget_bytes: int = None):
+        """
+        @param target_dir: backup directory to scrub.
+        @param budget_seconds: time a run may take, taken from config if not given, 0 for no limit.
+        @param budget_bytes: amount of bytes a run may read, taken from config if not given, 0 for no limit.
+        """
+        self.target_dir = path.normpath(target_dir)
+        self.budget_seconds = float(config.get('scrub_budget_seconds') if budget_seconds is None else budget_seconds)
+        self.budget_bytes = int(config.get('scrub_budget_bytes') if budget_bytes is None else budget_bytes)
+        self.state_path = path.join(self.target_dir, SCRUB_STATE_FILE_NAME)
+
+    @profiled('scrub')
+    def process(self, context: JobContext = None, tracker: ProgressTracker = None) -> ScrubReport:
+        """
+        Scrub files from the position where the previous run stopped, until budget is spent or target is done.
+        @param context: context of the job, if run as one.
+        @param tracker: progress tracker, created (reporting to the job) if not given.
+        @return: report of this run, failures include those found by earlier runs of the same cycle.
+        """
+        tracker = tracker or ProgressTracker('scrub', context.progress if context is not None else None)
+        state = self.load_state()
+        report = ScrubReport(failures=dict(state['failures']))
+        position = tuple(state['position']) if state['position'] else None
+        checked = {tuple(pair) for pair in state['checked_inodes']}
+        started = perf_counter()
+
+        with tracker.phase('scrub'):
+            for album in self.__manifest_directories(position[0] if position is not None else None):
+                manifest = BackupManifest(to_system_path(self.target_dir, album) if album else self.target_dir)
+                if not manifest.load():
+                    continue
+
+                for relative in sorted(manifest.entries):
+                    if position is not None and album == position[0] and relative <= position[1]:
+                        continue
+
+                    if self.__budget_spent(report, started):
+                        report.seconds = perf_counter() - started
+                        self.save_state(position or ('', ''), report, checked)
+                        tracker.finish()
+                        return report
+
+                    if context is not None:
+                        context.check_cancelled()
+
+                    self.__scrub_file(album, relative, manifest.entries[relative].checksum, report, checked)
+                    position = (album, relative)
+                    tracker.advance(1, manifest.entries[relative].size, relative)
+
+        report.seconds = perf_counter() - started
+        report.finished_cycle = True
+        self.save_state(None, report)
+        tracker.finish()
+
+        return report
+
+    def load_state(self) -> dict:
+        """
+        @return: state of the scrub cycle, empty state if there is none yet.
+        """
+        state = {
+            'position': None, 'failures': {}, 'checked_inodes': [], 'cycle_started': None, 'last_cycle_finished': None
+        }
+        try:
+            with open(self.state_path) as json_file:
+                state.update(json_load(json_file))
+        except (OSError, ValueError):
+            pass  # broken state only means scrubbing from the beginning.
+
+        return state
+
+    def save_state(
+            self, position: tuple[str, str] | None, report: ScrubReport, checked: set[tuple[int, int]] = None
+    ) -> None:
+        """
+        Write state of the cycle, written to temporary file first so interrupted write does not corrupt it.
+        @param position: last scrubbed album and file, None once the cycle finished.
+        @param report: report of this run.
+        @param checked: (device, inode) pairs of hardlinked files hashed in this cycle.
+        @return: None.
+        """
+        previous = self.load_state()
+        now = datetime.now().isoformat(timespec='seconds')
+        state = {
+            'position': list(position) if position is not None else None,
+            'failures': report.failures if position is not None else {},
+            'checked_inodes': list(checked or ()) if position is not None else [],
+            'cycle_started': previous['cycle_started'] or now,
+            'last_cycle_finished': previous['last_cycle_finished'],
+            'last_cycle_failures': previous.get('last_cycle_failures', {}),
+            'last_run': now,
+        }
+        if position is None:
+            state['cycle_started'], state['last_cycle_finished'] = None, now
+            state['last_cycle_failures'] = report.failures
+
+        # written compactly, state is rewritten by every run and checked inodes of a big target take a lot of lines.
+        with open(self.state_path + '.tmp', 'w') as outfile:
+            outfile.write(json_dumps(state, separators=(',', ':')))
+
+        replace(self.state_path + '.tmp', self.state_path)
+
+    def __manifest_directories(self, start: str = None) -> Iterator[str]:
+        """
+        Walk the target depth first with directories sorted by name, subtrees that come before start are not read.
+        @param start: relative path of the directory to start from, None for the whole target.
+        @return: relative paths (empty for the target itself) of directories with a backup manifest, in walk order.
+        """
+        start_parts = start.split('/') if start else []
+
+        def walk(relative: str, parts: list[str]) -> Iterator[str]:
+            try:
+                with scandir(to_system_path(self.target_dir, relative) if relative else self.target_dir) as it:
+                    entries = sorted(it, key=lambda entry: entry.name)
+            except OSError:
+                return  # removed since listed, or not readable.
+
+            if parts >= start_parts and any(entry.name == BACKUP_MANIFEST_FILE_NAME for entry in entries):
+                yield relative
+
+            for entry in entries:
+                child = parts + [entry.name]
+                if entry.name == TRASH_DIR_NAME or not entry.is_dir(follow_symlinks=False):
+                    continue
+                if child < start_parts and start_parts[:len(child)] != child:
+                    continue  # whole subtree comes before start.
+                yield from walk('/'.join(child), child)
+
+        return walk('', [])
+
+    def __budget_spent(self, report: ScrubReport, started: float) -> bool:
+        """
+        @param report: report of this run.
+        @param started: time the run started at.
+        @return: True if run has to stop.
+        """
+        if self.budget_seconds and perf_counter() - started >= self.budget_seconds:
+            return True
+
+        return bool(self.budget_bytes and report.bytes >= self.budget_bytes)
+
+    def __scrub_file(
+            self, album: str, relative: str, checksum: str, report: ScrubReport, checked: set[tuple[int, int]]
+    ) -> None:
+        """
+        Hash single file and compare it with its stored checksum, unless its data was already hashed in this cycle.
+        @param album: relative path of the directory with manifest.
+        @param relative: relative path of the file inside the album.
+        @param checksum: stored checksum, file is skipped if empty.
+        @param report: to add results to.
+        @param checked: (device, inode) pairs of hardlinked files hashed in this cycle, hashed file is added if it is
+        hardlinked.
+        @return: None.
+        """
+        key = '%s/%s' % (album, relative) if album else relative
+        if not checksum:
+            report.skipped += 1
+            return
+
+        file_path = to_system_path(self.target_dir, key)
+        try:
+            file_descriptor = os.open(file_path, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+        except FileNotFoundError:
+            report.failures[key] = SCRUB_MISSING
+            return
+
+        try:
+            file_stat = os.fstat(file_descriptor)
+            if (file_stat.st_dev, file_stat.st_ino) in checked:
+                report.linked += 1
+                return
+            actual = file_checksum(file_descriptor)
+            report.bytes += file_stat.st_size
+            if file_stat.st_nlink > 1:  # only files with more names can be visited again.
+                checked.add((file_stat.st_dev, file_stat.st_ino))
+        finally:
+            os.close(file_descriptor)
+
+        report.checked += 1
+        if actual != checksum:
+            report.failures[key] = SCRUB_MISMATCH
+        else:
+            report.failures.pop(key, None)
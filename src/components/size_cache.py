@@ -0,0 +1,214 @@
+from __future__ import annotations
+from atexit import register as atexit_register
+from collections import OrderedDict
+from dataclasses import dataclass, astuple
+from json import load as json_load, dumps as json_dumps
+from os import path, scandir, stat, replace, sep
+from threading import Lock, RLock
+
+from src.providers.constants import TRASH_DIR_NAME
+from src.providers.config import config
+from src.components.path_filter import PathFilter
+
+
+@dataclass
+class DirSizeEntry:
+    """
+    Data class for cached values of a single directory. Only files directly inside the directory are counted, totals
+    of subdirectories come from their own entries.
+    """
+    mtime_ns: int
+    size: int
+    file_count: int
+    directories: list[str]
+    filter_key: str = ''  # key of the path filter the values were counted with
+
+
+class DirSizeCache:
+    """
+    Cache of directory sizes, keyed by path and validated by directory modification time. Directory mtime changes
+    when file is added, removed or renamed inside it, so for unchanged tree only directories are stat'ed, never the
+    files. Modification of file in place does not change the mtime, code that does so (tag writing, copying over
+    existing file) has to call invalidate().
+
+    Least recently used entries are evicted above max_entries. Cache can be kept on disk between runs.
+    """
+    max_entries: int
+    file_path: str | None
+
+    def __init__(self, max_entries: int, file_path: str = None):
+        """
+        @param max_entries: amount of directories to keep in the cache.
+        @param file_path: json file to keep cache in between runs, cache is kept in memory only if not given.
+        """
+        self.max_entries = max_entries
+        self.file_path = file_path
+        self.__entries = OrderedDict()
+        self.__lock = RLock()
+        self.__loaded = False
+        self.__changed = False
+
+    def get_size(self, directory: str, path_filter: PathFilter = None) -> int:
+        """
+        Get total size of the directory.
+        @param directory: to get size of.
+        @param path_filter: include/exclude patterns, excluded files and directories are not counted.
+        @return: size in bytes of all files in the directory and its subdirectories.
+        """
+        return self.get_totals(directory, path_filter)[0]
+
+    def get_totals(self, directory: str, path_filter: PathFilter = None, prefix: str = None) -> tuple[int, int]:
+        """
+        Get totals of the directory.
+        @param directory: to get totals of.
+        @param path_filter: include/exclude patterns, excluded files and directories are not counted.
+        @param prefix: path of the directory relative to the root of the filter, with '/' at the end unless empty.
+        @return: size in bytes and amount of files in the directory and its subdirectories.
+        """
+        self.__load()
+        if path_filter and prefix is None:
+            prefix = path_filter.relative(directory) or ''
+            prefix = prefix + '/' if prefix else ''
+
+        entry = self.__get_entry(path.normpath(directory), path_filter or None, prefix or '')
+        size, file_count = entry.size, entry.file_count
+        for name in entry.directories:
+            sub_size, sub_file_count = self.get_totals(
+                path.join(directory, name), path_filter, (prefix or '') + name + '/'
+            )
+            size += sub_size
+            file_count += sub_file_count
+
+        return size, file_count
+
+    def invalidate(self, directory: str) -> None:
+        """
+        Remove directory and all its subdirectories from the cache.
+        @param directory: to remove.
+        @return: None.
+        """
+        self.__load()
+
+        directory = path.normpath(directory)
+        with self.__lock:
+            for key in [key for key in self.__entries if key == directory or key.startswith(directory + sep)]:
+                del self.__entries[key]
+                self.__changed = True
+
+    def save(self) -> None:
+        """
+        Write cache to its file, if cache has a file and anything changed.
+        @return: None.
+        """
+        if not self.file_path or not self.__changed:
+            return
+
+        with self.__lock:
+            data = json_dumps({key: astuple(entry) for key, entry in self.__entries.items()})
+            self.__changed = False
+
+        with open(self.file_path + '.tmp', 'w') as outfile:
+            outfile.write(data)
+
+        replace(self.file_path + '.tmp', self.file_path)
+
+    def __get_entry(self, directory: str, path_filter: PathFilter | None, prefix: str) -> DirSizeEntry:
+        """
+        Get entry from the cache, reading directory again if it changed, is not cached or was counted with another
+        filter.
+        @param directory: normalized path of the directory.
+        @param path_filter: include/exclude patterns.
+        @param prefix: path of the directory relative to the root of the filter.
+        @return: up-to-date entry.
+        """
+        mtime_ns = stat(directory).st_mtime_ns
+        filter_key = path_filter.key if path_filter is not None else ''
+
+        with self.__lock:
+            entry = self.__entries.get(directory)
+            if entry is not None and entry.mtime_ns == mtime_ns and entry.filter_key == filter_key:
+                self.__entries.move_to_end(directory)
+                return entry
+
+        entry = DirSizeEntry(mtime_ns, 0, 0, [], filter_key)
+        with scandir(directory) as it:
+            for item in it:
+                is_dir = item.is_dir(follow_symlinks=False)
+                if path_filter is not None and path_filter.excluded(prefix + item.name, is_dir):
+                    continue
+                if is_dir:
+                    if item.name != TRASH_DIR_NAME:
+                        entry.directories.append(item.name)
+                elif item.is_file():
+                    entry.size += item.stat().st_size
+                    entry.file_count += 1
+
+        with self.__lock:
+            self.__entries[directory] = entry
+            self.__entries.move_to_end(directory)
+            while len(self.__entries) > self.max_entries:
+                self.__entries.popitem(last=False)
+            self.__changed = True
+
+        return entry
+
+    def __load(self) -> None:
+        """
+        Read cache from its file on first use.
+        @return: None.
+        """
+        if self.__loaded:
+            return
+
+        with self.__lock:
+            if self.__loaded:
+                return
+            self.__loaded = True
+
+            if not self.file_path or not path.isfile(self.file_path):
+                return
+
+            try:
+                with open(self.file_path) as json_file:
+                    data = json_load(json_file)
+            except (OSError, ValueError):
+                return  # broken cache is simply rebuilt.
+
+            for key, values in data.items():
+                self.__entries[key] = DirSizeEntry(*values)
+
+
+_dir_size_cache: DirSizeCache | None = None
+_dir_size_cache_lock = Lock()
+
+
+def get_dir_size_cache() -> DirSizeCache:
+    """
+    Shared cache of the app, created on first use (so importing it reads no config and writes no file), its file is
+    resolved against config directory and written on exit.
+    @return: the cache.
+    """
+    global _dir_size_cache
+    with _dir_size_cache_lock:
+        if _dir_size_cache is None:
+            _dir_size_cache = DirSizeCache(
+                int(config.get('size_cache_max_entries')), config.get_path('size_cache_file') or None
+            )
+            atexit_register(_dir_size_cache.save)
+
+    return _dir_size_cache
+
+
+def invalidate_dir_size(directory: str) -> None:
+    """
+    Remove directory from the shared cache, for changes that do not change directory mtime. Cache is not created just
+    for this, unless there is its file from an earlier run that can hold the directory.
+    @param directory: to remove, with all its subdirectories.
+    @return: None.
+    """
+    if _dir_size_cache is None:
+        file_path = config.get_path('size_cache_file')
+        if not file_path or not path.isfile(file_path):
+            return
+
+    get_dir_size_cache().invalidate(directory)
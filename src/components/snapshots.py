@@ -0,0 +1,72 @@
+from __future__ import annotations
+from datetime import datetime
+from os import listdir, makedirs, path, rename
+
+from src.providers.constants import SNAPSHOT_INCOMPLETE_SUFFIX
+
+# name of snapshot directories, sorts in time order.
+SNAPSHOT_NAME_FORMAT = '%Y-%m-%d_%H%M%S'
+
+
+def is_snapshot_name(name: str) -> bool:
+    """
+    @param name: name of a directory.
+    @return: True if it is name of a finished snapshot.
+    """
+    try:
+        datetime.strptime(name, SNAPSHOT_NAME_FORMAT)
+    except ValueError:
+        return False
+
+    return True
+
+
+def list_snapshots(directory: str) -> list[str]:
+    """
+    @param directory: directory holding the snapshots.
+    @return: paths of finished snapshots, oldest first.
+    """
+    if not path.isdir(directory):
+        return []
+
+    return [
+        path.join(directory, name) for name in sorted(listdir(directory))
+        if is_snapshot_name(name) and path.isdir(path.join(directory, name))
+    ]
+
+
+def latest_snapshot(directory: str) -> str | None:
+    """
+    @param directory: directory holding the snapshots.
+    @return: path of the newest finished snapshot, None if there is none.
+    """
+    snapshots = list_snapshots(directory)
+    return snapshots[-1] if snapshots else None
+
+
+def start_snapshot(directory: str) -> str:
+    """
+    Create directory for a new snapshot, or take over one left unfinished by an interrupted backup. Snapshot keeps the
+    incomplete suffix until finish_snapshot(), so it is never used as a base of later snapshots before that.
+    @param directory: directory holding the snapshots.
+    @return: path of the incomplete snapshot.
+    """
+    makedirs(directory, exist_ok=True)
+    for name in sorted(listdir(directory)):
+        if name.endswith(SNAPSHOT_INCOMPLETE_SUFFIX) and is_snapshot_name(name[:-len(SNAPSHOT_INCOMPLETE_SUFFIX)]):
+            return path.join(directory, name)
+
+    snapshot = path.join(directory, datetime.now().strftime(SNAPSHOT_NAME_FORMAT) + SNAPSHOT_INCOMPLETE_SUFFIX)
+    makedirs(snapshot)
+    return snapshot
+
+
+def finish_snapshot(snapshot: str) -> str:
+    """
+    Give finished snapshot its final name (time it was started at).
+    @param snapshot: path of the incomplete snapshot.
+    @return: path of the finished snapshot.
+    """
+    finished = snapshot[:-len(SNAPSHOT_INCOMPLETE_SUFFIX)]
+    rename(snapshot, finished)
+    return finished
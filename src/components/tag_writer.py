@@ -0,0 +1,153 @@
+from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from os import cpu_count
+
+from src.providers.config import config
+from src.components.instrumentation import ProgressTracker
+
+# MP4 atoms written by the app.
+TAG_TITLE = '\xa9nam'
+TAG_ALBUM = '\xa9alb'
+TAG_ARTIST = '\xa9ART'
+TAG_YEAR = '\xa9day'
+TAG_GENRE = '\xa9gen'
+
+# below this amount of writes starting worker processes costs more than it saves.
+PROCESS_POOL_THRESHOLD = 4
+
+
+@dataclass
+class TagBatchReport:
+    """
+    Data class with results of the batch tag writing.
+    """
+    written: list[str] = field(default_factory=list)
+    skipped: list[str] = field(default_factory=list)  # files that already had the tags
+    failed: dict[str, str] = field(default_factory=dict)  # file path to the reason
+
+    def __str__(self) -> str:
+        return 'Tags written to %d files, %d already up to date, %d failed' % (
+            len(self.written), len(self.skipped), len(self.failed)
+        )
+
+
+def read_file_tags(file_path: str) -> dict[str, list]:
+    """
+    Read current tags of the file, file is closed once read.
+    @param file_path: m4a file.
+    @return: dictionary of atom name to its values, empty if file has no tags.
+    """
+    from mutagen.mp4 import MP4  # imported on first use, so modules using the writer start fast.
+
+    tags = MP4(file_path).tags
+    return dict(tags) if tags is not None else {}
+
+
+def tags_match(current: dict[str, list], tags: dict[str, list]) -> bool:
+    """
+    Check if file already has all the given tags.
+    @param current: tags that file has.
+    @param tags: tags to write.
+    @return: True if there is nothing to write.
+    """
+    return all(current.get(name) == values for name, values in tags.items())
+
+
+def write_file_tags(file_path: str, tags: dict[str, list]) -> bool:
+    """
+    Write tags to the file. Runs in worker process, so it only gets and returns plain values.
+    @param file_path: m4a file.
+    @param tags: dictionary of atom name to its values.
+    @return: True if file was written, False if it already had the tags.
+    """
+    from mutagen.mp4 import MP4
+
+    audio = MP4(file_path)
+    if audio.tags is None:
+        audio.add_tags()
+
+    if tags_match(dict(audio.tags), tags):
+        return False
+
+    audio.tags.update(tags)
+    audio.save()
+
+    return True
+
+
+def write_tags(
+        files: dict[str, dict[str, list]], workers: int = None, tracker: ProgressTracker = None
+) -> TagBatchReport:
+    """
+    Write tags to many files. Current tags are read first (on threads) and files that already have them are skipped,
+    the rest are written on a process pool.
+    @param files: dictionary of file path to tags to write into it.
+    @param workers: amount of worker processes, taken from config (or amount of CPUs) if not given.
+    @param tracker: progress tracker, every file is reported once written, skipped or failed.
+    @return: report of written, skipped and failed files.
+    """
+    report = TagBatchReport()
+    workers = max(1, int(workers or config.get('tag_writer_workers') or cpu_count() or 1))
+    tracker = tracker or ProgressTracker('tags')
+    tracker.add_totals(len(files))
+
+    pending = []
+    with tracker.phase('read'):
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {file_path: executor.submit(read_file_tags, file_path) for file_path in files}
+
+        for file_path, future in futures.items():
+            try:
+                current = future.result()
+            except Exception as e:
+                report.failed[file_path] = str(e)
+                tracker.advance(item=file_path)
+                continue
+
+            if tags_match(current, files[file_path]):
+                report.skipped.append(file_path)
+                tracker.advance(item=file_path)
+            else:
+                pending.append(file_path)
+
+    with tracker.phase('write'):
+        if len(pending) < PROCESS_POOL_THRESHOLD or workers == 1:
+            results = {}
+            for file_path in pending:
+                results[file_path] = _call(write_file_tags, file_path, files[file_path])
+                tracker.advance(item=file_path)
+        else:
+            from concurrent.futures import ProcessPoolExecutor, as_completed  # pulls in multiprocessing.
+
+            with ProcessPoolExecutor(max_workers=min(workers, len(pending))) as executor:
+                futures = {
+                    executor.submit(write_file_tags, file_path, files[file_path]): file_path for file_path in pending
+                }
+                for future in as_completed(futures):
+                    tracker.advance(item=futures[future])
+            results = {file_path: _call(future.result) for future, file_path in futures.items()}
+
+    for file_path, (written, error) in results.items():
+        if error is not None:
+            report.failed[file_path] = error
+        elif written:
+            report.written.append(file_path)
+        else:
+            report.skipped.append(file_path)
+
+    tracker.finish()
+    return report
+
+
+def _call(function, *args) -> tuple[any, str | None]:
+    """
+    Call function and catch its error.
+    @param function: to call.
+    @param args: arguments for the function.
+    @return: result and error message (if any).
+    """
+    try:
+        return function(*args), None
+    except Exception as e:
+        return None, str(e)
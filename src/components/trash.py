@@ -0,0 +1,272 @@
+from __future__ import annotations
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from errno import EXDEV
+from json import loads as json_loads, dumps as json_dumps
+from os import lstat, makedirs, path, rename, replace, rmdir, scandir, unlink
+from shutil import rmtree
+from stat import S_ISDIR
+from threading import Lock
+from time import time
+from uuid import uuid4
+
+from src.providers.constants import TRASH_DIR_NAME
+from src.providers.config import config
+
+TRASH_INDEX_FILE_NAME = 'index.jsonl'
+
+_executor_lock = Lock()
+_executor: ThreadPoolExecutor | None = None
+
+
+@dataclass
+class TrashEntry:
+    """
+    Data class for a single staged file or folder.
+    """
+    name: str  # name inside the trash directory
+    origin: str  # path it was deleted from
+    deleted_at: float  # unix time
+    size: int = 0
+
+
+class Trash:
+    """
+    Staging trash of a directory. Deleted files and folders are renamed into the trash directory inside it, which is
+    instant however big the tree is and can be undone with restore(). Staged trees are removed later by purge(), on a
+    background pool shared by all trashes, once they are older than trash_max_age_days or don't fit trash_max_bytes
+    (oldest go first).
+
+    Rename only works on the same filesystem, anything that can not be renamed (another mount inside the directory) is
+    deleted right away, as it is with trash turned off (trash_enabled).
+
+        <directory>/.music_backuper_trash/index.jsonl
+        <directory>/.music_backuper_trash/<YYYYmmdd-HHMMSS>-<random>-<name>
+
+    Index line is written before the rename, so items without one are left from an interrupted purge and are removed.
+    """
+    directory: str
+    enabled: bool
+    max_age: float
+    max_bytes: int
+
+    def __init__(self, root_dir: str, max_age_days: float = None, max_bytes: int = None, enabled: bool = None):
+        """
+        Nothing is created until the first deletion.
+        @param root_dir: directory whose files are deleted, trash is kept inside it.
+        @param max_age_days: staged items older than this are purged, taken from config if not given, 0 for no limit.
+        @param max_bytes: oldest items are purged until the rest fit, taken from config if not given, 0 for no limit.
+        @param enabled: stage deleted items, taken from config if not given, deleted right away if False.
+        """
+        self.directory = path.join(path.normpath(root_dir), TRASH_DIR_NAME)
+        self.enabled = bool(config.get('trash_enabled') if enabled is None else enabled)
+        self.max_age = float(config.get('trash_max_age_days') if max_age_days is None else max_age_days) * 86400
+        self.max_bytes = int(config.get('trash_max_bytes') if max_bytes is None else max_bytes)
+        self.index_path = path.join(self.directory, TRASH_INDEX_FILE_NAME)
+        self.__lock = Lock()
+
+    def delete(self, delete_path: str, size: int = None) -> bool:
+        """
+        Move file or folder to the trash.
+        @param delete_path: file or folder to delete.
+        @param size: of the file or folder, a single lstat is made for files if not given (folders count as empty).
+        @return: False if there was nothing to delete.
+        """
+        if not self.enabled:
+            return delete_now(delete_path)
+
+        if size is None:
+            try:
+                file_stat = lstat(delete_path)
+            except FileNotFoundError:
+                return False
+            size = 0 if S_ISDIR(file_stat.st_mode) else file_stat.st_size
+
+        entry = TrashEntry(
+            '%s-%s-%s' % (datetime.now().strftime('%Y%m%d-%H%M%S'), uuid4().hex[:8], path.basename(delete_path)),
+            path.abspath(delete_path), time(), size
+        )
+        with self.__lock:
+            makedirs(self.directory, exist_ok=True)
+            with open(self.index_path, 'a') as index_file:
+                index_file.write(json_dumps(asdict(entry)) + '\n')
+
+        try:
+            rename(delete_path, path.join(self.directory, entry.name))
+        except FileNotFoundError:
+            return False
+        except OSError as e:
+            if e.errno != EXDEV:
+                raise
+            return delete_now(delete_path)  # another filesystem, its line is dropped by the next purge.
+
+        return True
+
+    def entries(self) -> list[TrashEntry]:
+        """
+        @return: staged items, oldest first.
+        """
+        try:
+            with open(self.index_path) as index_file:
+                lines = index_file.readlines()
+        except FileNotFoundError:
+            return []
+
+        entries = []
+        for line in lines:
+            try:
+                entries.append(TrashEntry(**json_loads(line)))
+            except (TypeError, ValueError):
+                continue  # last line may be half-written.
+
+        return sorted(entries, key=lambda entry: entry.deleted_at)
+
+    def expired(self, now: float = None) -> list[TrashEntry]:
+        """
+        @param now: current unix time.
+        @return: staged items to purge according to the age and size policy.
+        """
+        now = time() if now is None else now
+        entries = self.entries()
+        expired = [entry for entry in entries if self.max_age and now - entry.deleted_at > self.max_age]
+
+        kept = entries[len(expired):]
+        total = sum(entry.size for entry in kept)
+        while kept and self.max_bytes and total > self.max_bytes:
+            total -= kept[0].size
+            expired.append(kept.pop(0))
+
+        return expired
+
+    def restore(self, name: str) -> str:
+        """
+        Move staged item back to where it was deleted from.
+        @param name: of the item inside the trash.
+        @return: path the item was restored to.
+        """
+        entry = next((entry for entry in self.entries() if entry.name == name), None)
+        if entry is None or not path.lexists(path.join(self.directory, name)):
+            raise FileNotFoundError('%s is not in %s' % (name, self.directory))
+        if path.lexists(entry.origin):
+            raise FileExistsError('%s already exists' % entry.origin)
+
+        makedirs(path.dirname(entry.origin), exist_ok=True)
+        rename(path.join(self.directory, name), entry.origin)
+        self.__forget({name})
+
+        return entry.origin
+
+    def purge(self, entries: list[TrashEntry] = None) -> list[Future]:
+        """
+        Remove staged items on the background pool, big folders are split into their subfolders so they are removed in
+        parallel too. Items are dropped from the index right away.
+        @param entries: items to remove, expired ones if not given.
+        @return: futures of the removals, to wait for if needed.
+        """
+        if not path.isdir(self.directory):
+            return []
+
+        # listing is taken before the index, so every item in it that was staged properly has its line by now. Lines
+        # without item are from failed renames, unless they are recent (item may be being renamed right now).
+        listed = time()
+        with scandir(self.directory) as it:
+            items = {entry.name for entry in it if not entry.name.startswith(TRASH_INDEX_FILE_NAME)}
+        known = {entry.name: entry for entry in self.entries()}
+        names = {entry.name for entry in (self.expired() if entries is None else entries)}
+        names = (names & items) | (items - set(known))
+        self.__forget(names | {name for name in set(known) - items if known[name].deleted_at < listed - 60})
+
+        futures = []
+        for name in sorted(names):
+            item = path.join(self.directory, name)
+            if not path.isdir(item) or path.islink(item):
+                futures.append(_submit(delete_now, item))
+                continue
+
+            with scandir(item) as it:
+                futures.append(_remove_parts(item, [entry.path for entry in it]))
+
+        return futures
+
+    def __forget(self, names: set[str]) -> None:
+        """
+        Drop lines of the items from the index, written to temporary file first so interrupted write does not corrupt
+        it.
+        @param names: of the items.
+        @return: None.
+        """
+        if not names:
+            return
+
+        with self.__lock:
+            entries = [entry for entry in self.entries() if entry.name not in names]
+            with open(self.index_path + '.tmp', 'w') as index_file:
+                index_file.writelines(json_dumps(asdict(entry)) + '\n' for entry in entries)
+            replace(self.index_path + '.tmp', self.index_path)
+
+
+def delete_now(delete_path: str) -> bool:
+    """
+    Delete file or folder right away, with a single lstat.
+    @param delete_path: file or folder to delete.
+    @return: False if there was nothing to delete.
+    """
+    try:
+        file_stat = lstat(delete_path)
+    except FileNotFoundError:
+        return False
+
+    if S_ISDIR(file_stat.st_mode):
+        rmtree(delete_path)
+    else:
+        unlink(delete_path)
+
+    return True
+
+
+def _remove_parts(item: str, parts: list[str]) -> Future:
+    """
+    Remove staged folder, its files and subfolders are removed on the pool and folder itself once the last of them is
+    gone (nothing waits on the pool, so it never runs out of workers).
+    @param item: staged folder.
+    @param parts: paths of its files and subfolders.
+    @return: future finished once the folder is removed.
+    """
+    removed, lock, remaining = Future(), Lock(), [len(parts)]
+
+    def remove_folder(_: Future = None) -> None:
+        with lock:
+            remaining[0] -= 1
+            if remaining[0] > 0:
+                return
+        try:
+            rmdir(item)
+            removed.set_result(None)
+        except OSError as e:
+            removed.set_exception(e)
+
+    if not parts:
+        remaining[0] = 1
+        remove_folder()
+    for part in parts:
+        _submit(delete_now, part).add_done_callback(remove_folder)
+
+    return removed
+
+
+def _submit(function, *args) -> Future:
+    """
+    Submit removal to the pool shared by all trashes, created on first use.
+    @param function: to run.
+    @param args: arguments of the function.
+    @return: future of the removal.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=max(2, int(config.get('trash_purge_workers'))), thread_name_prefix='trash'
+            )
+
+    return _executor.submit(function, *args)
@@ -1,11 +1,13 @@
+from __future__ import annotations
 from abc import ABC, abstractmethod
-from typing import List
+from typing import List, TYPE_CHECKING
 from dataclasses import dataclass, field
 from os import path
-from tkinter import Entry, Label
 
 from src.providers.language import translate as __
-from src.providers.element import quick_element as qe
+
+if TYPE_CHECKING:
+    from tkinter import Entry, Label
 
 
 @dataclass
@@ -111,6 +113,8 @@ def validate_input(entry_input: Entry, error_label: Label, rules: List[AbstractV
     @param rules: array of AbstractValidatorRule objects that will validate the value.
     @return: True or False depending on if there is any errors or not.
     """
+    from src.providers.element import quick_element as qe  # imports tkinter, only needed by the window.
+
     result = validate(entry_input.get(), rules)
 
     # if there is no validation problems, hide the label and return positive result
@@ -0,0 +1,324 @@
+from __future__ import annotations
+import ctypes
+import ctypes.util
+import os
+from dataclasses import dataclass, field
+from errno import EINTR
+from os import path, scandir
+from select import select
+from struct import calcsize, unpack_from
+from time import monotonic, sleep
+from typing import Iterator
+
+from src.providers.constants import TRASH_DIR_NAME
+from src.components.manifest import BOOKKEEPING_FILE_NAMES
+from src.components.path_filter import PathFilter
+from src.components.copier import is_temporary_path
+from src.components.scanner import scan
+
+# inotify event flags, from linux/inotify.h.
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+# file writes are reported once closed, not on every write.
+WATCH_MASK = (
+    IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+)
+EVENT_HEADER = 'iIII'  # watch descriptor, mask, cookie, length of the name
+
+
+class WatchUnavailable(Exception):
+    """
+    Raised when inotify can not be used (not Linux, or out of watches), polling is used instead.
+    """
+    pass
+
+
+def album_of(root_dir: str, changed_path: str) -> str | None:
+    """
+    Find album a changed path belongs to, albums are directories directly inside the library.
+    @param root_dir: library directory.
+    @param changed_path: path of the changed file or directory.
+    @return: path of the album, None for changes of the library directory itself.
+    """
+    relative = path.relpath(changed_path, root_dir)
+    if relative == '.' or relative.startswith('..'):
+        return None
+
+    return path.join(root_dir, relative.split(path.sep)[0])
+
+
+@dataclass
+class DirtyAlbums:
+    """
+    Debounces changes into album sets: album is due once it had no changes for debounce seconds (so a whole album
+    being copied or tagged is backed up once), or once it was dirty for max_delay seconds even if it keeps changing.
+    """
+    debounce: float
+    max_delay: float
+    first_change: dict[str, float] = field(default_factory=dict)
+    last_change: dict[str, float] = field(default_factory=dict)
+
+    def add(self, album: str, now: float = None) -> None:
+        """
+        @param album: changed album.
+        @param now: time of the change.
+        @return: None.
+        """
+        now = monotonic() if now is None else now
+        self.first_change.setdefault(album, now)
+        self.last_change[album] = now
+
+    def pop_due(self, now: float = None) -> set[str]:
+        """
+        @param now: current time.
+        @return: albums that are due, they are removed from the set.
+        """
+        now = monotonic() if now is None else now
+        due = {
+            album for album, last in self.last_change.items()
+            if now - last >= self.debounce or now - self.first_change[album] >= self.max_delay
+        }
+        for album in due:
+            del self.first_change[album], self.last_change[album]
+
+        return due
+
+    def __len__(self) -> int:
+        return len(self.last_change)
+
+
+class InotifyWatcher:
+    """
+    Watches the whole library with Linux inotify (through libc, no extra dependency). Every directory gets a watch,
+    new directories are watched as they appear, so the library is never scanned again after start.
+    """
+    root_dir: str
+
+    def __init__(self, root_dir: str, path_filter: PathFilter = None):
+        """
+        @param root_dir: library directory.
+        @param path_filter: include/exclude patterns, excluded directories are not watched.
+        """
+        self.root_dir = path.normpath(root_dir)
+        self.path_filter = path_filter
+        self.__libc = self.__load_libc()
+        self.__fd = self.__libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.__fd < 0:
+            raise WatchUnavailable(os.strerror(self.__get_errno()))
+
+        self.__directories = {}
+        for directory in self.__walk_directories(self.root_dir):
+            self.__add_watch(directory)
+
+    def changes(self, timeout: float) -> set[str]:
+        """
+        Wait for changes.
+        @param timeout: seconds to wait for the first change.
+        @return: changed paths, the library directory itself if events were lost (everything has to be checked).
+        """
+        try:
+            readable, _, _ = select([self.__fd], [], [], timeout)
+        except InterruptedError:
+            return set()
+        if not readable:
+            return set()
+
+        changed = set()
+        try:
+            data = os.read(self.__fd, 64 * 1024)
+        except BlockingIOError:
+            return changed
+
+        offset, header_size = 0, calcsize(EVENT_HEADER)
+        while offset < len(data):
+            watch, mask, _, length = unpack_from(EVENT_HEADER, data, offset)
+            name = os.fsdecode(data[offset + header_size:offset + header_size + length].rstrip(b'\0'))
+            offset += header_size + length
+
+            if mask & IN_Q_OVERFLOW:
+                changed.add(self.root_dir)
+                continue
+            if mask & IN_IGNORED:
+                self.__directories.pop(watch, None)
+                continue
+
+            directory = self.__directories.get(watch)
+            if directory is None:
+                continue
+
+            changed_path = path.join(directory, name) if name else directory
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                for new_directory in self.__walk_directories(changed_path):
+                    self.__add_watch(new_directory)
+            if not is_ignored(changed_path, self.path_filter):
+                changed.add(changed_path)
+
+        return changed
+
+    def close(self) -> None:
+        """
+        @return: None.
+        """
+        os.close(self.__fd)
+
+    def __add_watch(self, directory: str) -> None:
+        """
+        @param directory: to watch.
+        @return: None.
+        """
+        watch = self.__libc.inotify_add_watch(self.__fd, os.fsencode(directory), WATCH_MASK)
+        if watch < 0:
+            errno = self.__get_errno()
+            if errno == EINTR or not path.isdir(directory):
+                return  # directory is already gone.
+            raise WatchUnavailable('%s: %s (see fs.inotify.max_user_watches)' % (directory, os.strerror(errno)))
+
+        self.__directories[watch] = directory
+
+    def __walk_directories(self, directory: str) -> Iterator[str]:
+        """
+        @param directory: to start from.
+        @return: iterator of the directory and all its subdirectories.
+        """
+        directories = [directory]
+        while directories:
+            current = directories.pop()
+            yield current
+            try:
+                with scandir(current) as it:
+                    directories.extend(
+                        entry.path for entry in it
+                        if entry.is_dir(follow_symlinks=False) and not is_ignored(entry.path, self.path_filter, True)
+                    )
+            except OSError:
+                pass
+
+    def __get_errno(self) -> int:
+        """
+        @return: errno of the last libc call.
+        """
+        return ctypes.get_errno()
+
+    @staticmethod
+    def __load_libc():
+        """
+        @return: libc with inotify functions.
+        """
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+            libc.inotify_init1, libc.inotify_add_watch
+        except (OSError, AttributeError) as e:
+            raise WatchUnavailable(str(e))
+
+        return libc
+
+
+class PollingWatcher:
+    """
+    Fallback for systems without inotify: scans the library every interval (directories and file metadata only, on
+    the scanner thread pool) and reports albums whose files differ from the previous scan.
+    """
+    root_dir: str
+    interval: float
+
+    def __init__(self, root_dir: str, interval: float, path_filter: PathFilter = None):
+        """
+        @param root_dir: library directory.
+        @param interval: seconds between scans.
+        @param path_filter: include/exclude patterns of the scans.
+        """
+        self.root_dir = path.normpath(root_dir)
+        self.interval = interval
+        self.path_filter = path_filter
+        self.__signatures = self.__scan()
+        self.__next_scan = monotonic() + interval
+
+    def changes(self, timeout: float) -> set[str]:
+        """
+        Wait for the next scan, if it is due within the timeout.
+        @param timeout: seconds to wait.
+        @return: changed albums.
+        """
+        wait = self.__next_scan - monotonic()
+        if wait > timeout:
+            sleep(timeout)
+            return set()
+        if wait > 0:
+            sleep(wait)
+
+        signatures = self.__scan()
+        self.__next_scan = monotonic() + self.interval
+        changed = {
+            album for album in set(signatures) | set(self.__signatures)
+            if signatures.get(album) != self.__signatures.get(album)
+        }
+        self.__signatures = signatures
+
+        return changed
+
+    def close(self) -> None:
+        """
+        @return: None.
+        """
+        pass
+
+    def __scan(self) -> dict[str, int]:
+        """
+        @return: dictionary of album path to hash of its files' metadata.
+        """
+        return {
+            node.path: hash(tuple(
+                (relative, file.size, file.mtime_ns) for relative, file in node.walk_files()
+                if not is_ignored(relative)
+            ))
+            for node in scan(self.root_dir, path_filter=self.path_filter).directories.values()
+        }
+
+
+def is_ignored(changed_path: str, path_filter: PathFilter = None, is_dir: bool = False) -> bool:
+    """
+    @param changed_path: path of the change.
+    @param path_filter: include/exclude patterns of the library.
+    @param is_dir: path is a directory.
+    @return: True for files written by the backup itself (if backup is made inside the library), for trash and for
+    paths excluded by the filter.
+    """
+    name = path.basename(changed_path)
+    if name in BOOKKEEPING_FILE_NAMES or is_temporary_path(name) or TRASH_DIR_NAME in changed_path.split(path.sep):
+        return True
+    if not path_filter:
+        return False
+
+    relative = path_filter.relative(changed_path)
+    return bool(relative) and path_filter.excludes(relative, is_dir)
+
+
+def create_watcher(
+        root_dir: str, poll_interval: float, polling: bool = False, path_filter: PathFilter = None
+) -> InotifyWatcher | PollingWatcher:
+    """
+    @param root_dir: library directory.
+    @param poll_interval: seconds between scans of the polling watcher.
+    @param polling: use polling even if inotify is available.
+    @param path_filter: include/exclude patterns of the library, changes of excluded paths are not reported.
+    @return: inotify watcher where possible, polling watcher otherwise.
+    """
+    if not polling:
+        try:
+            return InotifyWatcher(root_dir, path_filter)
+        except WatchUnavailable as e:
+            print('Watching with inotify is not possible (%s), polling every %ds' % (e, poll_interval))
+
+    return PollingWatcher(root_dir, poll_interval, path_filter)
@@ -1,4 +1,4 @@
-from os.path import isfile
+from os.path import abspath, isfile, join
 from json import load as json_load, dumps as json_dumps
 
 from src.providers.constants import *
@@ -14,21 +14,76 @@ class __ConfigProvider:
         # marked with * are variables that do not apper in config window therefore not configurable in app.
         'language': 'en',
         'theme': THEME_DEFAULT_NAME,
-        'yt_downloader_chapter_format_start': 'chapter:downloaded_music\\working\\',  # *
+        'yt_downloader_chapter_format_start': 'chapter:{working_dir}\\downloaded_music\\working\\',  # *
         'yt_downloader_chapter_format': '%(section_number)s. %(section_title)s.%(ext)s',
-        'yt_downloader_dpl_command_start': "additional_tools\\yt-dlp -f 139 -o \"tmp\\processing.%(ext)s\" {link}",  # *
-        'yt_downloader_dpl_command': "--split-chapters -o \"{chapter_format}\" --embed-thumbnail --write-info-json"
+        'yt_downloader_dpl_command_start':
+            "additional_tools\\yt-dlp -f 139 -o \"{working_dir}\\tmp\\processing.%(ext)s\" {link}",  # *
+        'yt_downloader_dpl_command': "--split-chapters -o \"{chapter_format}\" --embed-thumbnail --write-info-json",
+        'yt_downloader_concurrency': 3,  # *
+        'job_workers': 2,  # *
+        'backup_copy_workers': 4,  # *
+        'scan_workers': 8,  # *
+        'scan_exclude': [".DS_Store", "._*", "Thumbs.db", "desktop.ini", "*.log", "downloaded_music/working/"],  # *
+        'size_cache_max_entries': 100000,  # *
+        'size_cache_file': 'size_cache.json',  # * empty to keep directory sizes in memory only
+        'tag_writer_workers': 0,  # * 0 for amount of CPUs
+        'library_index_file': 'library.sqlite',  # * next to config.json unless absolute
+        'library_index_refresh': True,  # * refresh library index after backups and tag writes
+        'backup_copy_strategy': 'auto',  # * auto, reflink, copy_file_range, sendfile or buffered (see CopyEngine)
+        'backup_copy_fsync': True,  # * flush every copy to the disk before renaming it to its final name
+        'backup_copy_verify': True,  # * hash source while copying and read the copy back from the disk to check it
+        'backup_schedule_order': 'inode',  # * inode, extent (physical position, linux only) or none
+        'backup_large_file_bytes': 64_000_000,  # * bigger files are copied after the small ones, 0 for one batch
+        'backup_large_file_workers': 1,  # * threads copying large files
+        'backup_bandwidth_limit': 0,  # * bytes per second, 0 for no limit
+        'backup_snapshots': False,  # * back up to dated snapshots with unchanged files hardlinked to previous one
+        'backup_store': False,  # * back up to content-addressed store keeping every distinct file once
+        'clean_delete_rules': ["Covers", "Cover", "Artwork", "Scans"],  # * prefixes, globs, regexes, see RuleSet
+        'clean_skip_rules': ["Disc 1", "Disc 2", "Disc 3", "CD1", "CD2", "CD3", "CD 1", "CD 2", "CD 3"],  # *
+        'trash_enabled': True,  # * move deleted files to trash of the directory instead of deleting them right away
+        'trash_max_age_days': 7,  # * 0 for no limit
+        'trash_max_bytes': 10_000_000_000,  # * oldest items are purged until trash fits, 0 for no limit
+        'trash_purge_workers': 4,  # *
+        'watch_debounce_seconds': 30,  # * album is backed up once it had no changes for this long
+        'watch_max_delay_seconds': 300,  # * album that keeps changing is backed up after this long anyway
+        'watch_poll_interval': 120,  # * seconds between scans where inotify is not available
+        'scrub_budget_seconds': 600,  # * 0 for no limit
+        'scrub_budget_bytes': 0,  # * 0 for no limit
+        'profiling': False,  # * also enabled by PROFILING_ENV_VARIABLE
+        'profiling_dir': 'profiles',  # *
     }
 
     def __init__(self):
         """
-        Creates a new config (writes to json file) if not existent. Then loads from json file configuration for the app.
+        Nothing is read or written on creation, so importing config is free of side effects (command line runs do not
+        create config file). Json file is read on first access and created on first change.
         """
-        path = './' + self.__config_default_name
-        if not isfile(path):
-            self.__write_to_file(self.__config_default)
+        self.__loaded = False
+        self.__directory = None
 
-        self.__read_from_file()
+    @property
+    def directory(self) -> str:
+        """
+        @return: absolute path of the directory config file is read from and written to (working directory of the
+        first access), files named in config are kept there too.
+        """
+        self.__ensure_loaded()
+        return self.__directory
+
+    def __ensure_loaded(self) -> None:
+        """
+        Loads configuration for the app from json file, or default configuration if file does not exist yet.
+        @return: None.
+        """
+        if self.__loaded:
+            return
+
+        self.__loaded = True
+        self.__directory = abspath('.')
+        if isfile(join(self.__directory, self.__config_default_name)):
+            self.__read_from_file()
+        else:
+            self.__config = dict(self.__config_default)
 
     def get(self, name: str, default: any = None) -> any:
         """
@@ -37,6 +92,7 @@ class __ConfigProvider:
         @param default: in case name does not exist in config/default_config.
         @return: value from config, default config or default given value.
         """
+        self.__ensure_loaded()
         if name in self.__config:
             return self.__config[name]
 
@@ -45,6 +101,24 @@ class __ConfigProvider:
 
         return default
 
+    def get_path(self, name: str) -> str:
+        """
+        Get file path from config, relative path is resolved against config directory, so it does not depend on the
+        working directory of the run.
+        @param name: key of the config value.
+        @return: absolute path, empty if value is empty.
+        """
+        value = self.get(name)
+        return join(self.directory, value) if value else ''
+
+    def get_default(self, name: str) -> any:
+        """
+        Get default value of the config, ignoring value from json file.
+        @param name: key of the config value.
+        @return: default value or None if there is no default.
+        """
+        return self.__config_default.get(name)
+
     def set(self, name: str, value: any, write_to_file: bool = True) -> None:
         """
         Set value to config and write config to file unless specified not to.
@@ -53,6 +127,7 @@ class __ConfigProvider:
         @param value: config value.
         @return: None.
         """
+        self.__ensure_loaded()
         self.__config[name] = value
 
         if write_to_file:
@@ -63,7 +138,7 @@ class __ConfigProvider:
         Reads from json file to config variable
         @return: None.
         """
-        with open(self.__config_default_name) as json_file:
+        with open(join(self.__directory, self.__config_default_name)) as json_file:
             self.__config = json_load(json_file)
 
     def __write_to_file(self, config_json: dict) -> None:
@@ -72,7 +147,7 @@ class __ConfigProvider:
         @param config_json: dictionary config to write
         @return: None.
         """
-        with open(self.__config_default_name, "w") as outfile:
+        with open(join(self.__directory, self.__config_default_name), "w") as outfile:
             json_config = json_dumps(config_json, indent=4)
             outfile.write(json_config)
 
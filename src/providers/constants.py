@@ -9,3 +9,15 @@ THEME_NIGHT_NAME = 'default_night'
 CONFIG_KEY_BACKUPPER_PATH_FROM = "backupper_remembered_path_from"
 CONFIG_KEY_BACKUPPER_PATH_TO = "backupper_remembered_path_to"
 CONFIG_KEY_DOWNLOADER_LINK = "yt_downloader_remembered_link"
+
+# backup related
+BACKUP_MANIFEST_FILE_NAME = ".backup_manifest.json"
+BACKUP_JOURNAL_FILE_NAME = ".backup_journal.jsonl"
+BACKUP_TEMPORARY_SUFFIX = ".partial"
+SCRUB_STATE_FILE_NAME = ".scrub_state.json"
+SNAPSHOT_INCOMPLETE_SUFFIX = ".incomplete"
+TRASH_DIR_NAME = ".music_backuper_trash"
+SCAN_IGNORE_FILE_NAME = ".backupignore"
+
+# profiling related
+PROFILING_ENV_VARIABLE = "MUSIC_BACKUPER_PROFILE"
@@ -10,7 +10,17 @@ class __LanguageProvider:
         'root_window.title': "SLT v1.0.0",
         'root_window.clean_and_backup': "Clean up folders and back them up to external hard-drive",
 
-        'root_window.download_yt_album': "Download youtube album and split it to m4a files"
+        'root_window.download_yt_album': "Download youtube album and split it to m4a files",
+
+        'downloader.failed': "Download failed (exit code %s)",
+
+        'clean_review_window.title': "Review folders",
+        'clean_review_window.select': "Select folders to delete, the rest is kept",
+
+        'jobs.backup': "Backup",
+        'jobs.clean': "Clean up",
+        'jobs.clean_plan': "Clean up plan",
+        'jobs.tags': "Tags of %s",
     }
 
     ua = {
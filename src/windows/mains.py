@@ -4,12 +4,20 @@ from typing import Callable
 from functools import partial
 from webbrowser import open_new
 from tkinter import Tk, Toplevel, Menu, Frame, Entry, Button
+from tkinter.ttk import Progressbar
 
 from src.providers.constants import *
 from src.providers.config import config
 from src.providers.language import translate as __
 from src.providers.element import quick_element as qe, random_color
-from src.components.processors import ComponentProcessorDownloader
+from src.windows.popups import WindowCleanReview
+from src.components.clean_plan import CleanPlan
+from src.components.processors import (
+    ComponentProcessorDownloader, ComponentProcessorBackupper, ComponentProcessorCleaner
+)
+from src.components.validator import validate_input, NotEmptyRule, PathExistsRule
+from src.components.jobs import JobRunner, Job, JOB_QUEUED, JOB_RUNNING
+from src.components.instrumentation import ProgressSnapshot
 
 
 class Window(ABC):
@@ -185,6 +193,12 @@ class WindowRoot(Window):
 
     input_download_link = None
     input_download_link_error_label = None
+    download_progress_label = None
+    downloader: ComponentProcessorDownloader = None
+
+    jobs_status_label = None
+    jobs_progress_bar = None
+    jobs: JobRunner = None
 
     def render_menu(self) -> None:
         """
@@ -250,9 +264,15 @@ class WindowRoot(Window):
 
     def render_root(self) -> None:
         """
-        Calls functions to render all the sections.
+        Calls functions to render all the sections. Long running jobs are run in the background, their events are
+        polled on the window loop.
         @return: None.
         """
+        if self.jobs is None:
+            self.jobs = JobRunner()
+        self.jobs.start_polling(self.window)
+        self.window.protocol("WM_DELETE_WINDOW", self.on_root_close)
+
         self.render_root_section_backup_and_clean()
         self.render_root_section_download()
 
@@ -268,6 +288,8 @@ class WindowRoot(Window):
         2. | from input error                                                |
         3. | to input label   | to input   | back up button                  |
         4. | to input error                                                  |
+        5. | status of background jobs                                       |
+        6. | progress bar of the last reported job                           |
            |=================================================================|
 
         @return: None.
@@ -284,6 +306,8 @@ class WindowRoot(Window):
         frame.rowconfigure(2, weight=1)
         frame.rowconfigure(3, weight=1)
         frame.rowconfigure(4, weight=1)
+        frame.rowconfigure(5, weight=1)
+        frame.rowconfigure(6, weight=1)
 
         # row 0
         qe.create_label(
@@ -320,6 +344,14 @@ class WindowRoot(Window):
             frame, "", {"row": 4, "column": 1, 'sticky': 'nw', 'columnspan': 3}
         )  # error label
 
+        # row 5
+        self.jobs_status_label = qe.create_label(frame, "")
+        qe.show(self.jobs_status_label, {"row": 5, "column": 0, 'sticky': 'nw', 'columnspan': 3})
+
+        # row 6
+        self.jobs_progress_bar = Progressbar(frame, maximum=100)
+        self.jobs_progress_bar.grid(row=6, column=0, sticky='we', columnspan=3)
+
         frame.pack(fill='x', padx=10, pady=10)
 
     def render_root_section_download(self):
@@ -330,6 +362,7 @@ class WindowRoot(Window):
         0. | section label                                                   |
         1. | link input label      | link input | start button               |
         2. | link input validation                                           |
+        3. | download progress                  | cancel button              |
            |=================================================================|
 
         @return: None.
@@ -342,6 +375,8 @@ class WindowRoot(Window):
 
         frame_download.rowconfigure(0, weight=1)
         frame_download.rowconfigure(1, weight=1)
+        frame_download.rowconfigure(2, weight=1)
+        frame_download.rowconfigure(3, weight=1)
 
         # row 0
         qe.create_label(
@@ -364,22 +399,140 @@ class WindowRoot(Window):
             frame_download, "", {"row": 2, "column": 0, 'sticky': 'nw', 'columnspan': 3}
         )
 
+        # row 3
+        self.download_progress_label = qe.create_label(frame_download, "")
+        qe.show(self.download_progress_label, {"row": 3, "column": 0, 'sticky': 'nw', 'columnspan': 2})
+        button_cancel = Button(frame_download, text="Cancel", font=('Arial', 18), command=self.cancel_download)
+        button_cancel.grid(row=3, column=2, sticky='nw')
+
         frame_download.pack(fill='x', padx=10, pady=10)
 
     def clean_up_director(self) -> None:
-        pass  # TODO: implement
+        """
+        Validate path, remember it and plan clean up of its whole tree in the background. Unknown folders are reviewed
+        in a popup, all at once, before planned folders are deleted.
+        @return: None.
+        """
+        path_from_valid = validate_input(self.input_path_from, self.input_path_from_error_label, [
+            NotEmptyRule(), PathExistsRule()
+        ])
+        if not path_from_valid:
+            return
+
+        config.set(CONFIG_KEY_BACKUPPER_PATH_FROM, self.input_path_from.get())
+
+        cleaner, directory = ComponentProcessorCleaner(), self.input_path_from.get()
+        self.jobs.submit(
+            __('jobs.clean_plan'), lambda context: cleaner.plan(directory, context),
+            on_progress=self.on_job_event, on_complete=partial(self.review_clean_plan, cleaner),
+            on_error=self.on_job_event
+        )
+
+    def review_clean_plan(self, cleaner: ComponentProcessorCleaner, job: Job, plan: CleanPlan) -> None:
+        """
+        Called once clean up is planned, opens review of unknown folders (or applies the plan if there are none).
+        @param cleaner: processor that made the plan.
+        @param job: job of the planning.
+        @param plan: plan of the clean up.
+        @return: None.
+        """
+        self.on_job_event(job, plan)
+        if plan.to_review:
+            self.call_window(
+                WindowCleanReview, (plan, partial(self.apply_clean_plan, cleaner)), self.on_window_close
+            )
+        else:
+            self.apply_clean_plan(cleaner, plan)
+
+    def apply_clean_plan(self, cleaner: ComponentProcessorCleaner, plan: CleanPlan) -> None:
+        """
+        Close the review and delete planned folders in the background.
+        @param cleaner: processor that made the plan.
+        @param plan: reviewed plan.
+        @return: None.
+        """
+        if WindowCleanReview.__name__ in self.windows:
+            self.on_window_close(self.windows[WindowCleanReview.__name__])
+
+        self.submit_job(__('jobs.clean'), lambda context: cleaner.apply(plan, context))
 
     def backup_to_directory(self) -> None:
-        pass  # TODO: implement
+        """
+        Validate paths, remember them and start backup of every album in the background.
+        @return: None.
+        """
+        path_from_valid = validate_input(self.input_path_from, self.input_path_from_error_label, [
+            NotEmptyRule(), PathExistsRule()
+        ])
+        path_to_valid = validate_input(self.input_path_to, self.input_path_to_error_label, [NotEmptyRule()])
+        if not path_from_valid or not path_to_valid:
+            return
+
+        config.set(CONFIG_KEY_BACKUPPER_PATH_FROM, self.input_path_from.get())
+        config.set(CONFIG_KEY_BACKUPPER_PATH_TO, self.input_path_to.get())
+
+        backupper = ComponentProcessorBackupper(
+            root_dir=self.input_path_from.get(), copy_to_dir=self.input_path_to.get()
+        )
+        self.submit_job(__('jobs.backup'), backupper.process_library)
+
+    def submit_job(self, name: str, function: Callable, *args) -> Job:
+        """
+        Submit a job to background runner, its progress and result is shown in the jobs status label.
+        @param name: of the job, shown to the user.
+        @param function: to run, gets JobContext as first argument.
+        @param args: arguments of the function.
+        @return: submitted job.
+        """
+        return self.jobs.submit(
+            name, function, *args,
+            on_progress=self.on_job_event, on_complete=self.on_job_event, on_error=self.on_job_event
+        )
+
+    def on_job_event(self, job: Job, value: any) -> None:
+        """
+        Called on the window thread for every event of the jobs, shows status of all active jobs.
+        @param job: job the event belongs to.
+        @param value: progress, result or error of the job.
+        @return: None.
+        """
+        if isinstance(value, ProgressSnapshot):
+            self.jobs_progress_bar['value'] = value.percent
+
+        lines = [str(active) for active in self.jobs.active_jobs]
+        if job.state not in (JOB_QUEUED, JOB_RUNNING):
+            lines.append('%s: %s (%s)' % (job.name, job.state, value))
+
+        self.jobs_status_label.config(text='\n'.join(lines))
 
     def download_album(self) -> None:
         """
-        Create processor component, validate and process.
+        Create processor component (once, it keeps the download queue), validate and add links to the queue.
+        Downloads run in the background.
         @return: None.
         """
-        downloader = ComponentProcessorDownloader(
-            self.input_download_link, self.input_download_link_error_label, self
-        )
+        if self.downloader is None:
+            self.downloader = ComponentProcessorDownloader(
+                self.input_download_link, self.input_download_link_error_label, self, self.download_progress_label
+            )
+
+        if self.downloader.validate():
+            self.downloader.process()
 
-        if downloader.validate():
-            downloader.process()
+    def on_root_close(self) -> None:
+        """
+        Called when root window is closed. Background jobs and downloads are cancelled, so the process does not keep
+        running without a window, jobs stop at their next check_cancelled() call.
+        @return: None.
+        """
+        self.jobs.shutdown(wait=False)
+        self.cancel_download()
+        self.window.destroy()
+
+    def cancel_download(self) -> None:
+        """
+        Cancel all downloads that are queued or running.
+        @return: None.
+        """
+        if self.downloader is not None:
+            self.downloader.cancel()
@@ -1,7 +1,8 @@
 from abc import ABC, abstractmethod
-from tkinter import Toplevel, Frame, Entry, Button, END
+from tkinter import Toplevel, Frame, Entry, Button, Listbox, Scrollbar, END, MULTIPLE
 
 from src.providers.element import quick_element as qe, random_color
+from src.components.clean_plan import CleanPlan, CLEAN_DELETE, CLEAN_SKIP
 from src.components.filesystem_helper import MusicFileMetadata
 
 
@@ -123,3 +124,65 @@ class WindowMusicConfirm(WindowPopup):
         self.metadata.genre = self.input_genre.get()
 
         self.form_complete_callback(self.metadata)
+
+
+class WindowCleanReview(WindowPopup):
+    """
+    Class for popup window reviewing unknown folders of a clean plan, all of them at once.
+    """
+    window_title: str = 'clean_review_window.title'
+    window_geometry: str = '600x400'
+
+    plan: CleanPlan
+    listbox_folders: Listbox
+
+    form_complete_callback: type
+
+    def __init__(self, plan: CleanPlan, form_complete_callback: type):
+        """
+        Assigns values unique to this form, then calls to father to create a window with its geometry and calls for
+        render of main contents.
+        @param plan: plan with folders to review.
+        @param form_complete_callback: will be called with reviewed plan upon form submit.
+        """
+        self.plan = plan
+        self.form_complete_callback = form_complete_callback
+
+        super().__init__()
+
+    def render(self) -> None:
+        frame = Frame(self.window, bg=random_color())
+
+        frame.columnconfigure(0, weight=1)
+        frame.rowconfigure(1, weight=1)
+
+        qe.create_label(frame, 'clean_review_window.select', {'row': 0, 'column': 0, 'sticky': 'nw', 'columnspan': 2})
+
+        # list of unknown folders, selected ones are deleted
+        self.listbox_folders = Listbox(frame, selectmode=MULTIPLE, font=('Arial', 12))
+        for entry in self.plan.to_review:
+            self.listbox_folders.insert(END, '%s (%.1f MB)' % (entry.relative, entry.size / 1_000_000))
+        self.listbox_folders.grid(row=1, column=0, sticky='nsew')
+
+        scrollbar = Scrollbar(frame, command=self.listbox_folders.yview)
+        self.listbox_folders.config(yscrollcommand=scrollbar.set)
+        scrollbar.grid(row=1, column=1, sticky='ns')
+
+        # submit button
+        submit_btn = Button(frame, text="Clean up", font=('Arial', 18), command=self.submit)
+        submit_btn.grid(row=2, column=0, sticky='nw', columnspan=2)
+
+        frame.pack(fill='both', expand=True, padx=10, pady=10)
+
+    def submit(self):
+        """
+        Marks selected folders for deletion, keeps the rest and calls for complete callback.
+        @return: None.
+        """
+        entries = self.plan.to_review
+        selected = {entries[index].relative for index in self.listbox_folders.curselection()}
+
+        self.plan.decide(selected, CLEAN_DELETE)
+        self.plan.decide([entry.relative for entry in entries if entry.relative not in selected], CLEAN_SKIP)
+
+        self.form_complete_callback(self.plan)